@@ -0,0 +1,8 @@
+"""Benchmarks for the organizer.
+
+    python -m benchmarks.run --files 10000 --output results.json
+    python -m benchmarks.run --files 10000 --baseline results.json
+
+The trees used are synthetic (see benchmarks.generator), so runs at the
+same scale and seed are comparable across commits and machines.
+"""
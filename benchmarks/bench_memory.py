@@ -0,0 +1,98 @@
+"""Memory benchmark for the duplicate scan's per-file state (not part of benchmarks.run).
+
+    python -m benchmarks.bench_memory [--files N]
+
+Builds the state a scan keeps for N synthetic files, without touching
+the disk, and reports bytes per file measured with tracemalloc: for the
+ScanTable the scan uses, for the dict of Path -> os.stat_result it
+replaced, and the peak on top of the table while rows_by_size() sorts
+it. Hashing buffers and the duplicate groups found are not included;
+`benchmarks.run` measures a real scan end to end.
+"""
+import argparse
+import os
+import random
+import tracemalloc
+from pathlib import Path
+from organizer.scantable import ScanTable
+
+FILES_PER_DIR = 200
+STEMS = ['IMG_', 'scan', 'report', 'invoice-', 'download', 'Screenshot 2024-05-']
+EXTENSIONS = ['pdf', 'jpg', 'png', 'docx', 'zip', 'mp4', 'mp3', 'txt']
+
+
+def make_entries(count: int, seed: int = 0):
+    """(directory, name, stat) for count files spread over nested directories"""
+    rng = random.Random(seed)
+    entries = []
+    for i in range(count):
+        directory = f"/home/user/Downloads/archive/{i // FILES_PER_DIR // 50:04d}/{i // FILES_PER_DIR:06d}"
+        name = f"{rng.choice(STEMS)}{i}.{rng.choice(EXTENSIONS)}"
+        size = int(rng.lognormvariate(11, 2))
+        mtime_ns = 1_700_000_000_000_000_000 + rng.getrandbits(40)
+        stat = os.stat_result((0o100644, 1_000_000 + i, 2049, 1, 1000, 1000, size,
+                               mtime_ns / 1e9, mtime_ns / 1e9, mtime_ns / 1e9),
+                              {'st_atime_ns': mtime_ns, 'st_mtime_ns': mtime_ns,
+                               'st_ctime_ns': mtime_ns})
+        entries.append((directory, name, stat))
+    return entries
+
+
+def build_dict(entries):
+    return {Path(directory) / name: stat for directory, name, stat in entries}
+
+
+def build_table(entries):
+    table = ScanTable()
+    for directory, name, stat in entries:
+        table.add(table.intern_dir(directory), name, stat)
+    return table
+
+
+def measure(build, entries) -> float:
+    """Bytes per file retained by what build() returns"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        state = build(entries)
+        retained = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del state
+    return retained / len(entries)
+
+
+def measure_peak(work, count: int) -> float:
+    """Peak bytes per file allocated while work() runs, including its result"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        work()
+        peak = tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return peak / count
+
+
+def run(count: int = 200_000) -> dict:
+    entries = make_entries(count)
+    table = build_table(entries)
+    return {
+        'path_stat_dict': measure(build_dict, entries),
+        'scan_table': measure(build_table, entries),
+        'rows_by_size_peak': measure_peak(table.rows_by_size, count),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=200_000)
+    args = parser.parse_args()
+    results = run(args.files)
+    for name, per_file in results.items():
+        print(f"{name:28s} {per_file:8.1f} bytes/file"
+              f" ({per_file * 10_000_000 / 2 ** 30:.1f} GiB for 10M files)")
+
+
+if __name__ == '__main__':
+    main()
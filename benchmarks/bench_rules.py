@@ -0,0 +1,69 @@
+"""Microbenchmark for the compiled rule engine (not part of benchmarks.run).
+
+    python -m benchmarks.bench_rules [--names N]
+
+Reports names/sec for a typical mix of known extensions (the single
+dict lookup path) and for a mix that also hits compound extensions,
+unknown extensions and glob/regex rules.
+"""
+import argparse
+import random
+import time
+from organizer.rules import RuleEngine
+
+RULES = {
+    'Documents': ['pdf', 'doc', 'docx', 'txt', 'rtf', 'odt'],
+    'Images': ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'tiff', 'svg'],
+    'Archives': ['zip', 'tar', 'tar.gz', 'gz', 'rar', '7z', 'bz2'],
+    'Videos': ['mp4', 'mov', 'avi', 'mkv', 'wmv', 'flv'],
+    'Audio': ['mp3', 'wav', 'flac', 'aac', 'ogg'],
+    'Installers': {'patterns': ['*setup*.exe', '*.dmg', '*.msi']},
+    'Invoices': {'regex': [r'^invoice[-_]\d+']},
+    'Others': [],
+}
+
+COMMON = ['pdf', 'jpg', 'png', 'docx', 'zip', 'mp4', 'mp3', 'txt']
+MIXED = COMMON + ['tar.gz', 'exe', 'xyz', 'dmg', 'crx', '']
+
+
+def make_names(count: int, extensions, seed: int = 0):
+    rng = random.Random(seed)
+    names = []
+    for i in range(count):
+        ext = rng.choice(extensions)
+        stem = rng.choice(['scan', 'IMG_', 'report', 'invoice-', 'download', 'setup'])
+        names.append(f"{stem}{i}.{ext}" if ext else f"{stem}{i}")
+    return names
+
+
+def measure(func, names, repeat: int = 5) -> float:
+    """Best-of-repeat throughput in names per second"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(names)
+        best = min(best, time.perf_counter() - start)
+    return len(names) / best
+
+
+def run(count: int = 200_000) -> dict:
+    engine = RuleEngine(RULES)
+    results = {}
+    for label, extensions in (('common', COMMON), ('mixed', MIXED)):
+        names = make_names(count, extensions)
+        results[f'{label}_classify_names'] = measure(engine.classify_names, names)
+        results[f'{label}_classify_name'] = measure(
+            lambda ns: [engine.classify_name(n) for n in ns], names)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--names', type=int, default=200_000)
+    args = parser.parse_args()
+    for name, rate in run(args.names).items():
+        print(f"{name:28s} {rate / 1e6:6.2f} M names/sec")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Synthetic downloads-tree generator.
+
+File types, sizes and duplicate rates are drawn from rough distributions of
+a real Downloads folder: mostly small documents and images, a long tail of
+large archives and videos, and a share of byte-identical re-downloads.
+"""
+import math
+import os
+import random
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Tuple
+
+# extension -> (weight, median size in bytes)
+FILE_TYPES: Dict[str, Tuple[float, int]] = {
+    'pdf': (18, 400_000),
+    'docx': (6, 60_000),
+    'txt': (4, 4_000),
+    'jpg': (16, 2_500_000),
+    'png': (12, 300_000),
+    'gif': (2, 800_000),
+    'zip': (8, 20_000_000),
+    'tar.gz': (2, 40_000_000),
+    'dmg': (2, 150_000_000),
+    'exe': (3, 60_000_000),
+    'mp4': (4, 300_000_000),
+    'mov': (1, 500_000_000),
+    'mp3': (4, 6_000_000),
+    'csv': (5, 200_000),
+    'crdownload': (1, 50_000_000),
+    '': (2, 1_000_000),
+    'xyz': (2, 100_000),
+}
+
+STEMS = ['scan', 'report', 'invoice', 'IMG_', 'Screenshot ', 'download',
+         'setup', 'document', 'photo', 'statement', 'export']
+
+SIZE_SIGMA = 1.2
+
+
+class TreeInfo(NamedTuple):
+    root: Path
+    files: List[Path]
+    total_bytes: int
+    duplicates: int
+
+
+def _random_block(seed: int, size: int = 1 << 20) -> bytes:
+    rng = random.Random(seed)
+    return rng.getrandbits(size * 8).to_bytes(size, 'little')
+
+
+def generate_tree(root: Path, files: int = 1000, seed: int = 0,
+                  duplicate_rate: float = 0.1, size_scale: float = 0.0002,
+                  max_size: int = 8 << 20, depth: int = 0,
+                  files_per_dir: int = 500) -> TreeInfo:
+    """Create `files` files under root and return what was written.
+
+    Sizes are log-normal around each type's median, multiplied by
+    size_scale (so a 1M-file tree fits on a laptop) and capped at max_size.
+    With depth > 0 files are spread over nested subdirectories, otherwise
+    everything lands directly in root like a Downloads folder.
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    block = _random_block(seed)
+    extensions = list(FILE_TYPES)
+    weights = [FILE_TYPES[ext][0] for ext in extensions]
+
+    written: List[Path] = []
+    contents: List[Tuple[int, int]] = []  # (offset, size) used for each file
+    total = 0
+    duplicates = 0
+    for i in range(files):
+        ext = rng.choices(extensions, weights)[0]
+        directory = root
+        if depth:
+            bucket = i // files_per_dir
+            for level in range(depth):
+                directory = directory / f"d{level}_{bucket % (7 + level)}"
+            directory.mkdir(parents=True, exist_ok=True)
+
+        name = f"{rng.choice(STEMS)}{i}"
+        path = directory / (f"{name}.{ext}" if ext else name)
+
+        if contents and rng.random() < duplicate_rate:
+            offset, size = rng.choice(contents)
+            duplicates += 1
+        else:
+            median = FILE_TYPES[ext][1] * size_scale
+            size = int(min(max_size, rng.lognormvariate(math.log(max(median, 1)), SIZE_SIGMA)))
+            offset = i
+        _write(path, block, offset, size)
+        contents.append((offset, size))
+        written.append(path)
+        total += size
+    return TreeInfo(root, written, total, duplicates)
+
+
+def _write(path: Path, block: bytes, offset: int, size: int) -> None:
+    """Write size bytes that are unique to offset (the first 8 bytes say which)"""
+    with open(path, 'wb') as f:
+        header = offset.to_bytes(8, 'little')
+        f.write(header[:size])
+        remaining = size - len(header)
+        start = (offset * 4099) % len(block)
+        while remaining > 0:
+            chunk = block[start:start + remaining]
+            f.write(chunk)
+            remaining -= len(chunk)
+            start = 0
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate a synthetic downloads tree")
+    parser.add_argument('root')
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--duplicate-rate', type=float, default=0.1)
+    parser.add_argument('--size-scale', type=float, default=0.0002)
+    parser.add_argument('--depth', type=int, default=0)
+    args = parser.parse_args()
+    info = generate_tree(Path(args.root), args.files, args.seed, args.duplicate_rate,
+                         args.size_scale, depth=args.depth)
+    print(f"Wrote {len(info.files)} files ({info.total_bytes} bytes, "
+          f"{info.duplicates} duplicates) under {info.root}")
+
+
+if __name__ == '__main__':
+    main()
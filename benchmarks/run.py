@@ -0,0 +1,260 @@
+"""Run the organizer benchmark suite and store or compare results.
+
+    python -m benchmarks.run --files 10000 --output results.json
+    python -m benchmarks.run --files 10000 --baseline results.json --tolerance 0.15
+
+With --baseline the run exits non-zero if any metric regressed by more than
+the tolerance, so it can be used as a local gate before pushing.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List
+
+from organizer.categorizer import FileCategorizer
+from organizer.hasher import HashEngine
+from organizer.mover import FileMover
+from organizer.snapshot import DirectorySnapshot
+from organizer.watcher import FileWatcher
+from .generator import generate_tree
+
+RULES = {
+    'Documents': ['pdf', 'doc', 'docx', 'txt', 'rtf', 'odt', 'csv'],
+    'Images': ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'tiff', 'svg'],
+    'Archives': ['zip', 'tar', 'gz', 'tar.gz', 'rar', '7z', 'bz2'],
+    'Videos': ['mp4', 'mov', 'avi', 'mkv', 'wmv', 'flv'],
+    'Audio': ['mp3', 'wav', 'flac', 'aac', 'ogg'],
+    'Others': [],
+}
+
+Results = Dict[str, Dict[str, object]]
+
+
+def metric(value: float, unit: str, higher_is_better: bool) -> Dict[str, object]:
+    return {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the organizer's per-file log output while timing"""
+    logger = logging.getLogger('organizer')
+    level = logger.level
+    logger.setLevel(logging.CRITICAL)
+    try:
+        yield
+    finally:
+        logger.setLevel(level)
+
+
+def bench_categorize(files: List[Path]) -> Results:
+    categorizer = FileCategorizer(RULES)
+    calls = 0
+    start = time.perf_counter()
+    while calls < 200_000:
+        for path in files:
+            categorizer.categorize_file(path)
+        calls += len(files)
+    elapsed = time.perf_counter() - start
+    return {'categorize_file': metric(calls / elapsed, 'files/s', True)}
+
+
+def bench_hash(files: List[Path], total_bytes: int) -> Results:
+    categorizer = FileCategorizer(RULES)
+    start = time.perf_counter()
+    for path in files:
+        categorizer.get_file_hash(path)
+    elapsed = time.perf_counter() - start
+    return {'get_file_hash': metric(total_bytes / elapsed / 1e6, 'MB/s', True)}
+
+
+def bench_find_duplicates(root: Path, file_count: int, jobs: int) -> Results:
+    engine = HashEngine(jobs=jobs)
+    categorizer = FileCategorizer(RULES, hash_engine=engine)
+    start = time.perf_counter()
+    categorizer.find_duplicates_in_directory(root)
+    elapsed = time.perf_counter() - start
+    engine.close()
+    stats = categorizer.last_scan_stats
+    return {
+        'find_duplicates': metric(file_count / elapsed, 'files/s', True),
+        'find_duplicates_bytes_read': metric(
+            sum(stage['bytes_read'] for stage in stats.values()), 'bytes', False),
+    }
+
+
+def bench_scan_memory(root: Path, file_count: int, workdir: Path) -> Results:
+    """Peak memory of a duplicate scan, per file (includes the hashing buffers).
+
+    Measured without a snapshot and with a warm one, i.e. on the scan
+    after the one that filled it. SQLite's own page cache isn't traced.
+    """
+    results: Results = {}
+    snapshot_path = workdir / 'scan-snapshot.db'
+    for name, use_snapshot in (('find_duplicates_memory', False),
+                               ('find_duplicates_memory_snapshot', True)):
+        engine = HashEngine(jobs=1)
+        categorizer = FileCategorizer(RULES, hash_engine=engine)
+        snapshot = None
+        if use_snapshot:
+            snapshot = DirectorySnapshot(snapshot_path, categorizer.hash_algorithm)
+            categorizer.find_duplicates_in_directory(root, snapshot)
+        tracemalloc.start()
+        try:
+            for _group in categorizer.iter_duplicates(root, snapshot):
+                pass
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            engine.close()
+            if snapshot is not None:
+                snapshot.close()
+        results[name] = metric(peak / file_count, 'bytes/file', False)
+    return results
+
+
+def bench_organize_existing(workdir: Path, files: int, seed: int) -> Results:
+    source = workdir / 'organize-source'
+    target = workdir / 'organize-target'
+    info = generate_tree(source, files, seed)
+    watcher = FileWatcher(source, FileCategorizer(RULES), FileMover(target))
+    with quiet():
+        start = time.perf_counter()
+        watcher.organize_existing_files()
+        elapsed = time.perf_counter() - start
+    return {'organize_existing_files': metric(len(info.files) / elapsed, 'files/s', True)}
+
+
+def bench_watcher_latency(workdir: Path, files: int, settle_time: float) -> Results:
+    source = workdir / 'watch-source'
+    target = workdir / 'watch-target'
+    source.mkdir()
+    watcher = FileWatcher(source, FileCategorizer(RULES), FileMover(target),
+                          handle_duplicates=False, settle_time=settle_time)
+    handler = watcher.event_handler
+    latencies = []
+    with quiet():
+        handler.queue.start()
+        watcher.observer.schedule(handler, str(source), recursive=False)
+        watcher.observer.start()
+        try:
+            created = {}
+            for i in range(files):
+                path = source / f"incoming{i}.pdf"
+                path.write_bytes(os.urandom(4096))
+                created[path] = time.perf_counter()
+            deadline = time.perf_counter() + 30 + settle_time * 4
+            while created and time.perf_counter() < deadline:
+                now = time.perf_counter()
+                for path in [p for p in created if not p.exists()]:
+                    latencies.append(now - created.pop(path))
+                time.sleep(0.002)
+        finally:
+            watcher.observer.stop()
+            watcher.observer.join()
+            handler.queue.stop()
+    if not latencies:
+        return {}
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return {
+        'watcher_latency_p50': metric(statistics.median(latencies) * 1000, 'ms', False),
+        'watcher_latency_p95': metric(p95 * 1000, 'ms', False),
+    }
+
+
+def run(files: int, seed: int = 0, jobs: int = 0, latency_files: int = 100,
+        settle_time: float = 0.2) -> Results:
+    results: Results = {}
+    with tempfile.TemporaryDirectory(prefix='organizer-bench-') as tmp:
+        workdir = Path(tmp)
+        info = generate_tree(workdir / 'tree', files, seed, depth=2)
+        results.update(bench_categorize(info.files))
+        results.update(bench_hash(info.files, info.total_bytes))
+        results.update(bench_find_duplicates(info.root, len(info.files), jobs or None))
+        results.update(bench_scan_memory(info.root, len(info.files), workdir))
+        results.update(bench_organize_existing(workdir, files, seed + 1))
+        results.update(bench_watcher_latency(workdir, min(files, latency_files), settle_time))
+    return results
+
+
+def compare(current: Results, baseline: Results, tolerance: float) -> List[str]:
+    """Describe every metric that is worse than baseline by more than tolerance"""
+    regressions = []
+    for name, base in baseline.items():
+        if name not in current:
+            continue
+        old, new = base['value'], current[name]['value']
+        if not old:
+            continue
+        change = (new - old) / old
+        worse = -change if base['higher_is_better'] else change
+        if worse > tolerance:
+            regressions.append(f"{name}: {old:.4g} -> {new:.4g} {base['unit']} "
+                               f"({worse:.0%} worse)")
+    return regressions
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the organizer benchmarks")
+    parser.add_argument('--files', type=int, default=10_000,
+                        help='Files in the synthetic tree (1000 to 1000000)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--jobs', type=int, default=0, help='Hash workers (default: CPU count)')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against a previous results file')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='Allowed relative slowdown before failing (default 0.10)')
+    args = parser.parse_args(argv)
+
+    results = run(args.files, args.seed, args.jobs)
+    for name, result in results.items():
+        print(f"{name:28s} {result['value']:14.2f} {result['unit']}")
+
+    document = {
+        'meta': {
+            'files': args.files,
+            'seed': args.seed,
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(document, indent=2))
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline['meta'].get('files') != args.files:
+            print(f"Warning: baseline was run with {baseline['meta'].get('files')} files")
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Set, Union
+from watchdog.observers import Observer
+from .categorizer import FileCategorizer
+from .events import Processor, is_partial_download
+from .metrics import registry as metrics
+from .mover import FileMover
+from .seen import SeenFiles
+from .watcher import FileOrganizerHandler, OrganizeResult
+
+logger = logging.getLogger(__name__)
+
+
+class _LoopBridge:
+    """Stands in for a handler's EventQueue, passing watchdog events to the event loop"""
+
+    def __init__(self, organizer: "AsyncOrganizer"):
+        self.organizer = organizer
+
+    def put(self, file_path: Path, process: Optional[Processor] = None) -> bool:
+        metrics.inc('events_total')
+        if is_partial_download(file_path):
+            metrics.inc('events_ignored_total')
+            return False
+        try:
+            self.organizer._loop.call_soon_threadsafe(self.organizer._debounce,
+                                                      file_path, process)
+        except RuntimeError:  # the loop has been closed
+            return False
+        return True
+
+
+class AsyncOrganizer:
+    """Organize files from asyncio code.
+
+    Files go through the same handler as the watcher's, run on a fixed
+    pool of worker threads, so any number of concurrent intakes share
+    `workers` threads; waiting callers are just suspended coroutines.
+
+    organize() handles one file and returns its OrganizeResult. submit()
+    and watch() feed the results() stream instead (also `async for`),
+    which has one consumer. At most max_pending submitted files are in
+    flight or waiting to be read at a time; beyond that submit() waits,
+    so a slow consumer slows intake down rather than letting results
+    pile up. Watched files are submitted once no event has been seen for
+    them for settle_time seconds.
+    """
+
+    def __init__(self, categorizer: FileCategorizer, mover: FileMover,
+                 handle_duplicates: bool = True, workers: int = 4,
+                 settle_time: float = 1.0, max_pending: int = 1000,
+                 seen: Optional[SeenFiles] = None, duplicate_strategy: str = "rename",
+                 verify_duplicates: bool = False):
+        self.settle_time = settle_time
+        self.max_pending = max(1, max_pending)
+        self._bridge = _LoopBridge(self)
+        self.handler = FileOrganizerHandler(
+            categorizer, mover, handle_duplicates, workers, settle_time, max_pending, seen,
+            queue=self._bridge, duplicate_strategy=duplicate_strategy,
+            verify_duplicates=verify_duplicates
+        )
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers),
+                                            thread_name_prefix="organizer-async")
+        # Created on first use, inside the running loop (Python < 3.10 binds them early)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._results: Optional["asyncio.Queue[Optional[OrganizeResult]]"] = None
+        self._timers: Dict[Path, asyncio.TimerHandle] = {}
+        # Watched files waiting for a slot, and files being processed
+        self._waiting: Set[asyncio.Task] = set()
+        self._running: Set[asyncio.Task] = set()
+        self._observer: Optional[Observer] = None
+        self._closed = False
+
+    async def __aenter__(self) -> "AsyncOrganizer":
+        self._bind()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def __aiter__(self) -> AsyncIterator[OrganizeResult]:
+        return self.results()
+
+    async def organize(self, file_path: Union[str, Path]) -> OrganizeResult:
+        """Organize one file and return what happened to it"""
+        loop = self._bind()
+        self._check_open()
+        async with self._slots:
+            return await loop.run_in_executor(self._executor, self.handler.process_file,
+                                              Path(file_path))
+
+    async def submit(self, file_path: Union[str, Path]) -> None:
+        """Queue a file for results(), waiting while max_pending are already queued"""
+        self._bind()
+        self._check_open()
+        await self._submit(Path(file_path), self.handler.process_file)
+
+    def watch(self, directory: Union[str, Path], recursive: bool = False) -> None:
+        """Organize files that appear in directory from now on"""
+        self._bind()
+        self._check_open()
+        first = self.handler
+        handler = FileOrganizerHandler(
+            first.categorizer, first.mover, first.handle_duplicates,
+            seen=first.processed_files, queue=self._bridge, recursive=recursive,
+            duplicate_strategy=first.duplicate_strategy,
+            verify_duplicates=first.verify_duplicates
+        )
+        if self._observer is None:
+            self._observer = Observer()
+            self._observer.start()
+        self._observer.schedule(handler, str(directory), recursive=recursive)
+        logger.info("Started watching: %s%s", directory, " (recursive)" if recursive else "")
+
+    async def results(self) -> AsyncIterator[OrganizeResult]:
+        """Results of submitted and watched files as they finish; ends after close()"""
+        self._bind()
+        while True:
+            result = await self._results.get()
+            if result is None:
+                return
+            self._slots.release()
+            yield result
+
+    async def close(self) -> None:
+        """Stop watching, finish the files being processed and end results()"""
+        if self._closed:
+            return
+        self._closed = True
+        loop = self._bind()
+        if self._observer is not None:
+            self._observer.stop()
+            await loop.run_in_executor(None, self._observer.join)
+            self._observer = None
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        # Watched files that haven't started yet are picked up by the next catch-up
+        for task in self._waiting:
+            task.cancel()
+        while self._waiting or self._running:
+            await asyncio.gather(*self._waiting, *self._running, return_exceptions=True)
+        self._executor.shutdown(wait=False)
+        self._results.put_nowait(None)
+
+    def _bind(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._slots = asyncio.Semaphore(self.max_pending)
+            self._results = asyncio.Queue()
+        return self._loop
+
+    def _check_open(self) -> None:
+        if self._closed:
+            raise RuntimeError("AsyncOrganizer is closed")
+
+    async def _submit(self, file_path: Path, process: Processor) -> None:
+        # The slot is given back when results() hands the result out
+        await self._slots.acquire()
+        self._track(self._running, self._process(file_path, process))
+
+    async def _process(self, file_path: Path, process: Processor) -> None:
+        try:
+            result = await self._loop.run_in_executor(self._executor, process, file_path)
+        except Exception as e:
+            logger.exception("Error processing file %s: %s", file_path, e)
+            result = OrganizeResult(file_path, "failed")
+        self._results.put_nowait(result)
+
+    def _debounce(self, file_path: Path, process: Optional[Processor]) -> None:
+        """Called on the loop for every event: (re)start the path's settle timer"""
+        timer = self._timers.pop(file_path, None)
+        if timer is not None:
+            timer.cancel()
+            metrics.inc('events_merged_total')
+        if self._closed:
+            return
+        self._timers[file_path] = self._loop.call_later(
+            self.settle_time, self._settled, file_path, process or self.handler.process_file)
+
+    def _settled(self, file_path: Path, process: Processor) -> None:
+        del self._timers[file_path]
+        self._track(self._waiting, self._submit(file_path, process))
+
+    def _track(self, tasks: Set[asyncio.Task], coroutine) -> None:
+        task = self._loop.create_task(coroutine)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
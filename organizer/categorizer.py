@@ -1,37 +1,74 @@
-import hashlib
 import os
+import logging
+from array import array
+from collections import Counter
+from itertools import groupby
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from stat import S_ISREG
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
 from datetime import datetime
+from .hasher import DEFAULT_HASH_ALGORITHM, PARTIAL_HASH_SIZE, HashEngine
+from .rules import RuleEngine
+from .scantable import ScanTable
+from .shards import ShardWriter
+from .similar import DEFAULT_MAX_DISTANCE, SimilarGroup, group_similar, hash_images
+from .sniffer import MagicDetector
+from .snapshot import LOOKUP_BATCH, DirectorySnapshot
+
+logger = logging.getLogger(__name__)
+
+class DuplicateGroup(NamedTuple):
+    size: int
+    digest: str
+    paths: List[Path]
 
 class FileCategorizer:
-    def __init__(self, rules: Dict[str, List[str]]):
+    def __init__(self, rules: Dict[str, Union[List[str], Dict]],
+                 hash_algorithm: str = DEFAULT_HASH_ALGORITHM,
+                 hash_engine: Optional[HashEngine] = None,
+                 detector: Optional[MagicDetector] = None):
         self.rules = rules
+        self.detector = detector
+        self.hash_engine = hash_engine or HashEngine(hash_algorithm, jobs=1)
+        self.hash_algorithm = self.hash_engine.algorithm
+        self.last_scan_stats: Dict[str, Dict[str, int]] = {}
         self._build_extension_map()
     
     def _build_extension_map(self) -> None:
-        """Build reverse mapping from extension to category"""
-        self.extension_to_category = {}
-        for category, extensions in self.rules.items():
-            for ext in extensions:
-                self.extension_to_category[ext.lower()] = category
+        """Compile the rules and build the mapping from extension to category"""
+        self.rule_engine = RuleEngine(self.rules)
+        self.extension_to_category = {
+            ext: self.rule_engine.rules[index].category
+            for ext, index in self.rule_engine.extension_map.items()
+        }
     
-    def categorize_file(self, file_path: Path) -> str:
-        """Determine the category of a file based on its extension"""
-        extension = file_path.suffix.lower().lstrip('.')
-        return self.extension_to_category.get(extension, 'Others')
+    def categorize_file(self, file_path: Path, stat: Optional[os.stat_result] = None) -> str:
+        """Determine the category of a file from the first matching rule.
+        
+        Pass stat if it is already at hand; otherwise the file is only
+        stat'ed when a size or age rule needs it. If no rule matches and a
+        content detector is configured, the file's first few KiB decide.
+        """
+        category = self.rule_engine.classify(file_path, stat)
+        if category != self.rule_engine.default or self.detector is None:
+            return category
+        
+        detected = self.detector.detect(file_path, stat)
+        if detected is None:
+            return category
+        return self.rule_engine.classify_name(f"{file_path.stem}.{detected}", file_path, stat)
     
-    def get_file_hash(self, file_path: Path, chunk_size: int = 8192) -> str:
-        """Calculate MD5 hash of file for duplicate detection"""
-        hash_md5 = hashlib.md5()
-        try:
-            with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(chunk_size), b""):
-                    hash_md5.update(chunk)
-            return hash_md5.hexdigest()
-        except (IOError, OSError) as e:
-            print(f"Error reading file {file_path}: {e}")
-            return ""
+    def get_file_hash(self, file_path: Path) -> str:
+        """Calculate content hash of file for duplicate detection"""
+        return self.hash_engine.hash_file(file_path)[0]
+    
+    def get_partial_hash(self, file_path: Path, edge_size: int = PARTIAL_HASH_SIZE) -> str:
+        """Hash only the first and last edge_size bytes of a file.
+        
+        Files no larger than 2 * edge_size are read whole, so for them the
+        result equals get_file_hash().
+        """
+        return self.hash_engine.hash_file(file_path, edge_size)[0]
     
     def get_file_metadata(self, file_path: Path) -> Dict:
         """Get file metadata for comparison"""
@@ -45,7 +82,7 @@ class FileCategorizer:
                 'extension': file_path.suffix.lower()
             }
         except (IOError, OSError) as e:
-            print(f"Error getting metadata for {file_path}: {e}")
+            logger.warning("Error getting metadata for %s: %s", file_path, e)
             return {}
     
     def is_duplicate(self, file1_path: Path, file2_path: Path) -> bool:
@@ -63,23 +100,232 @@ class FileCategorizer:
         
         return hash1 == hash2 and hash1 != ""
     
-    def find_duplicates_in_directory(self, directory: Path) -> List[List[Path]]:
-        """Find all duplicate files in a directory"""
-        file_hashes = {}
-        duplicates = []
+    def find_duplicates_in_directory(self, directory: Path,
+                                     snapshot: Optional[DirectorySnapshot] = None
+                                     ) -> List[List[Path]]:
+        """Find all duplicate files in a directory, as lists of paths"""
+        return [group.paths for group in self.iter_duplicates(directory, snapshot)]
+    
+    def iter_duplicates(self, directory: Path,
+                        snapshot: Optional[DirectorySnapshot] = None
+                        ) -> Iterator[DuplicateGroup]:
+        """Yield each group of identical files in a directory once it is confirmed.
+        
+        Runs in three stages so most files are never read in full:
+        group by size, then hash the first and last few KB of each file
+        in a shared size, then fully hash whatever still collides. A group
+        is yielded as soon as the last file that could belong to it has
+        been hashed, with the size and digest found along the way.
+        With a snapshot, unchanged directories aren't listed again and
+        digests of unchanged files are reused instead of re-read.
+        Per-stage file, byte and reused-digest counts are left in
+        last_scan_stats.
+        """
+        stats = {stage: {'files': 0, 'bytes_read': 0, 'cached': 0}
+                 for stage in ('size', 'partial', 'full')}
+        self.last_scan_stats = stats
+        try:
+            # Stage 1: list every file into a compact table and keep the
+            # rows whose size is shared, in size order
+            table = self._scan_table(directory, snapshot)
+            stats['size']['files'] = len(table)
+            sizes = table.sizes
+            candidates = array('I')
+            remaining: Counter = Counter()
+            for size, rows in groupby(table.rows_by_size(), key=sizes.__getitem__):
+                count = len(candidates)
+                candidates.extend(rows)
+                if len(candidates) - count > 1:
+                    remaining[size] = len(candidates) - count
+                else:
+                    del candidates[count:]
+            
+            # Stage 2: hash the edges of each file that shares its size.
+            # Results arrive in completion order; a size's groups are yielded
+            # as soon as the last file of that size has been hashed.
+            by_partial: Dict[int, Dict[bytes, array]] = {}
+            # Rows needing a full hash, each with the number of its group
+            needs_full = array('I')
+            full_groups = array('I')
+            full_remaining: List[int] = []
+            for i, digest in self._table_digests(table, candidates, PARTIAL_HASH_SIZE, 'partial',
+                                                 snapshot, stats['partial']):
+                row = candidates[i]
+                size = sizes[row]
+                groups = by_partial.setdefault(size, {})
+                if digest:
+                    groups.setdefault(digest, array('I')).append(row)
+                remaining[size] -= 1
+                if remaining[size]:
+                    continue
+                del remaining[size]
+                for digest, rows in by_partial.pop(size).items():
+                    if len(rows) < 2:
+                        continue
+                    if size <= 2 * PARTIAL_HASH_SIZE:
+                        # The edges covered the whole file: this is the full digest
+                        yield DuplicateGroup(size, digest.hex(), [table.full_path(r) for r in rows])
+                    else:
+                        needs_full.extend(rows)
+                        full_groups.extend(array('I', [len(full_remaining)]) * len(rows))
+                        full_remaining.append(len(rows))
+            del candidates
+            
+            # Stage 3: full hash, only needed where the edges didn't cover the file
+            by_full: Dict[int, Dict[bytes, array]] = {}
+            for i, digest in self._table_digests(table, needs_full, None, 'digest',
+                                                 snapshot, stats['full']):
+                group = full_groups[i]
+                groups = by_full.setdefault(group, {})
+                if digest:
+                    groups.setdefault(digest, array('I')).append(needs_full[i])
+                full_remaining[group] -= 1
+                if full_remaining[group]:
+                    continue
+                for digest, rows in by_full.pop(group).items():
+                    if len(rows) > 1:
+                        yield DuplicateGroup(sizes[rows[0]], digest.hex(),
+                                             [table.full_path(r) for r in rows])
+        finally:
+            if snapshot is not None:
+                snapshot.save()
+    
+    def write_shard(self, directory: Path, shard_path: Path,
+                    snapshot: Optional[DirectorySnapshot] = None) -> int:
+        """Hash every file under directory into a shard file for merge_shards().
+        
+        Shards of different roots are written independently (by separate
+        processes or machines) and merged later, so no file can be ruled
+        out by size here: every file is hashed in full, except where the
+        snapshot still holds its digest. Returns the number of files
+        recorded; per-stage counts are left in last_scan_stats.
+        """
+        stats = {stage: {'files': 0, 'bytes_read': 0, 'cached': 0}
+                 for stage in ('size', 'full')}
+        self.last_scan_stats = stats
+        # Absolute paths, since the shard is merged from wherever
+        directory = Path(os.path.abspath(directory))
+        writer = ShardWriter(shard_path, self.hash_algorithm, directory)
+        try:
+            table = self._scan_table(directory, snapshot)
+            stats['size']['files'] = len(table)
+            rows = range(len(table))
+            for row, digest in self._table_digests(table, rows, None, 'digest',
+                                                   snapshot, stats['full']):
+                if digest:
+                    writer.add(table.sizes[row], digest, table.path(row))
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+        finally:
+            if snapshot is not None:
+                snapshot.save()
+        return writer.count
+    
+    def find_similar_images(self, directory: Path,
+                            snapshot: Optional[DirectorySnapshot] = None,
+                            method: str = "dhash",
+                            max_distance: int = DEFAULT_MAX_DISTANCE,
+                            category: str = "Images") -> List[SimilarGroup]:
+        """Find groups of visually similar images (resized, re-encoded, ...).
         
-        for file_path in directory.rglob('*'):
-            if file_path.is_file():
-                file_hash = self.get_file_hash(file_path)
-                if file_hash:
-                    if file_hash in file_hashes:
-                        file_hashes[file_hash].append(file_path)
+        Files this categorizer puts in category get a perceptual hash
+        (dhash or phash, needs Pillow), and images whose hashes differ in
+        at most max_distance of 64 bits are grouped. With a snapshot kept
+        for this method, hashes of unchanged files are reused. Image counts
+        are left in last_scan_stats.
+        """
+        stats = {'files': 0, 'cached': 0, 'failed': 0}
+        self.last_scan_stats = {'images': stats}
+        try:
+            images = ((file_path, stat) for file_path, stat in self._walk_files(directory, snapshot)
+                      if self.categorize_file(file_path, stat) == category)
+            hashes = list(hash_images(images, method, snapshot, self.hash_engine.jobs, stats))
+        finally:
+            if snapshot is not None:
+                snapshot.save()
+        return group_similar(hashes, max_distance)
+    
+    def _walk_files(self, directory: Path, snapshot: Optional[DirectorySnapshot]
+                    ) -> Iterator[Tuple[Path, os.stat_result]]:
+        """Every regular file under directory with its stat"""
+        if snapshot is not None:
+            for file_path, stat, _changed in snapshot.walk(directory):
+                yield file_path, stat
+            return
+        for root, _dirs, files in os.walk(directory):
+            for name in files:
+                file_path = Path(root) / name
+                try:
+                    if not file_path.is_file():
+                        continue
+                    stat = file_path.stat()
+                except (IOError, OSError):
+                    continue
+                yield file_path, stat
+    
+    def _scan_table(self, directory: Path,
+                    snapshot: Optional[DirectorySnapshot]) -> ScanTable:
+        """Every regular file under directory, in a compact table"""
+        table = ScanTable()
+        if snapshot is not None:
+            for file_path, stat, _changed in snapshot.walk(directory):
+                table.add(table.intern_dir(str(file_path.parent)), file_path.name, stat)
+            return table
+        for root, _dirs, files in os.walk(directory):
+            dir_id = None
+            for name in files:
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except (IOError, OSError):
+                    continue
+                if not S_ISREG(stat.st_mode):
+                    continue
+                if dir_id is None:
+                    dir_id = table.intern_dir(root)
+                table.add(dir_id, name, stat)
+        return table
+    
+    def _table_digests(self, table: ScanTable, rows: Sequence[int],
+                       edge_size: Optional[int], field: str,
+                       snapshot: Optional[DirectorySnapshot],
+                       stage: Dict[str, int]) -> Iterator[Tuple[int, bytes]]:
+        """Yield (i, raw digest) for the file in each rows[i], as hashes complete.
+        
+        Digests the snapshot still trusts are reused; unreadable files are
+        yielded with an empty digest.
+        """
+        if snapshot is None:
+            to_hash = array('I', range(len(rows)))
+        else:
+            to_hash = array('I')
+            for start in range(0, len(rows), LOOKUP_BATCH):
+                batch = range(start, min(start + LOOKUP_BATCH, len(rows)))
+                states = snapshot.get_many([(table.path(rows[i]), table.record(rows[i]))
+                                            for i in batch])
+                for i, state in zip(batch, states):
+                    digest = getattr(state, field) if state is not None else None
+                    if digest:
+                        stage['files'] += 1
+                        stage['cached'] += 1
+                        yield i, bytes.fromhex(digest)
                     else:
-                        file_hashes[file_hash] = [file_path]
+                        to_hash.append(i)
+        
+        # Only the paths being hashed right now are held as strings
+        in_flight: Dict[str, int] = {}
         
-        # Return groups of duplicate files
-        for file_list in file_hashes.values():
-            if len(file_list) > 1:
-                duplicates.append(file_list)
+        def paths() -> Iterator[str]:
+            for i in to_hash:
+                file_path = table.path(rows[i])
+                in_flight[file_path] = i
+                yield file_path
         
-        return duplicates
\ No newline at end of file
+        for file_path, digest, bytes_read in self.hash_engine.hash_files(paths(), edge_size):
+            i = in_flight.pop(file_path)
+            stage['files'] += 1
+            stage['bytes_read'] += bytes_read
+            if digest and snapshot is not None:
+                snapshot.update(file_path, table.record(rows[i]), **{field: digest})
+            yield i, bytes.fromhex(digest)
@@ -1,88 +1,489 @@
 import click
+import json
+import os
 from pathlib import Path
 from .config import ConfigManager
-from .categorizer import FileCategorizer
-from .mover import FileMover
-from .watcher import FileWatcher
+from .log import configure_logging
+
+# Commands import what they need (watchdog, sqlite3, hashing, ...) when
+# they run, so short commands like `organizer config` start quickly.
+
+def _load_config():
+    """The ConfigManager, or None after reporting an invalid config"""
+    try:
+        return ConfigManager()
+    except ValueError as e:
+        click.echo(f"Error: {e}")
+        return None
+
+def _io_scheduler(settings):
+    """The shared I/O scheduler for io_bytes_per_second / io_pressure_threshold"""
+    from .iosched import DEFAULT_PRESSURE_THRESHOLD, IOScheduler
+    from .rules import parse_size
+    return IOScheduler(parse_size(settings.get('io_bytes_per_second')),
+                       settings.get('io_pressure_threshold', DEFAULT_PRESSURE_THRESHOLD))
+
+def _echo_groups(groups, algorithm, jsonl):
+    """Print duplicate groups as they arrive, returning how many there were"""
+    found = 0
+    for group in groups:
+        found += 1
+        if jsonl:
+            click.echo(json.dumps({'size': group.size, 'algorithm': algorithm,
+                                   'digest': group.digest,
+                                   'paths': [str(path) for path in group.paths]}))
+            continue
+        click.echo(f"\nGroup {found}:")
+        for file_path in group.paths:
+            click.echo(f"  - {file_path} ({group.size} bytes)")
+    return found
+
+def _echo_found(found, jsonl):
+    if not found:
+        click.echo("No duplicates found!", err=jsonl)
+    else:
+        click.echo(f"\nFound {found} groups of duplicate files", err=jsonl)
 
 @click.group()
-def cli():
+@click.option('--log-level', '-l', default='INFO', show_default=True,
+              type=click.Choice(['DEBUG', 'INFO', 'WARNING', 'ERROR'], case_sensitive=False),
+              help='Minimum level of log messages')
+@click.option('--log-format', default='text', show_default=True,
+              type=click.Choice(['text', 'json']), help='Log as plain text or JSON lines')
+@click.option('--verbose', '-v', is_flag=True, help='Shorthand for --log-level DEBUG')
+def cli(log_level, log_format, verbose):
     """Downloads Organizer - Automated file organization tool"""
-    pass
+    configure_logging('DEBUG' if verbose else log_level, log_format)
 
 @cli.command()
 @click.option('--source', '-s', help='Source directory to organize')
 @click.option('--target', '-t', help='Target directory for organized files')
 @click.option('--watch', '-w', is_flag=True, help='Enable watch mode')
 @click.option('--existing', '-e', is_flag=True, help='Organize existing files')
-def organize(source, target, watch, existing):
+@click.option('--dry-run', '-n', is_flag=True, help='Print the move plan for --existing without moving anything')
+@click.option('--metrics-port', type=int, help='Serve Prometheus metrics on this local port while watching')
+@click.option('--stats-file', type=click.Path(dir_okay=False), help='Periodically write metrics as JSON to this file')
+def organize(source, target, watch, existing, dry_run, metrics_port, stats_file):
     """Organize files in the specified directory"""
+    from .categorizer import FileCategorizer
+    from .hasher import DEFAULT_HASH_ALGORITHM, HashEngine
+    from .index import DuplicateIndex
+    from .journal import KEEP_RUNS, default_journal_dir
+    from .metrics import MetricsExporter
+    from .mover import FileMover
+    from .rules import parse_size
+    from .seen import DEFAULT_TTL, SeenFiles
+    from .sniffer import MagicDetector
+    from .snapshot import DirectorySnapshot, default_snapshot_path
+    from .watcher import FileWatcher
     
     # Load configuration
-    config_manager = ConfigManager()
+    config_manager = _load_config()
+    if config_manager is None:
+        return
     settings = config_manager.get_settings()
-    rules = config_manager.get_file_rules()
     
     # Use command line args or fall back to config
-    source_dir = Path(source) if source else Path(settings['source_dir'])
-    target_dir = Path(target) if target else Path(settings['target_dir'])
+    if source:
+        default_target = Path(os.path.expanduser(target or settings['target_dir']))
+        sources = [{'path': Path(source), 'target': default_target,
+                    'rules': config_manager.get_file_rules(), 'recursive': False}]
+    else:
+        try:
+            sources = config_manager.get_sources(target)
+        except ValueError as e:
+            click.echo(f"Error: {e}")
+            return
+    
+    for spec in sources:
+        if not spec['path'].exists():
+            click.echo(f"Error: Source directory {spec['path']} does not exist")
+            return
     
-    if not source_dir.exists():
-        click.echo(f"Error: Source directory {source_dir} does not exist")
+    # Initialize components, shared between sources where they agree
+    try:
+        scheduler = _io_scheduler(settings)
+        hash_engine = HashEngine(settings.get('hash_algorithm', DEFAULT_HASH_ALGORITHM),
+                                 settings.get('hash_jobs'), scheduler=scheduler)
+    except ValueError as e:
+        click.echo(f"Error: {e}")
         return
+    try:
+        detector = MagicDetector() if settings.get('sniff_content', False) else None
+        categorizers = {}
+        movers = {}
+        for spec in sources:
+            if id(spec['rules']) not in categorizers:
+                categorizers[id(spec['rules'])] = FileCategorizer(
+                    spec['rules'], hash_engine=hash_engine, detector=detector)
+            categorizer = categorizers[id(spec['rules'])]
+            target_dir = spec['target']
+            if target_dir not in movers:
+                index = None
+                if settings.get('handle_duplicates', True):
+                    index = DuplicateIndex.for_target(target_dir, categorizer.get_file_hash,
+                                                      categorizer.hash_algorithm)
+                    index.sync(target_dir)
+                movers[target_dir] = FileMover(target_dir, settings.get('create_date_folders', False),
+                                               index, settings.get('verify_copies', False),
+                                               scheduler)
+            spec['categorizer'] = categorizer
+            spec['mover'] = movers[target_dir]
     
-    # Initialize components
-    categorizer = FileCategorizer(rules)
-    mover = FileMover(target_dir, settings.get('create_date_folders', False))
+        first = sources[0]
+        watcher = FileWatcher(first['path'], first['categorizer'], first['mover'],
+                              settings.get('handle_duplicates', True),
+                              settings.get('workers', 4),
+                              settings.get('settle_time', 1.0),
+                              settings.get('max_pending', 1000),
+                              SeenFiles.for_memory(parse_size(settings.get('seen_files_memory', '8MiB')),
+                                                   settings.get('seen_files_ttl', DEFAULT_TTL)),
+                              first['recursive'],
+                              DirectorySnapshot(default_snapshot_path('organize', settings.get('snapshot_dir')))
+                              if settings.get('snapshot', True) else None,
+                              settings.get('duplicate_strategy', 'rename'),
+                              settings.get('verify_duplicates', False))
+        for spec in sources[1:]:
+            watcher.add_source(spec['path'], spec['categorizer'], spec['mover'], spec['recursive'])
     
-    if existing:
-        # Organize existing files
-        watcher = FileWatcher(source_dir, categorizer, mover, 
-                            settings.get('handle_duplicates', True))
-        watcher.organize_existing_files()
+        if existing:
+            # Organize existing files
+            journal_dir = None
+            if settings.get('journal', True):
+                journal_dir = default_journal_dir(settings.get('snapshot_dir'))
+            plan = watcher.organize_existing_files(dry_run, settings.get('workers', 4), journal_dir,
+                                                   settings.get('journal_keep_runs', KEEP_RUNS))
+            if dry_run:
+                for move in plan:
+                    click.echo(f"Would move: {move.source} -> {move.target}")
+                click.echo(f"Planned {len(plan)} moves")
+                return
     
-    if watch or settings.get('watch_mode', True):
-        # Start watching for new files
-        watcher = FileWatcher(source_dir, categorizer, mover,
-                            settings.get('handle_duplicates', True))
-        click.echo("Starting file watcher... Press Ctrl+C to stop")
-        watcher.start_watching()
+        if watch or settings.get('watch_mode', True):
+            # Start watching for new files
+            metrics_port = metrics_port if metrics_port is not None else settings.get('metrics_port')
+            stats_file = stats_file or settings.get('stats_file')
+            exporter = None
+            if metrics_port is not None or stats_file:
+                exporter = MetricsExporter(port=metrics_port, stats_file=stats_file,
+                                           interval=settings.get('stats_interval', 10.0))
+                exporter.start()
+            click.echo("Starting file watcher... Press Ctrl+C to stop")
+            try:
+                watcher.start_watching()
+            finally:
+                if exporter is not None:
+                    exporter.stop()
     
-    if not watch and not existing:
-        click.echo("Use --watch to monitor directory or --existing to organize current files")
+        if not watch and not existing:
+            click.echo("Use --watch to monitor directory or --existing to organize current files")
+    finally:
+        hash_engine.close()
+
 
 @cli.command()
 @click.argument('directory')
-def find_duplicates(directory):
+@click.option('--algorithm', '-a', help='Hash algorithm (blake2b, sha256, md5, xxhash, ...)')
+@click.option('--stats', is_flag=True, help='Report files and bytes read per stage')
+@click.option('--jobs', '-j', type=int, help='Number of hashing workers (default: CPU count)')
+@click.option('--processes', is_flag=True, help='Hash in worker processes instead of threads')
+@click.option('--no-snapshot', is_flag=True, help='Rescan and rehash everything instead of reusing the last scan')
+@click.option('--format', 'output_format', type=click.Choice(['text', 'jsonl']), default='text',
+              help='jsonl streams one JSON object per duplicate group to stdout')
+def find_duplicates(directory, algorithm, stats, jobs, processes, no_snapshot, output_format):
     """Find duplicate files in the specified directory"""
+    from .categorizer import FileCategorizer
+    from .hasher import DEFAULT_HASH_ALGORITHM, HashEngine
+    from .snapshot import DirectorySnapshot, default_snapshot_path
+    
     dir_path = Path(directory)
     
     if not dir_path.exists():
         click.echo(f"Error: Directory {dir_path} does not exist")
         return
     
-    config_manager = ConfigManager()
+    config_manager = _load_config()
+    if config_manager is None:
+        return
     rules = config_manager.get_file_rules()
-    categorizer = FileCategorizer(rules)
+    settings = config_manager.get_settings()
+    try:
+        hash_engine = HashEngine(
+            algorithm or settings.get('hash_algorithm', DEFAULT_HASH_ALGORITHM),
+            jobs or settings.get('hash_jobs'), use_processes=processes,
+            scheduler=_io_scheduler(settings))
+    except ValueError as e:
+        click.echo(f"Error: {e}")
+        return
+    categorizer = FileCategorizer(rules, hash_engine=hash_engine)
+    snapshot = None
+    if settings.get('snapshot', True) and not no_snapshot:
+        snapshot = DirectorySnapshot(default_snapshot_path('scan', settings.get('snapshot_dir')),
+                                     categorizer.hash_algorithm)
+    
+    # In jsonl mode stdout carries only the groups; everything else goes to stderr
+    jsonl = output_format == 'jsonl'
+    click.echo(f"Searching for duplicates in {dir_path}...", err=jsonl)
+    groups = categorizer.iter_duplicates(dir_path, snapshot)
+    try:
+        found = _echo_groups(groups, categorizer.hash_algorithm, jsonl)
+    finally:
+        groups.close()
+        hash_engine.close()
+        if snapshot is not None:
+            snapshot.close()
+    
+    if stats:
+        click.echo("\nScan stages:", err=jsonl)
+        for stage, counts in categorizer.last_scan_stats.items():
+            reused = f", {counts['cached']} reused" if counts['cached'] else ""
+            click.echo(f"  {stage}: {counts['files']} files, {counts['bytes_read']} bytes read{reused}",
+                       err=jsonl)
+        if snapshot is not None:
+            click.echo(f"  directories: {snapshot.dirs_listed} listed, "
+                       f"{snapshot.dirs_skipped} unchanged", err=jsonl)
+    
+    _echo_found(found, jsonl)
+
+@cli.command()
+@click.argument('directory')
+@click.argument('shard_file', type=click.Path(dir_okay=False))
+@click.option('--algorithm', '-a', help='Hash algorithm; every shard to be merged must use the same')
+@click.option('--jobs', '-j', type=int, help='Number of hashing workers (default: CPU count)')
+@click.option('--no-snapshot', is_flag=True, help='Rehash everything instead of reusing the last scan')
+def shard(directory, shard_file, algorithm, jobs, no_snapshot):
+    """Hash a directory into a shard file for merge-shards"""
+    from .categorizer import FileCategorizer
+    from .hasher import DEFAULT_HASH_ALGORITHM, HashEngine
+    from .snapshot import DirectorySnapshot, default_snapshot_path
     
-    click.echo(f"Searching for duplicates in {dir_path}...")
-    duplicates = categorizer.find_duplicates_in_directory(dir_path)
+    dir_path = Path(directory)
+    
+    if not dir_path.exists():
+        click.echo(f"Error: Directory {dir_path} does not exist")
+        return
     
-    if not duplicates:
-        click.echo("No duplicates found!")
+    config_manager = _load_config()
+    if config_manager is None:
         return
+    settings = config_manager.get_settings()
+    try:
+        hash_engine = HashEngine(algorithm or settings.get('hash_algorithm', DEFAULT_HASH_ALGORITHM),
+                                 jobs or settings.get('hash_jobs'),
+                                 scheduler=_io_scheduler(settings))
+    except ValueError as e:
+        click.echo(f"Error: {e}")
+        return
+    categorizer = FileCategorizer(config_manager.get_file_rules(), hash_engine=hash_engine)
+    snapshot = None
+    if settings.get('snapshot', True) and not no_snapshot:
+        snapshot = DirectorySnapshot(default_snapshot_path('scan', settings.get('snapshot_dir')),
+                                     categorizer.hash_algorithm)
     
-    click.echo(f"\nFound {len(duplicates)} groups of duplicate files:")
-    for i, duplicate_group in enumerate(duplicates, 1):
-        click.echo(f"\nGroup {i}:")
-        for file_path in duplicate_group:
-            size = file_path.stat().st_size
-            click.echo(f"  - {file_path} ({size} bytes)")
+    try:
+        count = categorizer.write_shard(dir_path, Path(shard_file), snapshot)
+    finally:
+        hash_engine.close()
+        if snapshot is not None:
+            snapshot.close()
+    full = categorizer.last_scan_stats['full']
+    click.echo(f"Wrote {count} files to {shard_file} "
+               f"({full['bytes_read']} bytes hashed, {full['cached']} digests reused)")
+
+@cli.command()
+@click.argument('shard_files', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'output_format', type=click.Choice(['text', 'jsonl']), default='text',
+              help='jsonl streams one JSON object per duplicate group to stdout')
+def merge_shards(shard_files, output_format):
+    """Find duplicates across the roots of several shard files"""
+    from .categorizer import DuplicateGroup
+    from .shards import ShardReader, merge_shards as merge
+    
+    jsonl = output_format == 'jsonl'
+    try:
+        with ShardReader(Path(shard_files[0])) as reader:
+            algorithm = reader.algorithm
+        groups = merge(Path(path) for path in shard_files)
+        try:
+            found = _echo_groups((DuplicateGroup._make(group) for group in groups), algorithm, jsonl)
+        finally:
+            groups.close()
+    except ValueError as e:
+        click.echo(f"Error: {e}", err=jsonl)
+        return
+    _echo_found(found, jsonl)
+
+@cli.command()
+@click.argument('directory')
+@click.option('--method', type=click.Choice(['dhash', 'phash']), default='dhash', show_default=True,
+              help='Perceptual hash; phash is slower but more robust to edits')
+@click.option('--max-distance', '-d', type=click.IntRange(0, 64), default=6, show_default=True,
+              help='Largest number of differing hash bits (of 64) for images to count as similar')
+@click.option('--category', default='Images', show_default=True, help='Rule category holding the images')
+@click.option('--jobs', '-j', type=int, help='Number of decoding workers (default: CPU count)')
+@click.option('--no-snapshot', is_flag=True, help='Rehash every image instead of reusing the last scan')
+@click.option('--format', 'output_format', type=click.Choice(['text', 'jsonl']), default='text',
+              help='jsonl writes one JSON object per group to stdout')
+def find_similar(directory, method, max_distance, category, jobs, no_snapshot, output_format):
+    """Find resized, re-encoded or otherwise near-duplicate images"""
+    from .categorizer import FileCategorizer
+    from .hasher import HashEngine
+    from .snapshot import DirectorySnapshot, default_snapshot_path
+    
+    dir_path = Path(directory)
+    
+    if not dir_path.exists():
+        click.echo(f"Error: Directory {dir_path} does not exist")
+        return
+    
+    config_manager = _load_config()
+    if config_manager is None:
+        return
+    settings = config_manager.get_settings()
+    categorizer = FileCategorizer(config_manager.get_file_rules(),
+                                  hash_engine=HashEngine(jobs=jobs or settings.get('hash_jobs')))
+    snapshot = None
+    if settings.get('snapshot', True) and not no_snapshot:
+        # One snapshot per method, since the hashes are kept in its digest field
+        snapshot = DirectorySnapshot(default_snapshot_path(f'similar-{method}',
+                                                           settings.get('snapshot_dir')), method)
+    
+    jsonl = output_format == 'jsonl'
+    click.echo(f"Searching for similar images in {dir_path}...", err=jsonl)
+    try:
+        groups = categorizer.find_similar_images(dir_path, snapshot, method, max_distance, category)
+    except ValueError as e:
+        click.echo(f"Error: {e}")
+        return
+    finally:
+        if snapshot is not None:
+            snapshot.close()
+    
+    for number, group in enumerate(groups, 1):
+        if jsonl:
+            click.echo(json.dumps({'method': method, 'distance': group.distance,
+                                   'paths': [str(path) for path in group.paths]}))
+            continue
+        click.echo(f"\nGroup {number} (up to {group.distance} bits apart):")
+        for file_path in group.paths:
+            click.echo(f"  - {file_path}")
+    
+    counts = categorizer.last_scan_stats['images']
+    click.echo(f"\nHashed {counts['files'] - counts['cached'] - counts['failed']} images, "
+               f"reused {counts['cached']}, {counts['failed']} unreadable", err=jsonl)
+    if not groups:
+        click.echo("No similar images found!", err=jsonl)
+    else:
+        click.echo(f"Found {len(groups)} groups of similar images", err=jsonl)
+
+@cli.command()
+@click.argument('directory')
+@click.option('--mode', type=click.Choice(['hardlink', 'reflink']), default='hardlink', show_default=True,
+              help='reflink clones copy-on-write where the filesystem supports it, else hard-links')
+@click.option('--verify', is_flag=True, help='Compare files byte for byte before linking them')
+@click.option('--dry-run', '-n', is_flag=True, help='Report what would be reclaimed without changing anything')
+@click.option('--batch-size', type=int, default=100, show_default=True, help='Duplicate groups per batch')
+@click.option('--no-snapshot', is_flag=True, help='Rescan and rehash everything instead of reusing the last scan')
+def dedupe(directory, mode, verify, dry_run, batch_size, no_snapshot):
+    """Replace duplicate files by links to a single copy"""
+    from .categorizer import FileCategorizer
+    from .dedupe import Deduplicator
+    from .hasher import DEFAULT_HASH_ALGORITHM, HashEngine
+    from .snapshot import DirectorySnapshot, default_snapshot_path
+    
+    dir_path = Path(directory)
+    
+    if not dir_path.exists():
+        click.echo(f"Error: Directory {dir_path} does not exist")
+        return
+    
+    config_manager = _load_config()
+    if config_manager is None:
+        return
+    settings = config_manager.get_settings()
+    try:
+        hash_engine = HashEngine(settings.get('hash_algorithm', DEFAULT_HASH_ALGORITHM),
+                                 settings.get('hash_jobs'), scheduler=_io_scheduler(settings))
+    except ValueError as e:
+        click.echo(f"Error: {e}")
+        return
+    categorizer = FileCategorizer(config_manager.get_file_rules(), hash_engine=hash_engine)
+    snapshot = None
+    if settings.get('snapshot', True) and not no_snapshot:
+        snapshot = DirectorySnapshot(default_snapshot_path('scan', settings.get('snapshot_dir')),
+                                     categorizer.hash_algorithm)
+    
+    deduplicator = Deduplicator(mode, verify, batch_size, settings.get('workers', 4), dry_run)
+    batches = 0
+    
+    def report(result):
+        nonlocal batches
+        batches += 1
+        click.echo(f"Batch {batches}: {result.linked} files linked, "
+                   f"{result.bytes_reclaimed} bytes reclaimed")
+    
+    click.echo(f"Deduplicating {dir_path}{' (dry run)' if dry_run else ''}...")
+    groups = categorizer.iter_duplicates(dir_path, snapshot)
+    try:
+        result = deduplicator.run(groups, report)
+    finally:
+        groups.close()
+        hash_engine.close()
+        if snapshot is not None:
+            snapshot.close()
+    
+    verb = "Would link" if dry_run else "Linked"
+    click.echo(f"\n{verb} {result.linked} files in {result.groups} duplicate groups, "
+               f"reclaiming {result.bytes_reclaimed} bytes")
+    if result.skipped or result.failed:
+        click.echo(f"Skipped {result.skipped} files, {result.failed} failed")
+
+@cli.command()
+@click.argument('run_id', required=False)
+@click.option('--list', 'list_only', is_flag=True, help='List the journaled runs instead')
+def undo(run_id, list_only):
+    """Move the files of an organize --existing run back (default: the latest)"""
+    from .journal import default_journal_dir, list_runs, undo_run
+    
+    config_manager = _load_config()
+    if config_manager is None:
+        return
+    settings = config_manager.get_settings()
+    runs = [run for run in list_runs(default_journal_dir(settings.get('snapshot_dir')))
+            if run.source_dir is not None]
+    
+    if list_only:
+        for run in runs:
+            state = ("undone" if run.undo_finished else
+                     "interrupted" if run.interrupted else "")
+            click.echo(f"{run.run_id}  {run.source_dir} -> {run.target_dir}  "
+                       f"{len(run.done)} moved{'  (' + state + ')' if state else ''}")
+        if not runs:
+            click.echo("No runs recorded")
+        return
+    
+    if run_id is None:
+        candidates = [run for run in runs if run.done and not run.undo_finished]
+    else:
+        candidates = [run for run in runs if run.run_id == run_id]
+    if not candidates:
+        click.echo(f"Error: No run {run_id} to undo" if run_id else "Error: No run to undo")
+        return
+    run = candidates[-1]
+    if run.undo_finished:
+        click.echo(f"Run {run.run_id} has already been undone")
+        return
+    
+    click.echo(f"Undoing run {run.run_id}: {run.target_dir} -> {run.source_dir}")
+    restored, failed = undo_run(run)
+    click.echo(f"Restored {restored} files" + (f", {failed} failed" if failed else ""))
 
 @cli.command()
 def config():
     """Show current configuration"""
-    config_manager = ConfigManager()
+    config_manager = _load_config()
+    if config_manager is None:
+        return
     
     click.echo("Current Configuration:")
     click.echo("\nFile Rules:")
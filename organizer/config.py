@@ -1,20 +1,92 @@
-import yaml
+import marshal
 import os
+import sys
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple, Union
+from .rules import RuleEngine
+
+# Bump when the cached form changes
+CACHE_VERSION = 1
+
+
+def _yaml():
+    # PyYAML takes longer to import than the rest of a short command
+    import yaml
+    return yaml
+
+
+def load_yaml(file) -> Any:
+    """Parse YAML with libyaml's C loader when PyYAML was built with it"""
+    yaml = _yaml()
+    return yaml.load(file, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+
+def validate_config(config: Any, source: str = "config") -> Dict:
+    """Check the overall shape of a config and compile its rules"""
+    if config is None:
+        config = {}
+    if not isinstance(config, dict):
+        raise ValueError(f"{source}: expected a mapping at the top level")
+    for section in ('rules', 'settings'):
+        if not isinstance(config.get(section) or {}, dict):
+            raise ValueError(f"{source}: '{section}' must be a mapping")
+    try:
+        RuleEngine(config.get('rules') or {})
+    except (ValueError, TypeError, AttributeError) as e:
+        raise ValueError(f"{source}: invalid rules: {e}")
+    return config
+
 
 class ConfigManager:
-    def __init__(self, config_path: str = "config.yaml"):
+    def __init__(self, config_path: str = "config.yaml", use_cache: bool = True):
         self.config_path = Path(config_path)
+        self.cache_path = self.config_path.with_name(f".{self.config_path.name}.cache")
+        self.use_cache = use_cache
         self.config = self._load_config()
     
     def _load_config(self) -> Dict:
-        """Load configuration from YAML file"""
+        """Load configuration, from the compiled cache when it is current.
+        
+        The cache is a marshal dump of the validated config stored beside
+        the YAML file and keyed by its mtime, size and inode, so editing
+        the file invalidates it.
+        """
         if not self.config_path.exists():
             self._create_default_config()
         
-        with open(self.config_path, 'r') as file:
-            return yaml.safe_load(file)
+        stat = self.config_path.stat()
+        key = (CACHE_VERSION, sys.version_info[:2], stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if self.use_cache:
+            cached = self._read_cache(key)
+            if cached is not None:
+                return cached
+        
+        with open(self.config_path, 'rb') as file:
+            config = validate_config(load_yaml(file), str(self.config_path))
+        if self.use_cache:
+            self._write_cache(key, config)
+        return config
+    
+    def _read_cache(self, key: Tuple) -> Optional[Dict]:
+        try:
+            with open(self.cache_path, 'rb') as file:
+                cached_key, config = marshal.load(file)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        return config if cached_key == key else None
+    
+    def _write_cache(self, key: Tuple, config: Dict) -> None:
+        tmp_path = self.cache_path.with_name(f"{self.cache_path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, 'wb') as file:
+                marshal.dump((key, config), file)
+            os.replace(tmp_path, self.cache_path)
+        except (OSError, ValueError):
+            # Read-only directory or a value marshal can't store: just skip caching
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
     
     def _create_default_config(self) -> None:
         """Create default configuration file"""
@@ -32,23 +104,58 @@ class ConfigManager:
                 'target_dir': str(Path.home() / 'Downloads' / 'Organized'),
                 'watch_mode': True,
                 'handle_duplicates': True,
-                'create_date_folders': False
+                'create_date_folders': False,
+                'sniff_content': False,
+                'hash_algorithm': 'blake2b',
+                'workers': 4,
+                'settle_time': 1.0
             }
         }
         
         with open(self.config_path, 'w') as file:
-            yaml.dump(default_config, file, default_flow_style=False)
+            _yaml().dump(default_config, file, default_flow_style=False, sort_keys=False)
     
-    def get_file_rules(self) -> Dict[str, List[str]]:
-        """Get file categorization rules"""
+    def get_file_rules(self) -> Dict[str, Union[List[str], Dict]]:
+        """Get file categorization rules, in precedence order"""
         return self.config.get('rules', {})
     
     def get_settings(self) -> Dict:
         """Get application settings"""
         return self.config.get('settings', {})
     
+    def get_sources(self, target_dir: Optional[str] = None) -> List[Dict]:
+        """Source directories with their target, rules and recursive flag.
+        
+        settings.source_dirs lists plain paths or mappings with a path and
+        optional target, rules and recursive keys; a source's rules take
+        precedence over the global ones. Without source_dirs the single
+        source_dir is used. target_dir replaces the default target.
+        """
+        settings = self.get_settings()
+        rules = self.get_file_rules()
+        default_target = target_dir or settings['target_dir']
+        entries = settings.get('source_dirs') or [settings['source_dir']]
+        
+        sources = []
+        for entry in entries:
+            if not isinstance(entry, dict):
+                entry = {'path': entry}
+            if 'path' not in entry:
+                raise ValueError(f"Source entry without a path: {entry}")
+            overrides = entry.get('rules') or {}
+            merged = dict(overrides)
+            merged.update((category, spec) for category, spec in rules.items()
+                          if category not in overrides)
+            sources.append({
+                'path': Path(os.path.expanduser(entry['path'])),
+                'target': Path(os.path.expanduser(entry.get('target') or default_target)),
+                'rules': merged if overrides else rules,
+                'recursive': bool(entry.get('recursive', False)),
+            })
+        return sources
+    
     def update_config(self, new_config: Dict) -> None:
         """Update configuration"""
         self.config.update(new_config)
         with open(self.config_path, 'w') as file:
-            yaml.dump(self.config, file, default_flow_style=False)
\ No newline at end of file
+            _yaml().dump(self.config, file, default_flow_style=False, sort_keys=False)
\ No newline at end of file
@@ -0,0 +1,115 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, List, NamedTuple, Optional, Set, Tuple
+from .categorizer import DuplicateGroup
+from .mover import LINK_UNSUPPORTED
+from .transfer import fsync_directory, replace_with_link
+
+logger = logging.getLogger(__name__)
+
+
+class DedupeResult(NamedTuple):
+    groups: int = 0
+    linked: int = 0
+    skipped: int = 0
+    failed: int = 0
+    bytes_reclaimed: int = 0
+
+    def __add__(self, other: "DedupeResult") -> "DedupeResult":
+        return DedupeResult(*(a + b for a, b in zip(self, other)))
+
+
+class Deduplicator:
+    """Reclaim the space taken by duplicate files.
+
+    In every group one copy is kept (the one with the most hard links, so
+    files already sharing data stay together) and each other copy is
+    atomically replaced by a hard link to it, or a copy-on-write clone in
+    "reflink" mode, falling back to a hard link where cloning isn't
+    supported. Groups are handled in batches on a thread pool, and the
+    touched directories are fsync'ed once per batch rather than per file.
+    """
+
+    def __init__(self, mode: str = "hardlink", verify: bool = False,
+                 batch_size: int = 100, jobs: int = 4, dry_run: bool = False):
+        self.mode = mode
+        self.verify = verify
+        self.batch_size = max(1, batch_size)
+        self.jobs = max(1, jobs)
+        self.dry_run = dry_run
+
+    def run(self, groups: Iterable[DuplicateGroup],
+            progress: Optional[Callable[[DedupeResult], None]] = None) -> DedupeResult:
+        """Dedupe every group, calling progress with each batch's result"""
+        total = DedupeResult()
+        batch: List[DuplicateGroup] = []
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            for group in groups:
+                batch.append(group)
+                if len(batch) >= self.batch_size:
+                    total += self._run_batch(executor, batch, progress)
+                    batch = []
+            if batch:
+                total += self._run_batch(executor, batch, progress)
+        return total
+
+    def _run_batch(self, executor: ThreadPoolExecutor, batch: List[DuplicateGroup],
+                   progress: Optional[Callable[[DedupeResult], None]]) -> DedupeResult:
+        result = DedupeResult()
+        directories: Set[Path] = set()
+        for group_result, touched in executor.map(self._dedupe_group, batch):
+            result += group_result
+            directories.update(touched)
+        for directory in directories:
+            fsync_directory(directory)
+        if progress is not None:
+            progress(result)
+        return result
+
+    def _dedupe_group(self, group: DuplicateGroup) -> Tuple[DedupeResult, Set[Path]]:
+        """Link every copy in group to the kept one"""
+        stats = []
+        for file_path in group.paths:
+            try:
+                stats.append((file_path, os.stat(file_path)))
+            except OSError as e:
+                logger.warning("Skipping %s: %s", file_path, e)
+        if len(stats) < 2:
+            return DedupeResult(groups=1, skipped=len(stats)), set()
+        # sorted() is stable, so ties keep the scan's order
+        stats.sort(key=lambda item: -item[1].st_nlink)
+        original, original_stat = stats[0]
+        linked = skipped = failed = reclaimed = 0
+        touched: Set[Path] = set()
+        for duplicate, stat in stats[1:]:
+            if (stat.st_dev, stat.st_ino) == (original_stat.st_dev, original_stat.st_ino):
+                skipped += 1
+                continue
+            # Data still referenced by another link isn't freed
+            freed = stat.st_size if stat.st_nlink == 1 else 0
+            if self.dry_run:
+                linked += 1
+                reclaimed += freed
+                continue
+            try:
+                method = replace_with_link(duplicate, original, self.mode, self.verify, sync=False)
+            except OSError as e:
+                if e.errno in LINK_UNSUPPORTED:
+                    logger.warning("Cannot link %s to %s: %s", duplicate, original, e)
+                    skipped += 1
+                else:
+                    logger.error("Error deduplicating %s: %s", duplicate, e)
+                    failed += 1
+                continue
+            if method is None:
+                logger.warning("Not linking %s: contents differ from %s", duplicate, original)
+                skipped += 1
+                continue
+            logger.debug("Linked (%s): %s -> %s", method, duplicate, original,
+                         extra={'src': duplicate, 'dst': original, 'method': method})
+            linked += 1
+            reclaimed += freed
+            touched.add(duplicate.parent)
+        return DedupeResult(1, linked, skipped, failed, reclaimed), touched
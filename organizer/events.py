@@ -0,0 +1,220 @@
+import logging
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from .metrics import registry as metrics
+
+logger = logging.getLogger(__name__)
+
+Processor = Callable[[Path], None]
+
+# Suffixes browsers and download managers use while a file is still arriving
+PARTIAL_SUFFIXES = ('.crdownload', '.part', '.partial', '.download',
+                    '.opdownload', '.tmp', '.!ut')
+
+
+def is_partial_download(file_path: Path) -> bool:
+    """True if the file is an in-progress download that will be renamed later"""
+    return file_path.suffix.lower() in PARTIAL_SUFFIXES
+
+
+def _stat_key(file_path: Path) -> Optional[Tuple[int, int]]:
+    """(size, mtime_ns) of a path, or None if it can't be stat'ed"""
+    try:
+        stat = file_path.stat()
+    except (IOError, OSError):
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class EventQueue:
+    """Debounced queue of paths waiting to be organized.
+
+    Repeated events for a path collapse into one pending entry. A path is
+    handed to the worker pool once its size and mtime have stopped changing
+    for settle_time seconds. put() blocks while max_pending paths are
+    queued, so a burst slows the event source down instead of growing
+    without bound.
+
+    Each path is queued together with the callable that processes it (one
+    per watched source). Settled paths are served round-robin across those
+    callables, so a busy source can't starve the others of workers.
+    """
+
+    def __init__(self, process: Callable[[Path], None], workers: int = 4,
+                 settle_time: float = 1.0, max_pending: int = 1000,
+                 poll_interval: float = 0.25):
+        self.process = process
+        self.workers = max(1, workers)
+        self.settle_time = settle_time
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        # path -> ((size, mtime_ns), monotonic time of last change, time queued, process)
+        self._pending: Dict[Path, Tuple[Optional[Tuple[int, int]], float, float, Processor]] = {}
+        # Settled paths per source, and the sources with work in turn order
+        self._ready: Dict[Processor, Deque[Path]] = {}
+        self._turns: Deque[Processor] = deque()
+        self._ready_count = 0
+        self._active = 0
+        self._cond = threading.Condition()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._running = False
+        self._draining = False
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def pending_paths(self) -> List[Path]:
+        """Paths queued but not yet handed to a worker"""
+        with self._cond:
+            return list(self._pending) + [path for items in self._ready.values()
+                                          for path in items]
+
+    def put(self, file_path: Path, process: Optional[Processor] = None) -> bool:
+        """Queue a path, merging it with any pending event for the same path"""
+        metrics.inc('events_total')
+        if is_partial_download(file_path):
+            metrics.inc('events_ignored_total')
+            return False
+        with self._cond:
+            # Time only the enqueue itself, not the wait for room
+            while (file_path not in self._pending and self._running
+                   and len(self._pending) + self._ready_count >= self.max_pending):
+                metrics.inc('backpressure_waits_total')
+                self._cond.wait()
+            with metrics.time('detect'):
+                if file_path in self._pending:
+                    metrics.inc('events_merged_total')
+                    return True
+                if not self._running:
+                    return False
+                now = time.monotonic()
+                self._pending[file_path] = (None, now, now, process or self.process)
+        return True
+
+    def start(self) -> None:
+        """Start the stability poller and the worker threads"""
+        if self._running:
+            return
+        self._running = True
+        self._draining = False
+        self._stopping.clear()
+        metrics.gauge('queue_pending', lambda: len(self._pending))
+        metrics.gauge('queue_ready', lambda: self._ready_count)
+        self._threads = [threading.Thread(target=self._poll, name="organizer-poll",
+                                          daemon=True)]
+        self._threads += [
+            threading.Thread(target=self._work, name=f"organizer-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        """Stop accepting events and wait for in-flight work to finish"""
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+        self._stopping.set()
+        self._threads[0].join()
+        # Workers finish whatever has already settled, then exit
+        with self._cond:
+            self._draining = True
+            self._cond.notify_all()
+        for thread in self._threads[1:]:
+            thread.join()
+        self._threads = []
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until nothing is pending or being processed"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._cond:
+                idle = not self._pending and not self._ready_count and not self._active
+            if idle:
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_interval / 2)
+
+    def _poll(self) -> None:
+        while not self._stopping.wait(self.poll_interval):
+            # stat() outside the lock, so put() and the workers aren't held up by slow disks
+            with self._cond:
+                candidates = list(self._pending)
+            stats = {file_path: _stat_key(file_path) for file_path in candidates}
+            with self._cond:
+                pending = len(self._pending)
+                for file_path, process in self._settled(stats):
+                    items = self._ready.get(process)
+                    if items is None:
+                        items = self._ready[process] = deque()
+                        self._turns.append(process)
+                    items.append(file_path)
+                    self._ready_count += 1
+                if len(self._pending) < pending:
+                    self._cond.notify_all()
+
+    def _settled(self, stats: Dict[Path, Optional[Tuple[int, int]]]) -> List[Tuple[Path, Processor]]:
+        """Pop paths whose size and mtime have been stable for settle_time.
+
+        stats maps each candidate path to its (size, mtime_ns), or None if it
+        is gone; the caller holds the lock.
+        """
+        now = time.monotonic()
+        ready = []
+        for file_path, current in stats.items():
+            entry = self._pending.get(file_path)
+            if entry is None:
+                continue
+            last_seen, changed_at, queued_at, process = entry
+            if current is None:
+                del self._pending[file_path]
+                continue
+            if current != last_seen:
+                self._pending[file_path] = (current, now, queued_at, process)
+            elif now - changed_at >= self.settle_time:
+                del self._pending[file_path]
+                metrics.observe('stabilize', now - queued_at)
+                ready.append((file_path, process))
+        return ready
+
+    def _next(self) -> Optional[Tuple[Path, Processor]]:
+        """Take one path from the source whose turn it is, or None to exit"""
+        with self._cond:
+            while not self._turns:
+                if self._draining:
+                    return None
+                self._cond.wait()
+            process = self._turns.popleft()
+            items = self._ready[process]
+            file_path = items.popleft()
+            if items:
+                self._turns.append(process)
+            else:
+                del self._ready[process]
+            self._ready_count -= 1
+            self._active += 1
+            self._cond.notify_all()
+            return file_path, process
+
+    def _work(self) -> None:
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            file_path, process = item
+            try:
+                process(file_path)
+            except Exception as e:
+                metrics.inc('errors_total')
+                logger.exception("Error processing file %s: %s", file_path, e)
+            finally:
+                with self._cond:
+                    self._active -= 1
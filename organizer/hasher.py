@@ -0,0 +1,198 @@
+import hashlib
+import logging
+import mmap
+import os
+from concurrent.futures import FIRST_COMPLETED, Executor, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple
+from .iosched import IOScheduler, Throttle, current_priority
+from .metrics import registry as metrics
+
+logger = logging.getLogger(__name__)
+
+try:
+    import xxhash
+except ImportError:  # optional, faster non-cryptographic hash
+    xxhash = None
+
+DEFAULT_HASH_ALGORITHM = "blake2b"
+PARTIAL_HASH_SIZE = 4096
+BUFFER_SIZE = 1024 * 1024
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+
+def new_hasher(algorithm: str):
+    """Return a fresh hash object for the named algorithm"""
+    if algorithm in ("xxhash", "xxh3", "xxh64"):
+        if xxhash is None:
+            raise ValueError("xxhash is not installed (pip install xxhash)")
+        return xxhash.xxh64() if algorithm == "xxh64" else xxhash.xxh3_128()
+    try:
+        return hashlib.new(algorithm)
+    except ValueError:
+        raise ValueError(f"Unsupported hash algorithm: {algorithm}")
+
+
+def hash_path(path: str, algorithm: str, edge_size: Optional[int] = None,
+              buffer_size: int = BUFFER_SIZE,
+              mmap_threshold: int = MMAP_THRESHOLD,
+              throttle: Optional[Throttle] = None) -> Tuple[str, int]:
+    """Hash a file (or just its edges), returning (digest, bytes_read).
+
+    Module-level so it can be shipped to a process pool. With throttle,
+    throttle(nbytes, file_size) is called before every read and mmap is
+    not used. Raises OSError.
+    """
+    hasher = new_hasher(algorithm)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if edge_size is not None and size > 2 * edge_size:
+            if throttle is not None:
+                throttle(2 * edge_size, size)
+            head = f.read(edge_size)
+            f.seek(-edge_size, os.SEEK_END)
+            tail = f.read(edge_size)
+            hasher.update(head)
+            hasher.update(tail)
+            return hasher.hexdigest(), len(head) + len(tail)
+
+        if size >= mmap_threshold and throttle is None:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                hasher.update(mapped)
+            return hasher.hexdigest(), size
+
+        buffer = bytearray(buffer_size)
+        view = memoryview(buffer)
+        bytes_read = 0
+        while True:
+            if throttle is not None:
+                throttle(min(buffer_size, max(size - bytes_read, 1)), size)
+            n = f.readinto(buffer)
+            if not n:
+                break
+            hasher.update(view[:n])
+            bytes_read += n
+        return hasher.hexdigest(), bytes_read
+
+
+class HashEngine:
+    """Hash files on a pool of workers.
+
+    Threads are the default since hashlib releases the GIL while hashing
+    large buffers; a process pool can be used instead for algorithms that
+    don't. Large files are read through mmap, the rest with big buffers.
+    With a scheduler, reads are paced by its I/O budget at the priority
+    of the thread that asked for them.
+    """
+
+    def __init__(self, algorithm: str = DEFAULT_HASH_ALGORITHM,
+                 jobs: Optional[int] = None, use_processes: bool = False,
+                 buffer_size: int = BUFFER_SIZE,
+                 mmap_threshold: int = MMAP_THRESHOLD,
+                 scheduler: Optional[IOScheduler] = None):
+        new_hasher(algorithm)  # fail early on an unknown algorithm
+        self.algorithm = algorithm
+        self.jobs = max(1, jobs or os.cpu_count() or 1)
+        self.use_processes = use_processes
+        self.buffer_size = buffer_size
+        self.mmap_threshold = mmap_threshold
+        self.scheduler = scheduler
+        self._executor: Optional[Executor] = None
+
+    def hash_file(self, file_path: Path, edge_size: Optional[int] = None,
+                  throttle: Optional[Throttle] = None) -> Tuple[str, int]:
+        """Hash one file on the calling thread, returning (digest, bytes_read)"""
+        if throttle is None and self.scheduler is not None:
+            throttle = self.scheduler.throttle(current_priority())
+        try:
+            with metrics.time('hash'):
+                digest, bytes_read = hash_path(str(file_path), self.algorithm, edge_size,
+                                               self.buffer_size, self.mmap_threshold,
+                                               throttle)
+        except (IOError, OSError) as e:
+            metrics.inc('hash_errors_total')
+            logger.warning("Error reading file %s: %s", file_path, e)
+            return "", 0
+        metrics.inc('hash_bytes_total', bytes_read)
+        return digest, bytes_read
+
+    def hash_files(self, paths: Iterable[Path],
+                   edge_size: Optional[int] = None) -> Iterator[Tuple[Path, str, int]]:
+        """Hash many files, yielding (path, digest, bytes_read) as each finishes.
+
+        Files that can't be read are yielded with an empty digest. At most
+        a few batches per worker are in flight, so paths may be a lazy
+        iterable of any length.
+        """
+        if self.jobs == 1:
+            for file_path in paths:
+                yield (file_path, *self.hash_file(file_path, edge_size))
+            return
+
+        executor = self._get_executor()
+        max_pending = self.jobs * 4
+        pending = {}
+        throttle = None
+        if self.scheduler is not None:
+            # Workers don't inherit the caller's priority, so capture it here
+            throttle = self.scheduler.throttle(current_priority())
+        for file_path in paths:
+            if throttle is None:
+                future = executor.submit(hash_path, str(file_path), self.algorithm,
+                                         edge_size, self.buffer_size, self.mmap_threshold)
+            elif self.use_processes:
+                # The scheduler lives in this process: pay for the whole read up front
+                self._acquire_for(file_path, edge_size, throttle)
+                future = executor.submit(hash_path, str(file_path), self.algorithm,
+                                         edge_size, self.buffer_size, self.mmap_threshold)
+            else:
+                future = executor.submit(hash_path, str(file_path), self.algorithm,
+                                         edge_size, self.buffer_size, self.mmap_threshold,
+                                         throttle)
+            pending[future] = file_path
+            if len(pending) >= max_pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield self._result(pending.pop(future), future)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield self._result(pending.pop(future), future)
+
+    def close(self) -> None:
+        """Shut down the worker pool"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.use_processes:
+                # Imported here: it pulls in multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                self._executor = ProcessPoolExecutor(max_workers=self.jobs)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.jobs,
+                                                    thread_name_prefix="organizer-hash")
+        return self._executor
+
+    def _acquire_for(self, file_path: Path, edge_size: Optional[int],
+                     throttle: Throttle) -> None:
+        try:
+            size = os.stat(file_path).st_size
+        except OSError:
+            return  # the worker will report it
+        if edge_size is not None and size > 2 * edge_size:
+            throttle(2 * edge_size, size)
+        else:
+            throttle(size, size)
+
+    def _result(self, file_path: Path, future) -> Tuple[Path, str, int]:
+        try:
+            digest, bytes_read = future.result()
+        except (IOError, OSError) as e:
+            metrics.inc('hash_errors_total')
+            logger.warning("Error reading file %s: %s", file_path, e)
+            return file_path, "", 0
+        metrics.inc('hash_bytes_total', bytes_read)
+        return file_path, digest, bytes_read
@@ -0,0 +1,210 @@
+import os
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Tuple
+from .transfer import TEMP_PREFIX
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = ".organizer_index.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dev INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    digest TEXT
+);
+CREATE INDEX IF NOT EXISTS files_size_digest ON files (size, digest);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def stat_key(stat: os.stat_result) -> Tuple[int, int, int, int]:
+    """Identity of a file's contents as far as stat() can tell"""
+    return (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class DuplicateIndex:
+    """Persistent (size, digest) -> path index of the organized target tree.
+
+    Rows are keyed by (dev, inode, mtime, size) so a stale entry is noticed
+    and re-hashed on lookup. Digests are computed lazily: a file is only
+    hashed once another file of the same size shows up.
+    """
+
+    def __init__(self, db_path: Path, hash_func: Callable[[Path], str],
+                 algorithm: Optional[str] = None):
+        self.db_path = Path(db_path)
+        self.hash_func = hash_func
+        self.algorithm = algorithm
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        if algorithm is not None:
+            self._check_algorithm(algorithm)
+        self._conn.commit()
+
+    @classmethod
+    def for_target(cls, target_dir: Path, hash_func: Callable[[Path], str],
+                   algorithm: Optional[str] = None) -> 'DuplicateIndex':
+        """Open (or create) the index stored at the root of a target tree"""
+        return cls(Path(target_dir) / INDEX_FILENAME, hash_func, algorithm)
+
+    def _check_algorithm(self, algorithm: str) -> None:
+        """Drop stored digests if they were made with another hash algorithm"""
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'algorithm'").fetchone()
+        if row is not None and row[0] != algorithm:
+            self._conn.execute("UPDATE files SET digest = NULL")
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('algorithm', ?)",
+            (algorithm,))
+
+    def close(self) -> None:
+        """Close the underlying database"""
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def add(self, file_path: Path, digest: Optional[str] = None) -> None:
+        """Record a file now present in the target tree"""
+        try:
+            stat = file_path.stat()
+        except (IOError, OSError) as e:
+            logger.warning("Error indexing file %s: %s", file_path, e)
+            return
+        with self._lock:
+            self._upsert(str(file_path), stat, digest)
+            self._conn.commit()
+
+    def add_many(self, entries: Iterable[Tuple[Path, Optional[str]]]) -> None:
+        """Record a batch of (path, digest or None) in a single transaction"""
+        rows = []
+        for file_path, digest in entries:
+            try:
+                rows.append((str(file_path), file_path.stat(), digest))
+            except (IOError, OSError) as e:
+                logger.warning("Error indexing file %s: %s", file_path, e)
+        with self._lock:
+            for path, stat, digest in rows:
+                self._upsert(path, stat, digest)
+            self._conn.commit()
+
+    def remove(self, file_path: Path) -> None:
+        """Forget a file that left the target tree"""
+        with self._lock:
+            self._conn.execute("DELETE FROM files WHERE path = ?", (str(file_path),))
+            self._conn.commit()
+
+    def sync(self, root: Path) -> None:
+        """Bring the index in line with the files currently under root.
+
+        Only stat() is used here; unchanged rows keep their digest and
+        new or modified files are hashed lazily on the next lookup.
+        """
+        root = Path(root)
+        seen = set()
+        with self._lock:
+            known = {
+                row[0]: tuple(row[1:])
+                for row in self._conn.execute(
+                    "SELECT path, dev, inode, mtime_ns, size FROM files")
+            }
+            for file_path, stat in self._walk(root):
+                path = str(file_path)
+                seen.add(path)
+                if known.get(path) != stat_key(stat):
+                    self._upsert(path, stat, None)
+            prefix = str(root) + os.sep
+            stale = [(path,) for path in known
+                     if path.startswith(prefix) and path not in seen]
+            self._conn.executemany("DELETE FROM files WHERE path = ?", stale)
+            self._conn.commit()
+
+    def find_duplicate(self, file_path: Path, within: Optional[Path] = None,
+                       digest: Optional[str] = None) -> Optional[Path]:
+        """Return an indexed file with the same contents as file_path, if any"""
+        try:
+            size = file_path.stat().st_size
+        except (IOError, OSError):
+            return None
+
+        prefix = str(within) + os.sep if within is not None else None
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, dev, inode, mtime_ns, size, digest FROM files "
+                "WHERE size = ?", (size,)).fetchall()
+        candidates = [
+            row for row in rows
+            if row[0] != str(file_path) and (prefix is None or row[0].startswith(prefix))
+        ]
+        if not candidates:
+            return None
+
+        if digest is None:
+            digest = self.hash_func(file_path)
+            if not digest:
+                return None
+
+        for path, dev, inode, mtime_ns, row_size, row_digest in candidates:
+            candidate_digest = self._fresh_digest(
+                Path(path), (dev, inode, mtime_ns, row_size), row_digest)
+            if candidate_digest == digest:
+                return Path(path)
+        return None
+
+    def _fresh_digest(self, path: Path, key: Tuple[int, int, int, int],
+                      digest: Optional[str]) -> Optional[str]:
+        """Digest of an indexed file, re-hashing it if the row is stale"""
+        try:
+            stat = path.stat()
+        except (IOError, OSError):
+            self.remove(path)
+            return None
+        if stat_key(stat) == key and digest:
+            return digest
+        digest = self.hash_func(path) or None
+        with self._lock:
+            self._upsert(str(path), stat, digest)
+            self._conn.commit()
+        return digest
+
+    def _upsert(self, path: str, stat: os.stat_result, digest: Optional[str]) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO files (path, dev, inode, mtime_ns, size, digest) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (path, *stat_key(stat), digest))
+
+    def _walk(self, root: Path) -> Iterable[Tuple[Path, os.stat_result]]:
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except (IOError, OSError):
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        # Our own database, and copies or link swaps in progress
+                        if entry.name.startswith((INDEX_FILENAME, TEMP_PREFIX)):
+                            continue
+                        yield Path(entry.path), entry.stat(follow_symlinks=False)
+                except (IOError, OSError):
+                    continue
@@ -0,0 +1,189 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
+from .metrics import registry as metrics
+
+logger = logging.getLogger(__name__)
+
+# Priorities: lower is served first
+FOREGROUND = 0  # files the user is waiting on, e.g. a download that just finished
+BULK = 1        # backlog: --existing, catch-up, duplicate scans
+
+PRESSURE_PATH = "/proc/pressure/io"
+DEFAULT_PRESSURE_THRESHOLD = 10.0  # percent of time some task stalled on I/O (avg10)
+
+# How far pressure can push the rate down, and how fast it recovers
+MIN_SCALE = 1 / 16
+RECOVERY_STEP = 1 / 8
+# Lower bound for the rate measured when pressure hits with no budget set
+MIN_MEASURED_RATE = 1024 * 1024
+
+Throttle = Callable[[int, int], None]
+
+_local = threading.local()
+
+
+def current_priority() -> int:
+    """The I/O priority of work done on this thread (BULK unless set)"""
+    return getattr(_local, 'priority', BULK)
+
+
+@contextmanager
+def io_priority(priority: int) -> Iterator[None]:
+    """Run the block's I/O at priority"""
+    previous = current_priority()
+    _local.priority = priority
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def read_pressure(path: str = PRESSURE_PATH) -> Optional[float]:
+    """The "some avg10" I/O pressure in percent, or None where PSI isn't available"""
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith("some "):
+                    for field in line.split()[1:]:
+                        key, _, value = field.partition("=")
+                        if key == "avg10":
+                            return float(value)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class IOScheduler:
+    """Shares a bytes-per-second budget between the hashing and move engines.
+
+    Callers ask for bytes before reading them (a token bucket that may go
+    into debt, so large reads don't need special cases). While the budget
+    is exhausted, waiting requests are granted by priority, foreground
+    before bulk and then smallest file first. Foreground requests are
+    never held back; they only use up budget, slowing the bulk work.
+
+    Where Linux pressure stall information is available, the bulk rate
+    also adapts to the rest of the system: whenever I/O pressure is above
+    pressure_threshold the rate is halved (down to MIN_SCALE of the
+    budget, or of the throughput just measured if there is no budget),
+    and it recovers step by step once pressure drops.
+    """
+
+    def __init__(self, bytes_per_second: Optional[float] = None,
+                 pressure_threshold: Optional[float] = DEFAULT_PRESSURE_THRESHOLD,
+                 pressure_path: str = PRESSURE_PATH, interval: float = 1.0):
+        self.bytes_per_second = bytes_per_second
+        self.pressure_threshold = pressure_threshold
+        self.pressure_path = pressure_path
+        self.interval = interval
+        self.scale = 1.0
+        self.pressure: Optional[float] = None
+        self.waited = 0.0
+        self._base = bytes_per_second
+        self._tokens = 0.0
+        self._refilled = time.monotonic()
+        self._checked = self._refilled
+        self._window_bytes = 0
+        self._watch_pressure = (pressure_threshold is not None
+                                and read_pressure(pressure_path) is not None)
+        self._waiting: List[Tuple[int, int, int]] = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        metrics.gauge('io_rate_scale', lambda: self.scale)
+        metrics.gauge('io_pressure', lambda: self.pressure or 0.0)
+
+    @property
+    def rate(self) -> Optional[float]:
+        """Bytes per second bulk work may use right now; None when unlimited"""
+        if self._base is None:
+            return None
+        return self._base * self.scale
+
+    def throttle(self, priority: Optional[int] = None) -> Throttle:
+        """A callback for the engines: throttle(nbytes, file_size) before each read"""
+        if priority is None:
+            priority = current_priority()
+        return lambda nbytes, size: self.acquire(nbytes, priority, size)
+
+    def acquire(self, nbytes: int, priority: Optional[int] = None,
+                size: Optional[int] = None) -> None:
+        """Wait until nbytes of I/O fit the budget.
+
+        size is the size of the whole file being read, which orders
+        waiting bulk requests (smallest first); it defaults to nbytes.
+        """
+        if priority is None:
+            priority = current_priority()
+        with self._cond:
+            self._refill(time.monotonic())
+            if priority == FOREGROUND or (not self._waiting and
+                                          (self.rate is None or self._tokens >= 0)):
+                self._spend(nbytes)
+                return
+            ticket = (priority, nbytes if size is None else size, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            started = time.monotonic()
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    rate = self.rate
+                    if self._waiting[0] == ticket and (rate is None or self._tokens >= 0):
+                        break
+                    timeout = self.interval
+                    if rate and self._waiting[0] == ticket:
+                        timeout = min(timeout, -self._tokens / rate)
+                    self._cond.wait(max(timeout, 0.001))
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+            waited = time.monotonic() - started
+            if waited > 0.001:
+                self.waited += waited
+                metrics.inc('io_throttle_waits_total')
+            self._spend(nbytes)
+
+    def _spend(self, nbytes: int) -> None:
+        self._tokens -= nbytes
+        self._window_bytes += nbytes
+
+    def _refill(self, now: float) -> None:
+        """Add the tokens earned since the last call and re-check pressure"""
+        if now - self._checked >= self.interval:
+            self._adapt(now)
+        rate = self.rate
+        if rate is None:
+            self._tokens = 0.0
+        else:
+            # At most one second's worth of budget can be saved up
+            self._tokens = min(self._tokens + (now - self._refilled) * rate, rate)
+        self._refilled = now
+
+    def _adapt(self, now: float) -> None:
+        """Adjust the rate to the I/O pressure measured since the last check"""
+        measured = self._window_bytes / max(now - self._checked, 1e-6)
+        self._checked = now
+        self._window_bytes = 0
+        if not self._watch_pressure:
+            return
+        self.pressure = read_pressure(self.pressure_path)
+        if self.pressure is None:
+            return
+        if self.pressure > self.pressure_threshold:
+            if self._base is None:
+                # No budget: throttle relative to what we were doing
+                self._base = max(measured, MIN_MEASURED_RATE)
+                self._tokens = 0.0
+            if self.scale > MIN_SCALE:
+                logger.debug("I/O pressure %.1f%%, slowing background I/O", self.pressure)
+            self.scale = max(MIN_SCALE, self.scale / 2)
+        elif self.scale < 1.0:
+            self.scale = min(1.0, self.scale + RECOVERY_STEP)
+            if self.scale == 1.0 and self.bytes_per_second is None:
+                self._base = None
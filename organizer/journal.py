@@ -0,0 +1,450 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from stat import S_ISREG
+from typing import Dict, List, Optional, Set, Tuple
+from .mover import LINK_UNSUPPORTED, move_into_place
+from .planner import BatchPlanner, PlannedMove
+from .snapshot import cache_directory
+from .transfer import TEMP_PREFIX, copy_and_hash, files_identical, fsync_directory
+
+logger = logging.getLogger(__name__)
+
+# A journal is a file of JSON lines, one per event of a single run:
+#
+#   {"op": "run", "source": ..., "target": ..., "started": ...}   header
+#   {"op": "plan", "id": 0, "src": ..., "dst": ..., ...}          a planned move, with "dup"
+#                                                                 the copy it duplicates
+#   {"op": "done", "id": 0, "dst": ...}                           where it ended up
+#   {"op": "failed", "id": 0}
+#   {"op": "end"}                                                 run completed
+#   {"op": "undone", "id": 0}, {"op": "undo_end"}                 undo progress
+#
+# The plan is fsync'ed before the first move. Outcomes are fsync'ed in
+# groups: one that is lost in a crash is worked out again from the disk
+# on resume, so moves never wait for the journal.
+
+JOURNAL_SUFFIX = ".journal"
+COMMIT_RECORDS = 256
+COMMIT_INTERVAL = 1.0  # seconds
+# Coarse file systems round mtimes down (FAT to 2 s)
+MTIME_SLACK = 2.0  # seconds
+# Completed runs kept for undo; interrupted ones are kept until resumed
+KEEP_RUNS = 20
+
+
+def default_journal_dir(cache_dir: Optional[str] = None) -> Path:
+    """Where run journals are kept, in the user's cache directory by default"""
+    return cache_directory(cache_dir) / "journal"
+
+
+class JournalRun:
+    """A run as read back from its journal"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.run_id = self.path.name[:-len(JOURNAL_SUFFIX)]
+        self.source_dir: Optional[Path] = None
+        self.target_dir: Optional[Path] = None
+        self.started: Optional[float] = None
+        self.moves: Dict[int, PlannedMove] = {}
+        self.done: Dict[int, Path] = {}
+        self.failed: Set[int] = set()
+        self.undone: Set[int] = set()
+        self.finished = False
+        self.undo_finished = False
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError):
+                    # Only the last line can be torn, by a crash mid-write
+                    logger.debug("Skipping damaged record in %s", self.path)
+
+    def _apply(self, record: Dict) -> None:
+        op = record["op"]
+        if op == "run":
+            self.source_dir = Path(record["source"])
+            self.target_dir = Path(record["target"])
+            self.started = record["started"]
+        elif op == "plan":
+            self.moves[record["id"]] = PlannedMove(
+                Path(record["src"]), Path(record["dst"]), record["category"],
+                record["same_device"], record["inode"], record["size"], record["mtime_ns"],
+                Path(record["dup"]) if record.get("dup") else None)
+        elif op == "done":
+            self.done[record["id"]] = Path(record["dst"])
+        elif op == "failed":
+            self.failed.add(record["id"])
+        elif op == "end":
+            self.finished = True
+        elif op == "undone":
+            self.undone.add(record["id"])
+        elif op == "undo_end":
+            self.undo_finished = True
+
+    @property
+    def interrupted(self) -> bool:
+        """True if the run stopped part way and hasn't been undone since"""
+        return not self.finished and not self.undo_finished
+
+    def pending(self) -> List[int]:
+        """Ids of the planned moves with no recorded outcome"""
+        return [move_id for move_id in self.moves
+                if move_id not in self.done and move_id not in self.failed]
+
+
+class MoveJournal:
+    """Append-only journal of one batch run, written as the run goes"""
+
+    def __init__(self, path: Path, commit_records: int = COMMIT_RECORDS,
+                 commit_interval: float = COMMIT_INTERVAL):
+        self.path = Path(path)
+        self.commit_records = commit_records
+        self.commit_interval = commit_interval
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._ids: Dict[Path, int] = {}
+        self._buffer: List[str] = []
+        self._committed = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, journal_dir: Path, source_dir: Path, target_dir: Path) -> "MoveJournal":
+        """Start the journal of a new run"""
+        journal_dir = Path(journal_dir)
+        journal_dir.mkdir(parents=True, exist_ok=True)
+        # Sortable by start time; the pid keeps concurrent runs apart
+        run_id = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{os.getpid()}"
+        journal = cls(journal_dir / f"{run_id}{JOURNAL_SUFFIX}")
+        journal._append({"op": "run", "source": os.path.abspath(source_dir),
+                         "target": os.path.abspath(target_dir), "started": time.time()})
+        return journal
+
+    @classmethod
+    def reopen(cls, run: JournalRun) -> "MoveJournal":
+        """Continue the journal of a run read back with JournalRun"""
+        journal = cls(run.path)
+        journal._ids = {move.source: move_id for move_id, move in run.moves.items()}
+        with open(run.path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # End a line torn by the crash before appending to it
+                    journal._file.write("\n")
+        return journal
+
+    @property
+    def run_id(self) -> str:
+        return self.path.name[:-len(JOURNAL_SUFFIX)]
+
+    def begin(self, plan: List[PlannedMove]) -> None:
+        """Record the planned moves not in the journal yet, durably"""
+        with self._lock:
+            for move in plan:
+                if move.source in self._ids:
+                    continue
+                move_id = self._ids[move.source] = len(self._ids)
+                self._buffer.append(json.dumps({
+                    "op": "plan", "id": move_id, "src": str(move.source),
+                    "dst": str(move.target), "category": move.category,
+                    "same_device": move.same_device, "inode": move.inode,
+                    "size": move.size, "mtime_ns": move.mtime_ns,
+                    "dup": str(move.duplicate_of) if move.duplicate_of else None}))
+            self._commit()
+        fsync_directory(self.path.parent)
+
+    def done(self, source_path: Path, target_path: Path) -> None:
+        self._append({"op": "done", "id": self._ids[source_path], "dst": str(target_path)})
+
+    def failed(self, source_path: Path) -> None:
+        self._append({"op": "failed", "id": self._ids[source_path]})
+
+    def undone(self, move_id: int) -> None:
+        self._append({"op": "undone", "id": move_id})
+
+    def finish(self, op: str = "end") -> None:
+        """Mark the run (or with op="undo_end", its undo) as complete"""
+        self._append({"op": op})
+        self.commit()
+
+    def commit(self) -> None:
+        """Write and fsync everything recorded so far"""
+        with self._lock:
+            self._commit()
+
+    def close(self) -> None:
+        self.commit()
+        self._file.close()
+
+    def _append(self, record: Dict) -> None:
+        with self._lock:
+            self._buffer.append(json.dumps(record))
+            if (len(self._buffer) >= self.commit_records
+                    or time.monotonic() - self._committed >= self.commit_interval):
+                self._commit()
+
+    def _commit(self) -> None:
+        if self._buffer:
+            self._file.write("\n".join(self._buffer) + "\n")
+            self._buffer = []
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._committed = time.monotonic()
+
+
+def list_runs(journal_dir: Path) -> List[JournalRun]:
+    """Every run journaled in journal_dir, oldest first"""
+    try:
+        names = sorted(name for name in os.listdir(journal_dir) if name.endswith(JOURNAL_SUFFIX))
+    except FileNotFoundError:
+        return []
+    return [JournalRun(Path(journal_dir) / name) for name in names]
+
+
+def prune_runs(journal_dir: Path, keep: int = KEEP_RUNS) -> int:
+    """Delete the journals of all but the latest keep completed runs, returning how many.
+
+    A run that was undone counts as completed. Interrupted runs are never
+    pruned, since resume and undo both still need them.
+    """
+    completed = [run for run in list_runs(journal_dir) if not run.interrupted]
+    pruned = 0
+    for run in completed[:max(len(completed) - keep, 0)]:
+        try:
+            run.path.unlink()
+        except FileNotFoundError:
+            continue
+        pruned += 1
+    return pruned
+
+
+def find_interrupted(journal_dir: Path, source_dir: Path,
+                     target_dir: Path) -> Optional[JournalRun]:
+    """The latest interrupted run from source_dir to target_dir, if any"""
+    source_dir = Path(os.path.abspath(source_dir))
+    target_dir = Path(os.path.abspath(target_dir))
+    for run in reversed(list_runs(journal_dir)):
+        if run.source_dir == source_dir and run.target_dir == target_dir:
+            return run if run.interrupted else None
+    return None
+
+
+def _stat(path: Path) -> Optional[os.stat_result]:
+    try:
+        return os.stat(path, follow_symlinks=False)
+    except OSError:
+        return None
+
+
+def _is_original(stat: os.stat_result, move: PlannedMove) -> bool:
+    """Is this the planned source itself (or, same-device, a link to it)"""
+    return (stat.st_ino == move.inode and stat.st_size == move.size
+            and stat.st_mtime_ns == move.mtime_ns)
+
+
+def _is_placed(stat: os.stat_result, move: PlannedMove) -> bool:
+    """Could this be the moved file: a link to the source, or a copy with its size and mtime"""
+    if move.same_device:
+        return _is_original(stat, move)
+    return stat.st_size == move.size and stat.st_mtime_ns == move.mtime_ns
+
+
+class _Recovery:
+    """Looks for the moved files of interrupted moves, listing each target directory once"""
+
+    def __init__(self, started: Optional[float]):
+        self.started = started
+        self._listings: Dict[Path, List[str]] = {}
+
+    def find_target(self, move: PlannedMove) -> Optional[Tuple[Path, os.stat_result]]:
+        """Where the move put the file: its planned name or, if that was taken, stem_NNN"""
+        stat = _stat(move.target)
+        if stat is not None and _is_placed(stat, move):
+            return move.target, stat
+        directory = move.target.parent
+        prefix, suffix = move.target.stem + "_", move.target.suffix
+        for name in self._listing(directory):
+            if name.startswith(prefix) and name.endswith(suffix):
+                path = directory / name
+                stat = _stat(path)
+                if stat is not None and _is_placed(stat, move):
+                    return path, stat
+        return None
+
+    def remove_placeholders(self, move: PlannedMove) -> None:
+        """Delete the names a cross-device move reserved for a copy that never started.
+
+        A reserved name is the planned one or stem_NNN, left empty and
+        created during the run; a finished copy keeps its source's mtime.
+        """
+        if self.started is None:
+            return
+        directory = move.target.parent
+        stem, suffix = move.target.stem + "_", move.target.suffix
+        listing = self._listing(directory)
+        for name in list(listing):
+            if name != move.target.name and not (
+                    name.startswith(stem) and name.endswith(suffix)
+                    and name[len(stem):len(name) - len(suffix)].isdigit()):
+                continue
+            stat = _stat(directory / name)
+            if (stat is None or not S_ISREG(stat.st_mode) or stat.st_size
+                    or stat.st_mtime < self.started - MTIME_SLACK):
+                continue
+            try:
+                os.unlink(directory / name)
+                listing.remove(name)
+                logger.info("Removed placeholder %s", directory / name)
+            except OSError:
+                pass
+
+    def remove_temporaries(self, directory: Path) -> None:
+        """Delete the partial copies interrupted moves left in directory"""
+        for name in self._listing(directory):
+            if name.startswith(TEMP_PREFIX):
+                try:
+                    os.unlink(directory / name)
+                    logger.info("Removed partial copy %s", directory / name)
+                except OSError:
+                    pass
+
+    def _listing(self, directory: Path) -> List[str]:
+        listing = self._listings.get(directory)
+        if listing is None:
+            try:
+                listing = os.listdir(directory)
+            except OSError:
+                listing = []
+            self._listings[directory] = listing
+        return listing
+
+
+def recover(run: JournalRun, journal: MoveJournal) -> Tuple[List[Path], List[PlannedMove]]:
+    """Settle the moves an interrupted run left without an outcome.
+
+    Nothing is scanned: each pending move is checked on disk. A move that
+    had placed its file is finished (the source removed if a crash came
+    between placing and unlinking) and recorded as done; one that hadn't
+    is rolled back, losing its placeholder and any partial copy, and
+    returned to be done again. Moves whose source is gone are failed.
+    Returns the targets completed now and the moves still to do.
+    """
+    recovery = _Recovery(run.started)
+    completed: List[Path] = []
+    remaining: List[PlannedMove] = []
+    copy_dirs = set()
+    for move_id in run.pending():
+        move = run.moves[move_id]
+        source_stat = _stat(move.source)
+        original = source_stat is not None and _is_original(source_stat, move)
+        found = recovery.find_target(move)
+        if found is not None and original:
+            target_path, target_stat = found
+            if (os.path.samestat(source_stat, target_stat)
+                    or (not move.same_device and files_identical(move.source, target_path))):
+                os.unlink(move.source)
+                fsync_directory(move.source.parent)
+            else:
+                found = None
+        if found is not None:
+            journal.done(move.source, found[0])
+            run.done[move_id] = found[0]
+            completed.append(found[0])
+        elif original:
+            # Same-device moves link rather than reserve, so only copies
+            # leave placeholders behind
+            if not move.same_device:
+                recovery.remove_placeholders(move)
+                copy_dirs.add(move.target.parent)
+            remaining.append(move)
+        else:
+            logger.warning("Cannot resume move of %s: the file is gone", move.source)
+            journal.failed(move.source)
+            run.failed.add(move_id)
+    for directory in copy_dirs:
+        recovery.remove_temporaries(directory)
+    journal.commit()
+    return completed, remaining
+
+
+def resume_run(run: JournalRun, planner: BatchPlanner) -> Tuple[int, int]:
+    """Finish an interrupted run from its journal, returning (moved, failed)"""
+    journal = MoveJournal.reopen(run)
+    failed_before = len(run.failed)
+    try:
+        completed, remaining = recover(run, journal)
+        if completed and planner.mover.index is not None:
+            planner.mover.index.add_many((path, None) for path in completed)
+        moved, failed = planner.execute(remaining, journal)
+    finally:
+        journal.close()
+    return moved + len(completed), failed + len(run.failed) - failed_before
+
+
+def _move_back(target_path: Path, source_path: Path, keep: bool = False) -> None:
+    """Move (with keep, copy) target_path to source_path, never replacing a file there"""
+    source_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(target_path, source_path, follow_symlinks=False)
+    except OSError as e:
+        if e.errno not in LINK_UNSUPPORTED:
+            raise
+        # Cross-device: claim the name, then copy onto it
+        fd = os.open(source_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        os.close(fd)
+        try:
+            if keep:
+                copy_and_hash(target_path, source_path)
+            else:
+                move_into_place(target_path, source_path)
+        except BaseException:
+            os.unlink(source_path)
+            raise
+        return
+    if not keep:
+        os.unlink(target_path)
+
+
+def undo_run(run: JournalRun) -> Tuple[int, int]:
+    """Move every file of a run back to where it came from, returning (restored, failed).
+
+    Moves the run left in flight are settled first, as for a resume, and
+    the rest of an interrupted plan is dropped. Files whose original name
+    has been reused since are left in place and counted as failed. Undo
+    is journaled too, so an interrupted undo can simply be run again.
+    """
+    journal = MoveJournal.reopen(run)
+    restored = failed = 0
+    try:
+        if run.interrupted:
+            recover(run, journal)
+        touched = set()
+        for move_id in sorted(run.done, reverse=True):
+            if move_id in run.undone:
+                continue
+            move = run.moves[move_id]
+            target_path = run.done[move_id]
+            try:
+                # A duplicate that replaced its copy: the copy stays where it was
+                _move_back(target_path, move.source, keep=target_path == move.duplicate_of)
+            except OSError as e:
+                logger.error("Cannot restore %s to %s: %s", target_path, move.source, e)
+                failed += 1
+                continue
+            journal.undone(move_id)
+            run.undone.add(move_id)
+            touched.update((move.source.parent, target_path.parent))
+            restored += 1
+        for directory in touched:
+            fsync_directory(directory)
+        if not failed:
+            journal.finish("undo_end")
+            run.undo_finished = True
+    finally:
+        journal.close()
+    return restored, failed
@@ -0,0 +1,258 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, Prometheus style
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Pipeline stages timed by the watcher, in order
+STAGES = ('detect', 'stabilize', 'categorize', 'dedupe', 'move')
+
+
+class Histogram:
+    """Cumulative-bucket histogram of observed values"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            cumulative, running = [], 0
+            for count in self.counts:
+                running += count
+                cumulative.append(running)
+            return {'buckets': list(zip(self.buckets + (float('inf'),), cumulative)),
+                    'sum': self.total, 'count': self.count}
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class MetricsRegistry:
+    """Counters, gauges and latency histograms for the organizer.
+
+    Disabled by default: every call then returns straight away (time()
+    hands back one shared no-op context manager), so instrumented hot
+    paths cost a single attribute check.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._counters: Dict[str, float] = {}
+        self._histograms: Dict[str, Histogram] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._gauges.clear()
+
+    def inc(self, name: str, amount: float = 1) -> None:
+        """Add amount to a counter"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def observe(self, name: str, value: float) -> None:
+        """Record a value (usually seconds) in a histogram"""
+        if not self.enabled:
+            return
+        self._histogram(name).observe(value)
+
+    def time(self, name: str):
+        """Context manager recording the block's duration in a histogram"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self._histogram(name))
+
+    def gauge(self, name: str, func: Callable[[], float]) -> None:
+        """Register a callable sampled whenever metrics are read"""
+        with self._lock:
+            self._gauges[name] = func
+
+    def snapshot(self) -> Dict[str, object]:
+        """Current values of every metric, as plain data"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = dict(self._histograms)
+            gauges = dict(self._gauges)
+        sampled = {}
+        for name, func in gauges.items():
+            try:
+                sampled[name] = func()
+            except Exception:
+                logger.debug("Gauge %s failed", name, exc_info=True)
+        return {
+            'counters': counters,
+            'gauges': sampled,
+            'histograms': {name: h.snapshot() for name, h in histograms.items()},
+        }
+
+    def render_prometheus(self, prefix: str = 'organizer_') -> str:
+        """Metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines: List[str] = []
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f"# TYPE {prefix}{name} counter")
+            lines.append(f"{prefix}{name} {value}")
+        for name, value in sorted(snapshot['gauges'].items()):
+            lines.append(f"# TYPE {prefix}{name} gauge")
+            lines.append(f"{prefix}{name} {value}")
+        for name, data in sorted(snapshot['histograms'].items()):
+            metric = f"{prefix}{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for bound, count in data['buckets']:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{metric}_bucket{{le="{le}"}} {count}')
+            lines.append(f"{metric}_sum {data['sum']}")
+            lines.append(f"{metric}_count {data['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write_stats_file(self, path: Path) -> None:
+        """Atomically write a JSON snapshot to path"""
+        path = Path(path)
+        tmp_path = path.with_name(path.name + '.tmp')
+        snapshot = self.snapshot()
+        snapshot['histograms'] = {
+            name: {**data, 'buckets': [[str(b), c] for b, c in data['buckets']]}
+            for name, data in snapshot['histograms'].items()
+        }
+        snapshot['time'] = time.time()
+        tmp_path.write_text(json.dumps(snapshot, indent=2))
+        tmp_path.replace(path)
+
+    def _histogram(self, name: str) -> Histogram:
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram())
+        return histogram
+
+
+registry = MetricsRegistry()
+
+
+class MetricsExporter:
+    """Expose the registry over local HTTP (/metrics) and/or a stats file"""
+
+    def __init__(self, registry: MetricsRegistry = registry, port: Optional[int] = None,
+                 host: str = '127.0.0.1', stats_file: Optional[Path] = None,
+                 interval: float = 10.0):
+        self.registry = registry
+        self.port = port
+        self.host = host
+        self.stats_file = Path(stats_file) if stats_file else None
+        self.interval = interval
+        self._server: Optional["ThreadingHTTPServer"] = None
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        self.registry.enable()
+        if self.port is not None:
+            from http.server import ThreadingHTTPServer
+            self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+            self.port = self._server.server_address[1]
+            self._start_thread(self._server.serve_forever, "organizer-metrics-http")
+            logger.info("Serving metrics on http://%s:%d/metrics", self.host, self.port)
+        if self.stats_file is not None:
+            self._start_thread(self._write_loop, "organizer-metrics-file")
+            logger.info("Writing metrics to %s every %ss", self.stats_file, self.interval)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        if self.stats_file is not None:
+            self.registry.write_stats_file(self.stats_file)
+
+    def _start_thread(self, target, name: str) -> None:
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _write_loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.registry.write_stats_file(self.stats_file)
+            except OSError as e:
+                logger.warning("Could not write stats file %s: %s", self.stats_file, e)
+
+    def _handler(self):
+        from http.server import BaseHTTPRequestHandler
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("metrics: " + format, *args)
+
+        return Handler
@@ -1,98 +1,381 @@
+import errno
+import logging
 import shutil
 import os
+import re
+import threading
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, Optional, Set, Tuple
 from datetime import datetime
+from .index import DuplicateIndex
+from .iosched import IOScheduler, Throttle
+from .transfer import files_identical, link_or_clone, move_across_devices
+
+logger = logging.getLogger(__name__)
+
+_SUFFIX_RE = re.compile(r"^(?P<stem>.*)_(?P<counter>\d{3,})$")
+
+class NameIndex:
+    """Per-directory record of names in use, for O(1) unique-name allocation.
+    
+    Each directory is listed once, the first time a name is needed in it;
+    after that allocation only consults the in-memory set and the highest
+    stem_NNN counter seen for each (stem, suffix). Names are then taken on
+    disk atomically, so concurrent movers (or other processes) can never be
+    handed the same path: link() hard-links the source at the new name,
+    which fails if it exists; reserve() creates an O_EXCL placeholder for
+    when linking isn't possible (cross-device, or no hard-link support).
+    """
+    
+    def __init__(self):
+        self._names: Dict[Path, Set[str]] = {}
+        self._counters: Dict[Path, Dict[Tuple[str, str], int]] = {}
+        self._lock = threading.Lock()
+    
+    def allocate(self, directory: Path, filename: str) -> str:
+        """Pick a free name in directory and mark it as used (no disk access)"""
+        with self._lock:
+            names, counters = self._load(directory)
+            if filename not in names:
+                chosen = filename
+            else:
+                path = Path(filename)
+                key = (path.stem, path.suffix)
+                counter = counters.get(key, 0) + 1
+                chosen = f"{path.stem}_{counter:03d}{path.suffix}"
+                while chosen in names:
+                    counter += 1
+                    chosen = f"{path.stem}_{counter:03d}{path.suffix}"
+            self._add(names, counters, chosen)
+            return chosen
+    
+    def claim(self, target_path: Path) -> bool:
+        """Atomically create an empty placeholder at target_path.
+        
+        Returns False if something already exists there.
+        """
+        try:
+            fd = os.open(target_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            self.taken(target_path)
+            return False
+        os.close(fd)
+        return True
+    
+    def link(self, source_path: Path, target_path: Path) -> bool:
+        """Hard-link source_path at target_path; False if the name is taken.
+        
+        Other errors (EXDEV, no hard-link support, ...) are raised with the
+        name given back.
+        """
+        try:
+            os.link(source_path, target_path, follow_symlinks=False)
+        except FileExistsError:
+            self.taken(target_path)
+            return False
+        except OSError:
+            self.discard(target_path)
+            raise
+        return True
+    
+    def link_unique(self, source_path: Path, directory: Path, filename: str) -> Path:
+        """Hard-link source_path under a newly allocated unique name in directory"""
+        while True:
+            target_path = directory / self.allocate(directory, filename)
+            if self.link(source_path, target_path):
+                return target_path
+    
+    def reserve(self, directory: Path, filename: str) -> Path:
+        """Allocate a unique name in directory and claim it on disk"""
+        while True:
+            target_path = directory / self.allocate(directory, filename)
+            if self.claim(target_path):
+                return target_path
+    
+    def taken(self, target_path: Path) -> None:
+        """Note that target_path turned out to exist on disk"""
+        with self._lock:
+            names, counters = self._load(target_path.parent)
+            self._add(names, counters, target_path.name)
+    
+    def release(self, target_path: Path) -> None:
+        """Give back a name whose move failed, removing its placeholder"""
+        try:
+            if target_path.stat().st_size == 0:
+                target_path.unlink()
+        except OSError:
+            pass
+        self.discard(target_path)
+    
+    def discard(self, target_path: Path) -> None:
+        """Mark a name allocated in memory as free again"""
+        with self._lock:
+            names = self._names.get(target_path.parent)
+            if names is not None:
+                names.discard(target_path.name)
+    
+    def forget(self, directory: Path) -> None:
+        """Drop the cached listing for directory"""
+        with self._lock:
+            self._names.pop(directory, None)
+            self._counters.pop(directory, None)
+    
+    def _load(self, directory: Path) -> Tuple[Set[str], Dict[Tuple[str, str], int]]:
+        names = self._names.get(directory)
+        if names is None:
+            names = self._names[directory] = set()
+            counters = self._counters[directory] = {}
+            try:
+                listing = os.listdir(directory)
+            except OSError:
+                listing = []
+            for name in listing:
+                self._add(names, counters, name)
+        return names, self._counters[directory]
+    
+    def _add(self, names: Set[str], counters: Dict[Tuple[str, str], int], name: str) -> None:
+        names.add(name)
+        path = Path(name)
+        match = _SUFFIX_RE.match(path.stem)
+        if match:
+            key = (match.group("stem"), path.suffix)
+            counter = int(match.group("counter"))
+            if counter > counters.get(key, 0):
+                counters[key] = counter
+
+def move_into_place(source_path: Path, target_path: Path,
+                    algorithm: Optional[str] = None,
+                    verify: bool = False,
+                    throttle: Optional[Throttle] = None) -> Optional[str]:
+    """Move source_path onto target_path (usually a reserved placeholder).
+    
+    Same-filesystem moves are a rename and return None. Cross-device moves
+    copy and hash in one pass and return the digest when an algorithm is given.
+    """
+    try:
+        os.replace(source_path, target_path)
+        return None
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    return move_across_devices(source_path, target_path, algorithm, verify, throttle)
+
+# link() errors meaning "can't hard-link here", not "something went wrong"
+LINK_UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOSYS,
+                    getattr(errno, 'ENOTSUP', errno.EPERM),
+                    getattr(errno, 'EOPNOTSUPP', errno.EPERM)}
 
 class FileMover:
-    def __init__(self, target_base_dir: Path, create_date_folders: bool = False):
+    def __init__(self, target_base_dir: Path, create_date_folders: bool = False,
+                 index: Optional[DuplicateIndex] = None, verify_copies: bool = False,
+                 scheduler: Optional[IOScheduler] = None):
         self.target_base_dir = Path(target_base_dir)
         self.create_date_folders = create_date_folders
+        self.index = index
+        self.verify_copies = verify_copies
+        # Paces cross-device copies; renames and links cost no data I/O
+        self.scheduler = scheduler
+        # Cross-device copies hash on the fly when the digest can go to the index
+        self.copy_algorithm = index.algorithm if index is not None else None
+        self.names = NameIndex()
         self.target_base_dir.mkdir(parents=True, exist_ok=True)
     
     def get_target_directory(self, category: str, file_path: Path) -> Path:
         """Determine target directory for a file"""
+        mtime = None
+        if self.create_date_folders:
+            try:
+                mtime = file_path.stat().st_mtime
+            except OSError:
+                pass
+        
+        target_dir = self.plan_target_directory(category, mtime)
+        target_dir.mkdir(parents=True, exist_ok=True)
+        return target_dir
+    
+    def plan_target_directory(self, category: str, mtime: Optional[float] = None) -> Path:
+        """Target directory for a file with the given mtime, without creating it"""
         target_dir = self.target_base_dir / category
         
         if self.create_date_folders:
             # Create date-based subdirectories
             try:
-                modified_time = datetime.fromtimestamp(file_path.stat().st_mtime)
-                date_folder = modified_time.strftime("%Y/%m")
-                target_dir = target_dir / date_folder
-            except (OSError, ValueError):
+                modified_time = datetime.fromtimestamp(mtime)
+            except (TypeError, OSError, ValueError, OverflowError):
                 # Fall back to current date if file stat fails
-                date_folder = datetime.now().strftime("%Y/%m")
-                target_dir = target_dir / date_folder
+                modified_time = datetime.now()
+            target_dir = target_dir / modified_time.strftime("%Y/%m")
         
-        target_dir.mkdir(parents=True, exist_ok=True)
         return target_dir
     
     def get_unique_filename(self, target_dir: Path, filename: str) -> str:
         """Generate unique filename if file already exists"""
-        target_path = target_dir / filename
+        return self.names.allocate(target_dir, filename)
+    
+    def transfer(self, source_path: Path, target_path: Path) -> Optional[str]:
+        """Move a file onto target_path, returning its digest if one was computed"""
+        throttle = self.scheduler.throttle() if self.scheduler is not None else None
+        return move_into_place(source_path, target_path,
+                               self.copy_algorithm, self.verify_copies, throttle)
+    
+    def place(self, source_path: Path, target_path: Path) -> Tuple[Path, Optional[str]]:
+        """Move a file to target_path, or to the next free name beside it if taken.
         
-        if not target_path.exists():
-            return filename
+        target_path should already be allocated in self.names. On the same
+        filesystem this is link + unlink, which claims the name atomically
+        without creating a placeholder; otherwise the name is reserved and
+        the file copied. Returns the final path and the digest, if one was
+        computed while copying.
+        """
+        directory = target_path.parent
+        try:
+            if not self.names.link(source_path, target_path):
+                target_path = self.names.link_unique(source_path, directory, source_path.name)
+        except OSError as e:
+            if e.errno not in LINK_UNSUPPORTED:
+                raise
+            if not self.names.claim(target_path):
+                target_path = self.names.reserve(directory, source_path.name)
+            return target_path, self._move_reserved(source_path, target_path)
         
-        # Extract name and extension
-        stem = target_path.stem
-        suffix = target_path.suffix
-        counter = 1
+        try:
+            os.unlink(source_path)
+        except OSError:
+            os.unlink(target_path)
+            self.names.discard(target_path)
+            raise
+        return target_path, None
+    
+    def _move_reserved(self, source_path: Path, target_path: Path) -> Optional[str]:
+        """Move onto a reserved name, giving the name back if the move fails"""
+        try:
+            return self.transfer(source_path, target_path)
+        except BaseException:
+            self.names.release(target_path)
+            raise
+    
+    def _link_duplicate(self, source_path: Path, existing_path: Path, mode: str,
+                        target_path: Optional[Path] = None) -> Tuple[Optional[Path], Optional[str]]:
+        """Link existing_path under a free name for source_path, then drop the source.
         
+        target_path, if given, is a name already allocated for it. Returns
+        the new path and the method used, or (None, None) if the target
+        filesystem supports neither reflinks nor hard links.
+        """
+        directory = existing_path.parent
         while True:
-            new_filename = f"{stem}_{counter:03d}{suffix}"
-            new_target_path = target_dir / new_filename
-            if not new_target_path.exists():
-                return new_filename
-            counter += 1
+            if target_path is None:
+                target_path = directory / self.names.allocate(directory, source_path.name)
+            try:
+                method = link_or_clone(existing_path, target_path, mode)
+                break
+            except FileExistsError:
+                self.names.taken(target_path)
+                target_path = None
+            except OSError as e:
+                self.names.discard(target_path)
+                if e.errno in LINK_UNSUPPORTED:
+                    return None, None
+                raise
+        try:
+            os.unlink(source_path)
+        except OSError:
+            os.unlink(target_path)
+            self.names.discard(target_path)
+            raise
+        return target_path, method
+    
+    def _record(self, target_path: Path, digest: Optional[str] = None) -> None:
+        """Keep the duplicate index in step with the target tree"""
+        if self.index is not None:
+            self.index.add(target_path, digest)
     
-    def move_file(self, source_path: Path, category: str) -> Tuple[bool, Optional[Path]]:
+    def move_file(self, source_path: Path, category: str,
+                  digest: Optional[str] = None) -> Tuple[bool, Optional[Path]]:
         """Move file to appropriate category directory"""
         try:
             target_dir = self.get_target_directory(category, source_path)
-            unique_filename = self.get_unique_filename(target_dir, source_path.name)
-            target_path = target_dir / unique_filename
+            target_path = target_dir / self.names.allocate(target_dir, source_path.name)
             
             # Move the file
-            shutil.move(str(source_path), str(target_path))
-            print(f"Moved: {source_path} -> {target_path}")
+            target_path, moved_digest = self.place(source_path, target_path)
+            digest = moved_digest or digest
+            self._record(target_path, digest)
+            logger.info("Moved: %s -> %s", source_path, target_path,
+                        extra={'src': source_path, 'dst': target_path, 'category': category})
             return True, target_path
             
         except (IOError, OSError, shutil.Error) as e:
-            print(f"Error moving file {source_path}: {e}")
+            logger.error("Error moving file %s: %s", source_path, e)
             return False, None
     
     def handle_duplicate(self, source_path: Path, existing_path: Path, 
-                        strategy: str = "rename") -> Tuple[bool, Optional[Path]]:
-        """Handle duplicate files based on strategy"""
+                        strategy: str = "rename", digest: Optional[str] = None,
+                        verify: bool = False,
+                        target_path: Optional[Path] = None) -> Tuple[bool, Optional[Path]]:
+        """Handle duplicate files based on strategy.
+        
+        "hardlink" and "reflink" keep the duplicate's name in the target
+        directory but point it at the existing file's data, reclaiming the
+        space; with verify the two are compared byte for byte first. Where
+        neither kind of link is possible the duplicate is renamed instead.
+        target_path is a name next to existing_path already allocated for
+        the duplicate, if the caller planned one.
+        """
         if strategy == "skip":
-            print(f"Skipping duplicate: {source_path}")
+            logger.info("Skipping duplicate: %s", source_path)
             return True, existing_path
         
         elif strategy == "rename":
             # Rename and move the file
             target_dir = existing_path.parent
-            unique_filename = self.get_unique_filename(target_dir, source_path.name)
-            target_path = target_dir / unique_filename
             
             try:
-                shutil.move(str(source_path), str(target_path))
-                print(f"Renamed and moved duplicate: {source_path} -> {target_path}")
+                if target_path is None:
+                    target_path = target_dir / self.names.allocate(target_dir, source_path.name)
+                target_path, moved_digest = self.place(source_path, target_path)
+                digest = moved_digest or digest
+                self._record(target_path, digest)
+                logger.info("Renamed and moved duplicate: %s -> %s", source_path, target_path,
+                            extra={'src': source_path, 'dst': target_path, 'duplicate_of': existing_path})
+                return True, target_path
+            except (IOError, OSError, shutil.Error) as e:
+                logger.error("Error handling duplicate %s: %s", source_path, e)
+                return False, None
+        
+        elif strategy in ("hardlink", "reflink"):
+            try:
+                if verify and not files_identical(source_path, existing_path):
+                    logger.warning("Not linking %s: contents differ from %s", source_path, existing_path)
+                    return self.handle_duplicate(source_path, existing_path, "rename", digest,
+                                                 target_path=target_path)
+                planned = target_path
+                target_path, method = self._link_duplicate(source_path, existing_path, strategy,
+                                                           target_path)
+                if target_path is None:
+                    if planned is not None:
+                        self.names.taken(planned)
+                    return self.handle_duplicate(source_path, existing_path, "rename", digest,
+                                                 target_path=planned)
+                self._record(target_path, digest)
+                logger.info("Linked duplicate (%s): %s -> %s", method, source_path, target_path,
+                            extra={'src': source_path, 'dst': target_path,
+                                   'duplicate_of': existing_path, 'method': method})
                 return True, target_path
             except (IOError, OSError, shutil.Error) as e:
-                print(f"Error handling duplicate {source_path}: {e}")
+                logger.error("Error linking duplicate %s: %s", source_path, e)
                 return False, None
         
         elif strategy == "replace":
             # Replace existing file
             try:
-                existing_path.unlink()  # Delete existing file
-                shutil.move(str(source_path), str(existing_path))
-                print(f"Replaced: {existing_path} with {source_path}")
+                # Atomic on the same filesystem: existing_path is never missing
+                digest = self.transfer(source_path, existing_path) or digest
+                self._record(existing_path, digest)
+                logger.info("Replaced: %s with %s", existing_path, source_path)
                 return True, existing_path
             except (IOError, OSError, shutil.Error) as e:
-                print(f"Error replacing file {existing_path}: {e}")
+                logger.error("Error replacing file %s: %s", existing_path, e)
                 return False, None
         
         return False, None
\ No newline at end of file
@@ -0,0 +1,264 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from stat import S_ISREG
+from typing import TYPE_CHECKING, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+from .categorizer import FileCategorizer
+from .index import DuplicateIndex
+from .mover import FileMover
+from .snapshot import DirectorySnapshot
+from .transfer import TEMP_PREFIX
+
+if TYPE_CHECKING:
+    from .journal import MoveJournal
+
+logger = logging.getLogger(__name__)
+
+# Duplicate strategies left to FileMover.handle_duplicate, after the other moves
+DEFERRED_STRATEGIES = ("hardlink", "reflink", "replace")
+
+
+class PlannedMove(NamedTuple):
+    source: Path
+    target: Path
+    category: str
+    same_device: bool
+    # The source as planned, to recognise it (or its copy) after a crash
+    inode: int = 0
+    size: int = 0
+    mtime_ns: int = 0
+    # An identical file already in (or planned for) the target directory
+    duplicate_of: Optional[Path] = None
+
+
+class _DuplicateFinder:
+    """Finds a copy of each planned file among those its target directory will hold.
+
+    Copies already there are looked up in the mover's index (without one,
+    each target directory is listed once); files planned for the same
+    directory earlier in the batch count too. A file is only hashed when
+    something of its size is there to compare it with.
+    """
+
+    def __init__(self, categorizer: FileCategorizer, index: Optional[DuplicateIndex]):
+        self.hash = categorizer.get_file_hash
+        self.index = index
+        # (target directory, size) -> [file to hash, its target, digest or None]
+        self._candidates: Dict[Tuple[Path, int], List[list]] = {}
+        self._listed: Set[Path] = set()
+
+    def find(self, source: Path, size: int, target_dir: Path) -> Optional[Path]:
+        """The existing or planned copy of source under target_dir, if any"""
+        if self.index is None and target_dir not in self._listed:
+            self._listed.add(target_dir)
+            self._list(target_dir)
+        candidates = self._candidates.get((target_dir, size), [])
+        digest = self.hash(source) if candidates else None
+        if self.index is not None:
+            existing = self.index.find_duplicate(source, within=target_dir, digest=digest or None)
+            if existing is not None:
+                return existing
+        for candidate in candidates:
+            if candidate[2] is None:
+                candidate[2] = self.hash(candidate[0])
+            if digest and candidate[2] == digest:
+                return candidate[1]
+        return None
+
+    def add(self, source: Path, size: int, target_dir: Path, target: Path) -> None:
+        """Note that source is planned to become target under target_dir"""
+        self._candidates.setdefault((target_dir, size), []).append([source, target, None])
+
+    def _list(self, target_dir: Path) -> None:
+        for root, _dirs, files in os.walk(target_dir):
+            for name in files:
+                if name.startswith(TEMP_PREFIX):
+                    continue
+                path = Path(root) / name
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if S_ISREG(stat.st_mode):
+                    self.add(path, stat.st_size, target_dir, path)
+
+
+class BatchPlanner:
+    """Plan and execute moves for a whole directory at once.
+
+    The source is listed with a single os.scandir pass and every target
+    name is decided in memory, so each target directory is listed and
+    created once rather than stat'ed per file. Moves on the same
+    filesystem are a link + unlink that claims the planned name atomically;
+    cross-device copies run on a thread pool.
+
+    With handle_duplicates, a file identical to one already in its target
+    directory (or planned for it) is handled by duplicate_strategy, as the
+    watcher does: "rename" moves it next to that copy under a new name,
+    "skip" leaves it out of the plan, and "hardlink", "reflink" and
+    "replace" are carried out by FileMover.handle_duplicate once the other
+    moves are done.
+    """
+
+    def __init__(self, categorizer: FileCategorizer, mover: FileMover, jobs: int = 4,
+                 handle_duplicates: bool = False, duplicate_strategy: str = "rename",
+                 verify_duplicates: bool = False):
+        self.categorizer = categorizer
+        self.mover = mover
+        self.jobs = max(1, jobs)
+        self.handle_duplicates = handle_duplicates
+        self.duplicate_strategy = duplicate_strategy
+        self.verify_duplicates = verify_duplicates
+
+    def plan(self, source_dir: Path, recursive: bool = False,
+             snapshot: Optional[DirectorySnapshot] = None) -> List[PlannedMove]:
+        """Build the complete move plan for the files in source_dir.
+
+        With recursive, subdirectories are included too, except the target
+        tree itself when it lives inside the source. With a snapshot,
+        directories unchanged since the last scan aren't listed again.
+        """
+        target_dev = os.stat(self.mover.target_base_dir).st_dev
+        if snapshot is not None:
+            files = ((path, stat) for path, stat, _changed in
+                     snapshot.walk(source_dir, recursive, self.mover.target_base_dir))
+        else:
+            files = self._scan(source_dir, recursive)
+        duplicates = (_DuplicateFinder(self.categorizer, self.mover.index)
+                      if self.handle_duplicates else None)
+        plan = []
+        for source, stat in files:
+            category = self.categorizer.categorize_file(source, stat)
+            target_dir = self.mover.plan_target_directory(category, stat.st_mtime)
+            existing = None
+            if duplicates is not None:
+                existing = duplicates.find(source, stat.st_size, target_dir)
+            if existing is not None and self.duplicate_strategy == "skip":
+                logger.info("Skipping duplicate: %s", source)
+                continue
+            if existing is not None and self.duplicate_strategy == "replace":
+                target = existing
+            else:
+                directory = existing.parent if existing is not None else target_dir
+                target = directory / self.mover.names.allocate(directory, source.name)
+            if duplicates is not None and existing is None:
+                duplicates.add(source, stat.st_size, target_dir, target)
+            plan.append(PlannedMove(source, target, category,
+                                    stat.st_dev == target_dev, stat.st_ino,
+                                    stat.st_size, stat.st_mtime_ns, existing))
+        return plan
+
+    def _scan(self, source_dir: Path, recursive: bool) -> Iterator[Tuple[Path, os.stat_result]]:
+        """List source_dir with os.scandir, yielding each file and its stat"""
+        target_root = os.path.abspath(self.mover.target_base_dir)
+        directories = [str(source_dir)]
+        while directories:
+            directory = directories.pop()
+            try:
+                entries = os.scandir(directory)
+            except OSError as e:
+                if directory == str(source_dir):
+                    raise
+                logger.warning("Skipping unreadable directory %s: %s", directory, e)
+                continue
+            with entries:
+                for entry in entries:
+                    try:
+                        if recursive and entry.is_dir(follow_symlinks=False):
+                            if os.path.abspath(entry.path) != target_root:
+                                directories.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    yield Path(entry.path), stat
+
+    def execute(self, plan: List[PlannedMove],
+                journal: Optional["MoveJournal"] = None) -> Tuple[int, int]:
+        """Carry out a plan, returning (moved, failed) counts.
+
+        With a journal, the plan is on disk before the first move and every
+        outcome is recorded, so an interrupted run can be resumed (see
+        journal.resume_run) or undone.
+        """
+        if journal is not None:
+            journal.begin(plan)
+        for target_dir in {move.target.parent for move in plan}:
+            target_dir.mkdir(parents=True, exist_ok=True)
+
+        moved: List[Tuple[Path, Optional[str]]] = []
+        # Planned target -> where the file ended up, for duplicates of it
+        placed: Dict[Path, Path] = {}
+        failed = 0
+        copies = []
+        deferred = []
+        for move in plan:
+            if move.duplicate_of is not None and self.duplicate_strategy in DEFERRED_STRATEGIES:
+                deferred.append(move)
+                continue
+            if not move.same_device:
+                copies.append(move)
+                continue
+            result = self._place(move, journal)
+            if result is None:
+                failed += 1
+            else:
+                moved.append(result)
+                placed[move.target] = result[0]
+
+        if copies:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                for move, result in zip(copies, executor.map(
+                        lambda move: self._place(move, journal), copies)):
+                    if result is None:
+                        failed += 1
+                    else:
+                        moved.append(result)
+                        placed[move.target] = result[0]
+
+        if self.mover.index is not None:
+            self.mover.index.add_many(moved)
+
+        # After the other moves, so copies planned in this batch are in place
+        handled = 0
+        for move in deferred:
+            if self._place_duplicate(move, placed, journal):
+                handled += 1
+            else:
+                failed += 1
+        if journal is not None:
+            journal.finish()
+        return len(moved) + handled, failed
+
+    def _place_duplicate(self, move: PlannedMove, placed: Dict[Path, Path],
+                         journal: Optional["MoveJournal"] = None) -> bool:
+        existing = placed.get(move.duplicate_of, move.duplicate_of)
+        if not existing.exists():
+            # Its copy was planned in this batch but failed to move
+            return self._place(move, journal) is not None
+        target = None if move.target == move.duplicate_of else move.target
+        success, final_path = self.mover.handle_duplicate(
+            move.source, existing, self.duplicate_strategy,
+            verify=self.verify_duplicates, target_path=target)
+        if journal is not None:
+            if success:
+                journal.done(move.source, final_path)
+            else:
+                journal.failed(move.source)
+        return success
+
+    def _place(self, move: PlannedMove,
+               journal: Optional["MoveJournal"] = None) -> Optional[Tuple[Path, Optional[str]]]:
+        try:
+            result = self.mover.place(move.source, move.target)
+        except (IOError, OSError) as e:
+            logger.error("Error moving file %s: %s", move.source, e)
+            if journal is not None:
+                journal.failed(move.source)
+            return None
+        if journal is not None:
+            journal.done(move.source, result[0])
+        return result
@@ -0,0 +1,276 @@
+import fnmatch
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Union
+
+DEFAULT_CATEGORY = "Others"
+
+RULE_KEYS = ('extensions', 'patterns', 'regex', 'min_size', 'max_size',
+             'min_age_days', 'max_age_days', 'source_dirs')
+
+_SIZE_UNITS = {
+    '': 1, 'b': 1,
+    'k': 1000, 'kb': 1000, 'm': 1000 ** 2, 'mb': 1000 ** 2,
+    'g': 1000 ** 3, 'gb': 1000 ** 3, 't': 1000 ** 4, 'tb': 1000 ** 4,
+    'kib': 1024, 'mib': 1024 ** 2, 'gib': 1024 ** 3, 'tib': 1024 ** 4,
+}
+_SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([a-z]*)\s*$", re.IGNORECASE)
+
+
+def parse_size(value: Union[int, float, str, None]) -> Optional[int]:
+    """Parse a size such as 1048576, "10MB" or "1.5 GiB" into bytes"""
+    if value is None or isinstance(value, (int, float)):
+        return None if value is None else int(value)
+    match = _SIZE_RE.match(value)
+    if not match or match.group(2).lower() not in _SIZE_UNITS:
+        raise ValueError(f"Invalid size: {value!r}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).lower()])
+
+
+def _normalize_extension(ext: str) -> str:
+    return ext.lower().lstrip('.')
+
+
+class Rule:
+    """One category rule; every criterion given must hold for a match"""
+
+    __slots__ = ('category', 'extensions', 'patterns', 'regex', 'min_size',
+                 'max_size', 'min_age', 'max_age', 'source_dirs', 'pattern_re',
+                 'regex_re', 'has_conditions')
+
+    def __init__(self, category: str, spec: Union[List[str], Dict[str, Any], None]):
+        self.category = category
+        if spec is None or isinstance(spec, (list, tuple)):
+            spec = {'extensions': list(spec or [])}
+        unknown = set(spec) - set(RULE_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown keys in rule {category!r}: {sorted(unknown)}")
+
+        self.extensions = frozenset(_normalize_extension(e) for e in spec.get('extensions') or [])
+        self.patterns = [p.lower() for p in spec.get('patterns') or []]
+        self.regex = list(spec.get('regex') or [])
+        self.min_size = parse_size(spec.get('min_size'))
+        self.max_size = parse_size(spec.get('max_size'))
+        days = 24 * 3600
+        self.min_age = spec['min_age_days'] * days if spec.get('min_age_days') is not None else None
+        self.max_age = spec['max_age_days'] * days if spec.get('max_age_days') is not None else None
+        self.source_dirs = tuple(
+            os.path.abspath(os.path.expanduser(d)) for d in spec.get('source_dirs') or [])
+        # Each kind of name criterion is one alternation; a name must satisfy every kind given
+        self.pattern_re = self._compile([fnmatch.translate(p) for p in self.patterns])
+        self.regex_re = self._compile([f".*?(?:{r})" for r in self.regex])
+        self.has_conditions = self.needs_stat or bool(self.source_dirs)
+
+    @property
+    def has_name_criteria(self) -> bool:
+        return bool(self.extensions or self.patterns or self.regex)
+
+    @property
+    def combines_name_criteria(self) -> bool:
+        """True if more than one of extensions, patterns and regex is given"""
+        return (bool(self.extensions) + bool(self.patterns) + bool(self.regex)) > 1
+
+    @property
+    def needs_stat(self) -> bool:
+        return (self.min_size is not None or self.max_size is not None
+                or self.min_age is not None or self.max_age is not None)
+
+    @property
+    def can_match(self) -> bool:
+        return self.has_name_criteria or self.has_conditions
+
+    def name_alternatives(self) -> List[str]:
+        """Glob and regex patterns as regex alternatives matched from the start"""
+        alternatives = [fnmatch.translate(p) for p in self.patterns]
+        # Prefixing with a lazy .*? gives re.search semantics under re.match
+        alternatives += [f".*?(?:{r})" for r in self.regex]
+        return alternatives
+
+    def matches_name(self, lname: str) -> bool:
+        if self.extensions and not any(ext in self.extensions
+                                       for ext in extension_candidates(lname)):
+            return False
+        if self.pattern_re is not None and self.pattern_re.match(lname) is None:
+            return False
+        return self.regex_re is None or self.regex_re.match(lname) is not None
+
+    @staticmethod
+    def _compile(alternatives: List[str]) -> Optional[Pattern]:
+        return re.compile("|".join(alternatives), re.IGNORECASE) if alternatives else None
+
+    def matches_conditions(self, file_path: Path, stat: Optional[os.stat_result]) -> bool:
+        if self.source_dirs:
+            parent = os.path.abspath(str(file_path.parent))
+            if not any(parent == d or parent.startswith(d + os.sep) for d in self.source_dirs):
+                return False
+        if not self.needs_stat:
+            return True
+        if stat is None:
+            try:
+                stat = file_path.stat()
+            except OSError:
+                return False
+        if self.min_size is not None and stat.st_size < self.min_size:
+            return False
+        if self.max_size is not None and stat.st_size > self.max_size:
+            return False
+        if self.min_age is not None or self.max_age is not None:
+            age = time.time() - stat.st_mtime
+            if self.min_age is not None and age < self.min_age:
+                return False
+            if self.max_age is not None and age > self.max_age:
+                return False
+        return True
+
+    def matches(self, file_path: Path, lname: str, stat: Optional[os.stat_result]) -> bool:
+        if not self.can_match:
+            return False
+        if self.has_name_criteria and not self.matches_name(lname):
+            return False
+        return self.matches_conditions(file_path, stat)
+
+
+def extension_candidates(lname: str, max_parts: int = 3) -> List[str]:
+    """Possible extensions of a lowercased name, longest first: tar.gz, gz"""
+    candidates = []
+    end = len(lname)
+    pos = lname.rfind('.', 0, end)
+    while pos > 0 and len(candidates) < max_parts:
+        candidates.append(lname[pos + 1:])
+        pos = lname.rfind('.', 0, pos)
+    candidates.reverse()
+    return [c for c in candidates if c]
+
+
+class RuleEngine:
+    """Category rules compiled into a fast first-match classifier.
+
+    Rules are tried in config order and the first match wins. A rule is
+    either a plain list of extensions or a mapping with any of RULE_KEYS.
+    Extensions (including compound ones such as tar.gz) become one dict
+    lookup, all name patterns one alternation regex, and stat() is only
+    called when the winning rule has a size or age condition.
+    """
+
+    def __init__(self, rules: Dict[str, Union[List[str], Dict[str, Any]]],
+                 default: str = DEFAULT_CATEGORY):
+        self.default = default
+        self.rules = [Rule(category, spec) for category, spec in rules.items()]
+        count = len(self.rules)
+
+        # First rule index for each extension
+        self.extension_map: Dict[str, int] = {}
+        for i, rule in enumerate(self.rules):
+            for ext in rule.extensions:
+                self.extension_map.setdefault(ext, i)
+        self.max_extension_parts = max(
+            (ext.count('.') + 1 for ext in self.extension_map), default=1)
+
+        # One alternation; the leftmost alternative that matches is the earliest rule
+        alternatives = []
+        self._group_rule: Dict[str, int] = {}
+        for i, rule in enumerate(self.rules):
+            for k, alternative in enumerate(rule.name_alternatives()):
+                group = f"_r{i}_{k}"
+                self._group_rule[group] = i
+                alternatives.append(f"(?P<{group}>{alternative})")
+        try:
+            self._pattern_re = (re.compile("|".join(alternatives), re.IGNORECASE)
+                                if alternatives else None)
+        except re.error as e:
+            raise ValueError(f"Invalid rule pattern: {e}")
+
+        # Rules with only size/age/source conditions can match any name
+        self._first_nameless = next(
+            (i for i, rule in enumerate(self.rules)
+             if rule.can_match and not rule.has_name_criteria), count)
+        self._none = count
+        self._extension_get = self.extension_map.get
+        self._pattern_match = self._pattern_re.match if self._pattern_re is not None else None
+        # The regex can only win if some pattern rule precedes the best candidate so far
+        self._first_pattern_rule = min(self._group_rule.values(), default=count)
+
+        # Extensions whose answer can't depend on anything else in the name:
+        # nothing earlier could match instead, no compound extension ends with
+        # them and their rule has no conditions or other name criteria. These
+        # resolve in one lookup.
+        compound_tails = {ext.rsplit('.', 1)[1] for ext in self.extension_map if '.' in ext}
+        self._final = {
+            ext: self.rules[index].category
+            for ext, index in self.extension_map.items()
+            if '.' not in ext and ext not in compound_tails
+            and index < self._first_pattern_rule and index < self._first_nameless
+            and not self.rules[index].has_conditions
+            and not self.rules[index].combines_name_criteria
+        }
+        self._final_get = self._final.get
+
+    def classify(self, file_path: Path, stat: Optional[os.stat_result] = None) -> str:
+        """Return the category of the first rule matching file_path"""
+        return self.classify_name(file_path.name, file_path, stat)
+
+    def classify_names(self, names: Iterable[str]) -> List[str]:
+        """Classify many bare names; the common single-lookup case is inlined"""
+        final_get = self._final_get
+        classify_name = self.classify_name
+        categories = []
+        append = categories.append
+        for name in names:
+            pos = name.rfind('.')
+            category = final_get(name[pos + 1:].lower()) if pos > 0 else None
+            append(category if category is not None else classify_name(name))
+        return categories
+
+    def classify_name(self, name: str, file_path: Optional[Path] = None,
+                      stat: Optional[os.stat_result] = None) -> str:
+        """Classify a bare file name; file_path is only needed for condition rules"""
+        pos = name.rfind('.')
+        if pos > 0:
+            category = self._final_get(name[pos + 1:].lower())
+            if category is not None:
+                return category
+
+        lname = name.lower()
+        best = self._first_nameless
+        pos = lname.rfind('.')
+        if pos > 0:
+            get = self._extension_get
+            index = get(lname[pos + 1:], best)
+            if index < best:
+                best = index
+            # Compound extensions: tar.gz, then pkg.tar.gz, ...
+            parts = self.max_extension_parts
+            while parts > 1:
+                pos = lname.rfind('.', 0, pos)
+                if pos <= 0:
+                    break
+                index = get(lname[pos + 1:], best)
+                if index < best:
+                    best = index
+                parts -= 1
+
+        if best > self._first_pattern_rule:
+            match = self._pattern_match(lname)
+            if match is not None:
+                index = self._group_rule[match.lastgroup]
+                if index < best:
+                    best = index
+
+        if best == self._none:
+            return self.default
+        rule = self.rules[best]
+        if not rule.has_conditions and not rule.combines_name_criteria:
+            return rule.category
+
+        file_path = file_path if file_path is not None else Path(name)
+        # A rule found by one name criterion must still meet its others
+        if ((not rule.combines_name_criteria or rule.matches_name(lname))
+                and rule.matches_conditions(file_path, stat)):
+            return rule.category
+        # The cheapest candidate failed a criterion: fall back to a full scan
+        for rule in self.rules[best + 1:]:
+            if rule.matches(file_path, lname, stat):
+                return rule.category
+        return self.default
@@ -0,0 +1,98 @@
+import heapq
+import os
+from array import array
+from pathlib import Path
+from typing import Dict, List
+
+# Rows sorted in one go by rows_by_size(); the rest of the sort is a merge
+SORT_RUN = 1 << 14
+
+
+class FileRecord:
+    """The parts of a stat result the scan keeps, in a fixed-size object"""
+
+    __slots__ = ('st_dev', 'st_ino', 'st_size', 'st_mtime_ns')
+
+    def __init__(self, st_dev: int, st_ino: int, st_size: int, st_mtime_ns: int):
+        self.st_dev = st_dev
+        self.st_ino = st_ino
+        self.st_size = st_size
+        self.st_mtime_ns = st_mtime_ns
+
+
+class ScanTable:
+    """Column store of the files seen by a duplicate scan.
+
+    A row is a file: its parent directory (an index into a table of
+    interned directory names), its name (bytes in one shared buffer) and
+    its size, device, inode and mtime in typed arrays, which cost 8 bytes
+    per value instead of a Python int each. Rows are addressed by number;
+    full paths are only put together when they are needed (to open a
+    file, or for a group that turned out to be duplicates). In total a
+    row takes the length of its name plus about 44 bytes, where a Path
+    and an os.stat_result in a dict took over 300.
+    """
+
+    __slots__ = ('dirs', '_dir_ids', 'parents', '_names', '_name_ends',
+                 'sizes', 'devs', 'inodes', 'mtimes')
+
+    def __init__(self):
+        self.dirs: List[str] = []
+        self._dir_ids: Dict[str, int] = {}
+        self.parents = array('I')
+        # File system encoded names back to back, and where each one ends
+        self._names = bytearray()
+        self._name_ends = array('Q')
+        self.sizes = array('Q')
+        self.devs = array('Q')
+        self.inodes = array('Q')
+        self.mtimes = array('q')
+
+    def __len__(self) -> int:
+        return len(self._name_ends)
+
+    def intern_dir(self, directory: str) -> int:
+        """Number of directory in the directory table, adding it if new"""
+        dir_id = self._dir_ids.get(directory)
+        if dir_id is None:
+            dir_id = self._dir_ids[directory] = len(self.dirs)
+            self.dirs.append(directory)
+        return dir_id
+
+    def add(self, dir_id: int, name: str, stat: os.stat_result) -> int:
+        """Append a file, returning its row number"""
+        self.parents.append(dir_id)
+        self._names += os.fsencode(name)
+        self._name_ends.append(len(self._names))
+        self.sizes.append(stat.st_size)
+        self.devs.append(stat.st_dev)
+        self.inodes.append(stat.st_ino)
+        self.mtimes.append(stat.st_mtime_ns)
+        return len(self._name_ends) - 1
+
+    def name(self, row: int) -> str:
+        start = self._name_ends[row - 1] if row else 0
+        return os.fsdecode(bytes(self._names[start:self._name_ends[row]]))
+
+    def path(self, row: int) -> str:
+        return os.path.join(self.dirs[self.parents[row]], self.name(row))
+
+    def full_path(self, row: int) -> Path:
+        return Path(self.path(row))
+
+    def record(self, row: int) -> FileRecord:
+        """What the file looked like when scanned, for snapshot lookups"""
+        return FileRecord(self.devs[row], self.inodes[row], self.sizes[row], self.mtimes[row])
+
+    def rows_by_size(self) -> array:
+        """Row numbers ordered by file size, rows of one size in table order"""
+        # Sorting runs of SORT_RUN rows and merging them means only one run
+        # is ever a list of boxed ints; the merge is stable, like the sorts
+        count = len(self)
+        size = self.sizes.__getitem__
+        rows = array('I')
+        for start in range(0, count, SORT_RUN):
+            rows.extend(sorted(range(start, min(start + SORT_RUN, count)), key=size))
+        view = memoryview(rows)
+        runs = [iter(view[start:start + SORT_RUN]) for start in range(0, count, SORT_RUN)]
+        return array('I', heapq.merge(*runs, key=size))
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Union
+
+DEFAULT_MAX_ENTRIES = 65536
+DEFAULT_TTL = 7 * 24 * 3600
+
+# Rough cost of one entry: the packed int key, the float expiry and the
+# OrderedDict's per-item overhead (measured with tracemalloc)
+ENTRY_BYTES = 176
+
+_MASK64 = (1 << 64) - 1
+
+
+def seen_key(stat: os.stat_result, path: Union[str, os.PathLike, None] = None) -> int:
+    """Pack (dev, inode, mtime_ns) into a single int.
+
+    Hard links share all three, so for a file with more than one link a
+    hash of its path is packed in too: each name is handled on its own.
+    """
+    key = ((stat.st_dev & _MASK64) << 128) | ((stat.st_ino & _MASK64) << 64) \
+        | (stat.st_mtime_ns & _MASK64)
+    if stat.st_nlink > 1 and path is not None:
+        key |= (hash(os.fspath(path)) & _MASK64) << 192
+    return key
+
+
+class SeenFiles:
+    """Bounded set of files already handled, keyed by (dev, inode, mtime).
+
+    A new download that reuses an old name has a different inode (or at
+    least mtime), so it is not mistaken for the old one. Pass the path to
+    add() and has() so hard links to one file are told apart. Entries expire
+    ttl seconds after they were last added or looked up, and the least
+    recently used entries are evicted beyond max_entries, so a long-running
+    daemon uses at most about max_entries * ENTRY_BYTES bytes.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: Optional[float] = DEFAULT_TTL):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        # key -> monotonic expiry time; ordered by expiry, oldest first
+        self._entries: "OrderedDict[int, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def for_memory(cls, max_bytes: int, ttl: Optional[float] = DEFAULT_TTL) -> "SeenFiles":
+        """A set sized to stay within roughly max_bytes"""
+        return cls(max_bytes // ENTRY_BYTES, ttl)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __contains__(self, stat: os.stat_result) -> bool:
+        return self.has(stat)
+
+    def has(self, stat: os.stat_result, path: Union[str, os.PathLike, None] = None) -> bool:
+        """Was the file (at path, if it has several links) handled before"""
+        key = seen_key(stat, path)
+        now = time.monotonic()
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is None or expires <= now:
+                if expires is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return False
+            self._touch(key, now)
+            self.hits += 1
+            return True
+
+    def add(self, stat: os.stat_result, path: Union[str, os.PathLike, None] = None) -> None:
+        """Remember a file, evicting expired and least recently used entries"""
+        key = seen_key(stat, path)
+        now = time.monotonic()
+        with self._lock:
+            self._touch(key, now)
+            entries = self._entries
+            while entries:
+                oldest, expires = next(iter(entries.items()))
+                if len(entries) <= self.max_entries and expires > now:
+                    break
+                del entries[oldest]
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _touch(self, key: int, now: float) -> None:
+        self._entries[key] = now + self.ttl if self.ttl is not None else float('inf')
+        self._entries.move_to_end(key)
@@ -0,0 +1,239 @@
+import heapq
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+from itertools import groupby
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, List, Tuple
+from .hasher import new_hasher
+from .transfer import TEMP_PREFIX
+
+# A shard is a sorted list of fixed-width (size, digest, path id) records:
+#
+#   header   MAGIC, then >BBHQQ: digest size, algorithm and root lengths,
+#            record count and the offset of the path table; then the
+#            algorithm name and the root path
+#   records  >Q size, raw digest, >I path id; sorted, so big-endian bytes
+#            compare like the (size, digest, path id) tuples they encode
+#   paths    count + 1 >Q offsets into the blob that follows, then the
+#            file system encoded paths back to back
+#
+# Records can be merged across shards by streaming them in order, and a
+# path is only read (with one seek) once its record is known to matter.
+
+MAGIC = b"ODSHARD\x01"
+_HEADER = struct.Struct(">BBHQQ")
+_SIZE = struct.Struct(">Q")
+_ID = struct.Struct(">I")
+_OFFSET = struct.Struct(">Q")
+
+# Records sorted in memory before they are spilled to a temporary run
+DEFAULT_RUN_RECORDS = 1_000_000
+_READ_RECORDS = 4096
+
+
+def digest_size(algorithm: str) -> int:
+    """Length in bytes of algorithm's raw digest"""
+    return len(bytes.fromhex(new_hasher(algorithm).hexdigest()))
+
+
+def _read_records(f: BinaryIO, record_size: int, count: int) -> Iterator[bytes]:
+    while count > 0:
+        batch = min(count, _READ_RECORDS)
+        data = f.read(batch * record_size)
+        if len(data) != batch * record_size:
+            raise ValueError(f"Truncated shard file {getattr(f, 'name', '')}")
+        for start in range(0, len(data), record_size):
+            yield data[start:start + record_size]
+        count -= batch
+
+
+class ShardWriter:
+    """Write the shard file for one scanned root (or part of one).
+
+    Records are sorted in memory in runs of run_records and spilled to
+    temporary files when there are more, which are then merged, so a
+    shard of any size is written in bounded memory. Paths are spooled to
+    a temporary file as they are added. The shard appears atomically on
+    close().
+    """
+
+    def __init__(self, shard_path: Path, algorithm: str, root: Path,
+                 run_records: int = DEFAULT_RUN_RECORDS):
+        self.shard_path = Path(shard_path)
+        self.algorithm = algorithm
+        self.root = os.path.abspath(root)
+        self.digest_size = digest_size(algorithm)
+        self.record_size = _SIZE.size + self.digest_size + _ID.size
+        self.run_records = max(1, run_records)
+        self.count = 0
+        self.shard_path.parent.mkdir(parents=True, exist_ok=True)
+        self._records: List[bytes] = []
+        # Spilled runs of sorted records, with their record counts
+        self._runs: List[Tuple[BinaryIO, int]] = []
+        self._paths = tempfile.TemporaryFile(dir=str(self.shard_path.parent))
+        self._offsets = array('Q', [0])
+
+    def add(self, size: int, digest: bytes, file_path: Path) -> None:
+        """Record a file with its size and raw digest"""
+        if self.count >= 1 << 32:
+            raise ValueError("Too many files for one shard; split the root")
+        encoded = os.fsencode(file_path)
+        self._paths.write(encoded)
+        self._offsets.append(self._offsets[-1] + len(encoded))
+        self._records.append(_SIZE.pack(size) + digest + _ID.pack(self.count))
+        self.count += 1
+        if len(self._records) >= self.run_records:
+            self._spill()
+
+    def close(self) -> None:
+        """Sort, write and atomically publish the shard"""
+        if self._runs:
+            self._spill()
+            for run, _count in self._runs:
+                run.seek(0)
+            records: Iterable[bytes] = heapq.merge(*(
+                _read_records(run, self.record_size, count) for run, count in self._runs))
+        else:
+            self._records.sort()
+            records = self._records
+        root = os.fsencode(self.root)
+        algorithm = self.algorithm.encode()
+        header_size = len(MAGIC) + _HEADER.size + len(algorithm) + len(root)
+        paths_offset = header_size + self.count * self.record_size
+
+        fd, tmp_name = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=str(self.shard_path.parent))
+        try:
+            with os.fdopen(fd, "wb") as out:
+                out.write(MAGIC)
+                out.write(_HEADER.pack(self.digest_size, len(algorithm), len(root),
+                                       self.count, paths_offset))
+                out.write(algorithm)
+                out.write(root)
+                for record in records:
+                    out.write(record)
+                if sys.byteorder == "little":
+                    self._offsets.byteswap()
+                out.write(self._offsets.tobytes())
+                self._paths.seek(0)
+                shutil.copyfileobj(self._paths, out)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp_name, self.shard_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_name)
+            except OSError:
+                pass
+            raise
+        finally:
+            self._cleanup()
+
+    def abort(self) -> None:
+        """Discard everything without writing the shard"""
+        self._cleanup()
+
+    def _spill(self) -> None:
+        self._records.sort()
+        run = tempfile.TemporaryFile(dir=str(self.shard_path.parent))
+        run.write(b"".join(self._records))
+        self._runs.append((run, len(self._records)))
+        self._records = []
+
+    def _cleanup(self) -> None:
+        self._paths.close()
+        for run, _count in self._runs:
+            run.close()
+        self._runs = []
+        self._records = []
+
+
+class ShardReader:
+    """Read a shard file: its records in sorted order, and paths by id"""
+
+    def __init__(self, shard_path: Path):
+        self.shard_path = Path(shard_path)
+        self._file = open(self.shard_path, "rb")
+        try:
+            if self._file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{self.shard_path} is not a shard file")
+            header = self._file.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                raise ValueError(f"Truncated shard file {self.shard_path}")
+            (self.digest_size, algorithm_size, root_size,
+             self.count, self._paths_offset) = _HEADER.unpack(header)
+            self.algorithm = self._file.read(algorithm_size).decode()
+            self.root = Path(os.fsdecode(self._file.read(root_size)))
+        except BaseException:
+            self._file.close()
+            raise
+        self._records_offset = self._file.tell()
+        self._blob_offset = self._paths_offset + (self.count + 1) * _OFFSET.size
+        self.record_size = _SIZE.size + self.digest_size + _ID.size
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "ShardReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __iter__(self) -> Iterator[Tuple[int, bytes, int]]:
+        """(size, raw digest, path id) for every record, in sorted order"""
+        digest_end = _SIZE.size + self.digest_size
+        with open(self.shard_path, "rb") as f:
+            f.seek(self._records_offset)
+            for record in _read_records(f, self.record_size, self.count):
+                yield (_SIZE.unpack_from(record)[0], record[_SIZE.size:digest_end],
+                       _ID.unpack_from(record, digest_end)[0])
+
+    def path(self, path_id: int) -> Path:
+        """The path recorded under path_id"""
+        self._file.seek(self._paths_offset + path_id * _OFFSET.size)
+        start, end = struct.unpack(">QQ", self._file.read(2 * _OFFSET.size))
+        self._file.seek(self._blob_offset + start)
+        return Path(os.fsdecode(self._file.read(end - start)))
+
+
+def _tagged(reader: ShardReader, shard: int) -> Iterator[Tuple[int, bytes, int, int]]:
+    for size, digest, path_id in reader:
+        yield size, digest, shard, path_id
+
+
+def merge_shards(shard_paths: Iterable[Path]) -> Iterator[Tuple[int, str, List[Path]]]:
+    """Stream-join shards, yielding (size, hex digest, paths) for each duplicate group.
+
+    Every shard is read once, in order, and only one group of records is
+    held at a time, so memory use doesn't depend on the number of files.
+    A path recorded by more than one shard is listed once. Shards must
+    have been written with the same hash algorithm.
+    """
+    readers: List[ShardReader] = []
+    try:
+        for shard_path in shard_paths:
+            readers.append(ShardReader(shard_path))
+        algorithms = {reader.algorithm for reader in readers}
+        if len(algorithms) > 1:
+            raise ValueError("Shards were hashed with different algorithms: "
+                             + ", ".join(sorted(algorithms)))
+        streams = [_tagged(reader, shard) for shard, reader in enumerate(readers)]
+        for (size, digest), records in groupby(heapq.merge(*streams), key=lambda r: r[:2]):
+            first = next(records)
+            second = next(records, None)
+            if second is None:
+                continue
+            # Shards of overlapping roots (/data and /data/alice) record some
+            # files twice; a file is not a duplicate of itself
+            paths = list(dict.fromkeys(
+                readers[shard].path(path_id)
+                for _size, _digest, shard, path_id in (first, second, *records)))
+            if len(paths) > 1:
+                yield size, digest.hex(), paths
+    finally:
+        for reader in readers:
+            reader.close()
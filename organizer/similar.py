@@ -0,0 +1,234 @@
+import math
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+from operator import mul
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from .snapshot import DirectorySnapshot
+
+logger = logging.getLogger(__name__)
+
+HASH_METHODS = ("dhash", "phash")
+HASH_BITS = 64
+DEFAULT_MAX_DISTANCE = 6
+
+# Multi-index hashing splits each hash into this many chunks
+_CHUNKS = 4
+_CHUNK_BITS = HASH_BITS // _CHUNKS
+_CHUNK_MASK = (1 << _CHUNK_BITS) - 1
+
+# Low-frequency rows of the 32-point DCT-II used by phash
+_DCT = [[math.cos((2 * x + 1) * u * math.pi / 64) for x in range(32)] for u in range(8)]
+
+try:
+    import numpy
+except ImportError:  # optional, vectorizes phash's DCT
+    numpy = None
+else:
+    _DCT_MATRIX = numpy.array(_DCT)
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def _popcount(value: int) -> int:
+        return bin(value).count("1")
+
+
+def _pillow():
+    # Only find-similar needs Pillow, and it is an optional dependency
+    try:
+        from PIL import Image
+    except ImportError:
+        raise ValueError("Pillow is not installed (pip install Pillow)")
+    return Image
+
+
+def _grayscale(image_path: Path, size: Tuple[int, int]) -> bytes:
+    """The image scaled down to size, as 8-bit grayscale pixels"""
+    Image = _pillow()
+    with Image.open(image_path) as image:
+        # JPEGs can be decoded straight at a fraction of their full size
+        image.draft("L", (size[0] * 4, size[1] * 4))
+        return image.convert("L").resize(size, Image.BILINEAR).tobytes()
+
+
+def dhash(image_path: Path) -> int:
+    """64-bit difference hash: is each pixel brighter than its right neighbour"""
+    pixels = _grayscale(image_path, (9, 8))
+    value = 0
+    for row in range(0, 72, 9):
+        for i in range(row, row + 8):
+            value = (value << 1) | (pixels[i] > pixels[i + 1])
+    return value
+
+
+def phash(image_path: Path) -> int:
+    """64-bit perceptual hash: signs of the 8x8 lowest DCT frequencies around their median"""
+    return _dct_hash(_grayscale(image_path, (32, 32)))
+
+
+def _dct_hash(pixels: bytes) -> int:
+    """phash of 32x32 grayscale pixels"""
+    # Separable DCT, computing only the 8 lowest frequencies in each direction
+    if numpy is not None:
+        block = numpy.frombuffer(pixels, dtype=numpy.uint8).reshape(32, 32)
+        coeffs = (_DCT_MATRIX @ block @ _DCT_MATRIX.T).ravel().tolist()
+    else:
+        # One pass over the pixel rows, then one over the 8 columns that leaves
+        rows = [[sum(map(mul, cos, pixels[y:y + 32])) for cos in _DCT]
+                for y in range(0, 1024, 32)]
+        columns = list(zip(*rows))
+        coeffs = [sum(map(mul, cos, column)) for cos in _DCT for column in columns]
+    # The DC term only reflects overall brightness
+    median = sorted(coeffs[1:])[31]
+    value = 0
+    for coeff in coeffs:
+        value = (value << 1) | (coeff > median)
+    return value
+
+
+_HASHERS = {"dhash": dhash, "phash": phash}
+
+
+def image_hash(image_path: Path, method: str = "dhash") -> int:
+    """Perceptual hash of an image; raises OSError (or Pillow's errors) if it can't be read"""
+    try:
+        hasher = _HASHERS[method]
+    except KeyError:
+        raise ValueError(f"Unsupported image hash: {method}")
+    return hasher(image_path)
+
+
+def hamming(first: int, second: int) -> int:
+    return _popcount(first ^ second)
+
+
+class HammingIndex:
+    """Look up 64-bit hashes within max_distance bits of a query.
+
+    Multi-index hashing: each hash is split into four 16-bit chunks, and
+    each chunk position has its own table. Two hashes at most max_distance
+    apart differ in at most max_distance // 4 bits in some chunk, so a
+    search only probes the buckets that close to the query's chunks and
+    compares against what it finds there. Unlike a BK-tree, which ends up
+    visiting most of its nodes for high-entropy hashes, this stays cheap
+    for large collections; probes grow quickly once max_distance // 4
+    exceeds 1, though.
+    """
+
+    def __init__(self, max_distance: int = DEFAULT_MAX_DISTANCE):
+        self.max_distance = max_distance
+        radius = min(max_distance // _CHUNKS, _CHUNK_BITS)
+        self._probes = [sum(1 << bit for bit in bits)
+                        for flipped in range(radius + 1)
+                        for bits in combinations(range(_CHUNK_BITS), flipped)]
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(_CHUNKS)]
+
+    def add(self, value: int) -> None:
+        for i, table in enumerate(self._tables):
+            table.setdefault((value >> (i * _CHUNK_BITS)) & _CHUNK_MASK, []).append(value)
+
+    def search(self, value: int) -> List[Tuple[int, int]]:
+        """(hash, distance) for every indexed hash within max_distance of value"""
+        found = []
+        checked = set()
+        for i, table in enumerate(self._tables):
+            chunk = (value >> (i * _CHUNK_BITS)) & _CHUNK_MASK
+            for probe in self._probes:
+                bucket = table.get(chunk ^ probe)
+                if not bucket:
+                    continue
+                for other in bucket:
+                    if other in checked:
+                        continue
+                    checked.add(other)
+                    distance = _popcount(value ^ other)
+                    if distance <= self.max_distance:
+                        found.append((other, distance))
+        return found
+
+
+class SimilarGroup(NamedTuple):
+    distance: int  # largest distance between two images linked in the group
+    paths: List[Path]
+
+
+def group_similar(hashes: Iterable[Tuple[Path, int]],
+                  max_distance: int = DEFAULT_MAX_DISTANCE) -> List[SimilarGroup]:
+    """Group images whose hashes are within max_distance, transitively"""
+    by_hash: Dict[int, List[Path]] = {}
+    for image_path, value in hashes:
+        by_hash.setdefault(value, []).append(image_path)
+
+    # Union-find over the distinct hashes
+    parent: Dict[int, int] = {}
+    widest: Dict[int, int] = {}
+
+    def find(value: int) -> int:
+        root = value
+        while parent[root] != root:
+            root = parent[root]
+        while parent[value] != root:
+            parent[value], value = root, parent[value]
+        return root
+
+    index = HammingIndex(max_distance)
+    for value in by_hash:
+        parent[value] = value
+        widest[value] = 0
+        for other, distance in index.search(value):
+            root, other_root = find(value), find(other)
+            if root != other_root:
+                parent[root] = other_root
+            widest[other_root] = max(widest[other_root], widest[root], distance)
+        index.add(value)
+
+    groups: Dict[int, List[Path]] = {}
+    for value, paths in by_hash.items():
+        groups.setdefault(find(value), []).extend(paths)
+    return [SimilarGroup(widest[root], paths) for root, paths in groups.items()
+            if len(paths) > 1]
+
+
+def hash_images(files: Iterable[Tuple[Path, os.stat_result]], method: str = "dhash",
+                snapshot: Optional[DirectorySnapshot] = None, jobs: int = 4,
+                stats: Optional[Dict[str, int]] = None) -> Iterator[Tuple[Path, int]]:
+    """Yield (path, hash) for each image, reusing hashes the snapshot still trusts.
+
+    The snapshot should be dedicated to this method's hashes: they are
+    stored in its digest field. Images that can't be decoded are skipped.
+    Decoding runs on a thread pool; Pillow releases the GIL while it works.
+    """
+    _pillow()
+    if stats is None:
+        stats = {}
+    for key in ('files', 'cached', 'failed'):
+        stats.setdefault(key, 0)
+
+    to_hash = []
+    for image_path, stat in files:
+        stats['files'] += 1
+        state = snapshot.get(image_path, stat) if snapshot is not None else None
+        if state is not None and state.digest:
+            stats['cached'] += 1
+            yield image_path, int(state.digest, 16)
+        else:
+            to_hash.append((image_path, stat))
+
+    def compute(item: Tuple[Path, os.stat_result]) -> Optional[int]:
+        try:
+            return image_hash(item[0], method)
+        except Exception as e:  # Pillow raises assorted errors for bad images
+            logger.debug("Cannot hash image %s: %s", item[0], e)
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        for (image_path, stat), value in zip(to_hash, executor.map(compute, to_hash)):
+            if value is None:
+                stats['failed'] += 1
+                continue
+            if snapshot is not None:
+                snapshot.update(image_path, stat, digest=f"{value:016x}")
+            yield image_path, value
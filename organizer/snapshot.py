@@ -0,0 +1,328 @@
+import os
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from stat import S_ISREG
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# A directory modified this close to the scan may change again within the
+# same mtime tick, so its listing isn't trusted next time
+RACY_WINDOW_NS = 2 * 10 ** 9
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    files TEXT NOT NULL,
+    subdirs TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dev INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    partial TEXT,
+    digest TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Names are stored NUL-separated; NUL can't appear in a file name
+_SEP = "\0"
+
+# Changes are written out once this many have piled up, so scanning a
+# big tree for the first time doesn't keep a state per file in memory
+FLUSH_EVERY = 10_000
+
+# Paths per lookup query (SQLite allows 999 parameters by default)
+LOOKUP_BATCH = 500
+
+# A directory's mtime_ns, file names and subdirectory names
+Listing = Tuple[int, List[str], List[str]]
+
+
+def cache_directory(cache_dir: Optional[str] = None) -> Path:
+    """cache_dir, or the user's cache directory for the organizer"""
+    if cache_dir is None:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        cache_dir = os.path.join(base, 'downloads-organizer')
+    return Path(os.path.expanduser(cache_dir))
+
+
+def default_snapshot_path(name: str, cache_dir: Optional[str] = None) -> Path:
+    """Path of the named snapshot database, in the user's cache directory by default"""
+    return cache_directory(cache_dir) / f"{name}-snapshot.db"
+
+
+class FileState(NamedTuple):
+    dev: int
+    inode: int
+    size: int
+    mtime_ns: int
+    partial: Optional[str] = None
+    digest: Optional[str] = None
+
+    def matches(self, stat: os.stat_result) -> bool:
+        return (self.inode == stat.st_ino and self.size == stat.st_size
+                and self.mtime_ns == stat.st_mtime_ns and self.dev == stat.st_dev)
+
+
+class DirectorySnapshot:
+    """What the last scan of a tree saw, persisted between runs.
+
+    For every directory the snapshot keeps its mtime and listing, so an
+    unchanged directory is not listed again; for every file its (dev,
+    inode, size, mtime) and any partial/full digests computed for it, so
+    an unchanged file is not hashed again. Comparing a fresh walk against
+    the snapshot also tells which files appeared while nobody was looking.
+
+    Nothing is loaded up front: walk() reads the stored state of one
+    directory at a time and get() looks files up as they're asked for.
+    Changes stay in memory until save(), or until FLUSH_EVERY of them
+    have piled up, when they are written out early.
+    """
+
+    def __init__(self, db_path: Path, algorithm: Optional[str] = None):
+        self.db_path = Path(db_path)
+        self.algorithm = algorithm
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        if algorithm is not None:
+            self._check_algorithm(algorithm)
+        self._conn.commit()
+        # Changes not written yet; None marks a removed entry
+        self._dirs: Dict[str, Optional[Listing]] = {}
+        self._files: Dict[str, Optional[FileState]] = {}
+        self.dirs_listed = 0
+        self.dirs_skipped = 0
+
+    def _check_algorithm(self, algorithm: str) -> None:
+        """Drop stored digests if they were made with another hash algorithm"""
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'algorithm'").fetchone()
+        if row is not None and row[0] != algorithm:
+            self._conn.execute("UPDATE files SET partial = NULL, digest = NULL")
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('algorithm', ?)",
+            (algorithm,))
+
+    def close(self) -> None:
+        """Close the underlying database (changes not yet written are lost)"""
+        with self._lock:
+            self._conn.close()
+
+    def has_root(self, root: Path) -> bool:
+        """True if root was scanned before"""
+        return self._dir(os.path.abspath(root)) is not None
+
+    def walk(self, root: Path, recursive: bool = True,
+             exclude: Optional[Path] = None) -> Iterator[Tuple[Path, os.stat_result, bool]]:
+        """Yield (path, stat, changed) for every regular file under root.
+
+        Directories whose mtime matches the snapshot are not listed again;
+        their files are only stat'ed. changed is True for files that are
+        new or differ from the snapshot. exclude is a directory to skip.
+        """
+        root = os.path.abspath(root)
+        excluded = os.path.abspath(exclude) if exclude is not None else None
+        trusted_before = time.time_ns() - RACY_WINDOW_NS
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                dir_stat = os.stat(directory)
+            except OSError:
+                self._forget_dir(directory)
+                continue
+            cached = self._dir(directory)
+            if cached is not None and cached[0] == dir_stat.st_mtime_ns:
+                _, files, subdirs = cached
+                self.dirs_skipped += 1
+            else:
+                try:
+                    files, subdirs = self._list(directory)
+                except OSError as e:
+                    logger.warning("Skipping unreadable directory %s: %s", directory, e)
+                    continue
+                if cached is not None:
+                    for name in set(cached[1]) - set(files):
+                        self._forget_file(os.path.join(directory, name))
+                    for name in set(cached[2]) - set(subdirs):
+                        self._forget_dir(os.path.join(directory, name))
+                mtime = dir_stat.st_mtime_ns if dir_stat.st_mtime_ns < trusted_before else -1
+                self._record(self._dirs, directory, (mtime, files, subdirs))
+                self.dirs_listed += 1
+
+            if recursive:
+                for name in subdirs:
+                    subdir = os.path.join(directory, name)
+                    if subdir != excluded:
+                        stack.append(subdir)
+
+            paths = [os.path.join(directory, name) for name in files]
+            states = self._states(paths)
+            for path in paths:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    self._forget_file(path)
+                    continue
+                if not S_ISREG(stat.st_mode):
+                    continue
+                state = states.get(path)
+                changed = state is None or not state.matches(stat)
+                if changed:
+                    self._record(self._files, path, FileState(stat.st_dev, stat.st_ino,
+                                                              stat.st_size, stat.st_mtime_ns))
+                yield Path(path), stat, changed
+
+    def get(self, file_path: Path, stat: os.stat_result) -> Optional[FileState]:
+        """The recorded state of file_path if it still matches stat"""
+        key = str(file_path)
+        with self._lock:
+            if key in self._files:
+                state = self._files[key]
+            else:
+                row = self._conn.execute(
+                    "SELECT dev, inode, size, mtime_ns, partial, digest FROM files "
+                    "WHERE path = ?", (key,)).fetchone()
+                state = FileState(*row) if row is not None else None
+        return state if state is not None and state.matches(stat) else None
+
+    def get_many(self, files: List[Tuple[str, os.stat_result]]) -> List[Optional[FileState]]:
+        """get() for each (path, stat), looked up together"""
+        states = self._states([file_path for file_path, _stat in files])
+        return [state if state is not None and state.matches(stat) else None
+                for state, stat in ((states.get(file_path), stat) for file_path, stat in files)]
+
+    def update(self, file_path: Path, stat: os.stat_result,
+               partial: Optional[str] = None, digest: Optional[str] = None) -> None:
+        """Record digests computed for file_path while it looked like stat"""
+        key = str(file_path)
+        state = self.get(file_path, stat) or FileState(stat.st_dev, stat.st_ino,
+                                                        stat.st_size, stat.st_mtime_ns)
+        state = state._replace(partial=partial or state.partial, digest=digest or state.digest)
+        self._record(self._files, key, state)
+
+    def forget(self, paths: Iterable[Path]) -> None:
+        """Drop files that were moved away"""
+        for file_path in paths:
+            self._forget_file(str(file_path))
+
+    def refresh(self, directories: Iterable[Path]) -> None:
+        """List directories again, after files were moved out of them"""
+        for directory in directories:
+            directory = os.path.abspath(directory)
+            cached = self._dir(directory)
+            if cached is not None:
+                # Force walk() to list it rather than trust the old mtime
+                self._record(self._dirs, directory, (-1, cached[1], cached[2]))
+            for _ in self.walk(Path(directory), recursive=False):
+                pass
+
+    def save(self) -> None:
+        """Write everything recorded since the last save"""
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "DELETE FROM files WHERE path = ?",
+                    ((p,) for p, state in self._files.items() if state is None))
+                self._conn.executemany(
+                    "DELETE FROM dirs WHERE path = ?",
+                    ((d,) for d, entry in self._dirs.items() if entry is None))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO dirs (path, mtime_ns, files, subdirs) "
+                    "VALUES (?, ?, ?, ?)",
+                    ((d, *self._encode(entry)) for d, entry in self._dirs.items()
+                     if entry is not None))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO files "
+                    "(path, dev, inode, size, mtime_ns, partial, digest) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    ((p, *state) for p, state in self._files.items() if state is not None))
+            self._dirs.clear()
+            self._files.clear()
+
+    def _dir(self, directory: str) -> Optional[Listing]:
+        """The recorded mtime and listing of directory"""
+        with self._lock:
+            if directory in self._dirs:
+                return self._dirs[directory]
+            row = self._conn.execute(
+                "SELECT mtime_ns, files, subdirs FROM dirs WHERE path = ?",
+                (directory,)).fetchone()
+        return (row[0], self._split(row[1]), self._split(row[2])) if row is not None else None
+
+    def _states(self, paths: List[str]) -> Dict[str, FileState]:
+        """The recorded states of paths, for those that have one"""
+        states: Dict[str, FileState] = {}
+        with self._lock:
+            for start in range(0, len(paths), LOOKUP_BATCH):
+                batch = paths[start:start + LOOKUP_BATCH]
+                rows = self._conn.execute(
+                    "SELECT path, dev, inode, size, mtime_ns, partial, digest FROM files "
+                    f"WHERE path IN ({', '.join('?' * len(batch))})", batch)
+                for path, *state in rows:
+                    states[path] = FileState(*state)
+            for path in paths:
+                if path in self._files:
+                    state = self._files[path]
+                    if state is None:
+                        states.pop(path, None)
+                    else:
+                        states[path] = state
+        return states
+
+    def _record(self, changes: Dict, key: str, value) -> None:
+        with self._lock:
+            changes[key] = value
+            full = len(self._dirs) + len(self._files) >= FLUSH_EVERY
+        if full:
+            self.save()
+
+    def _list(self, directory: str) -> Tuple[List[str], List[str]]:
+        files, subdirs = [], []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif entry.is_file():
+                        files.append(entry.name)
+                except OSError:
+                    continue
+        return files, subdirs
+
+    def _forget_file(self, path: str) -> None:
+        self._record(self._files, path, None)
+
+    def _forget_dir(self, directory: str) -> None:
+        cached = self._dir(directory)
+        if cached is None:
+            return
+        self._record(self._dirs, directory, None)
+        for name in cached[1]:
+            self._forget_file(os.path.join(directory, name))
+        for name in cached[2]:
+            self._forget_dir(os.path.join(directory, name))
+
+    @staticmethod
+    def _encode(entry: Listing) -> Tuple[int, str, str]:
+        mtime_ns, files, subdirs = entry
+        return mtime_ns, _SEP.join(files), _SEP.join(subdirs)
+
+    @staticmethod
+    def _split(names: str) -> List[str]:
+        return names.split(_SEP) if names else []
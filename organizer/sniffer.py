@@ -0,0 +1,172 @@
+import os
+import struct
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+SNIFF_SIZE = 4096
+
+# (offset, magic bytes, extension or refiner). A refiner gets the header and
+# the file size (None if unknown) and returns the extension, or None if the
+# header doesn't really match.
+Refiner = Callable[[bytes, Optional[int]], Optional[str]]
+
+# Sizes of the BMP DIB header versions (core, info, v2 to v5)
+_BMP_DIB_SIZES = (12, 40, 52, 56, 108, 124)
+
+
+def _zip_kind(header: bytes, size: Optional[int] = None) -> Optional[str]:
+    if b"mimetypeapplication/vnd.oasis.opendocument.text" in header:
+        return "odt"
+    if b"mimetypeapplication/epub+zip" in header:
+        return "epub"
+    if b"word/" in header:
+        return "docx"
+    if b"xl/" in header:
+        return "xlsx"
+    if b"ppt/" in header:
+        return "pptx"
+    return "zip"
+
+
+def _riff_kind(header: bytes, size: Optional[int] = None) -> Optional[str]:
+    return {b"WAVE": "wav", b"AVI ": "avi", b"WEBP": "webp"}.get(header[8:12])
+
+
+def _ftyp_kind(header: bytes, size: Optional[int] = None) -> Optional[str]:
+    brand = header[8:12]
+    if brand == b"qt  ":
+        return "mov"
+    if brand in (b"M4A ", b"M4B "):
+        return "m4a"
+    if brand in (b"heic", b"heix", b"mif1"):
+        return "heic"
+    return "mp4"
+
+
+def _text_kind(header: bytes, size: Optional[int] = None) -> Optional[str]:
+    head = header.lstrip()[:SNIFF_SIZE].lower()
+    if b"<svg" in head:
+        return "svg"
+    return None
+
+
+def _bmp_kind(header: bytes, size: Optional[int] = None) -> Optional[str]:
+    # "BM" alone is common in text; check the file header's fields too
+    if len(header) < 18:
+        return None
+    file_size, reserved = struct.unpack_from("<II", header, 2)
+    if reserved != 0 or (size is not None and file_size != size):
+        return None
+    if struct.unpack_from("<I", header, 14)[0] not in _BMP_DIB_SIZES:
+        return None
+    return "bmp"
+
+
+def _pe_kind(header: bytes, size: Optional[int] = None) -> Optional[str]:
+    # "MZ" alone is common in text; e_lfanew must point at the PE signature
+    if len(header) < 0x40:
+        return None
+    offset = struct.unpack_from("<I", header, 0x3C)[0]
+    if header[offset:offset + 4] != b"PE\x00\x00":
+        return None
+    return "exe"
+
+
+SIGNATURES: List[Tuple[int, bytes, Union[str, Refiner]]] = [
+    (0, b"%PDF-", "pdf"),
+    (0, b"\x89PNG\r\n\x1a\n", "png"),
+    (0, b"\xff\xd8\xff", "jpg"),
+    (0, b"GIF87a", "gif"),
+    (0, b"GIF89a", "gif"),
+    (0, b"II*\x00", "tiff"),
+    (0, b"MM\x00*", "tiff"),
+    (0, b"BM", _bmp_kind),
+    (0, b"PK\x03\x04", _zip_kind),
+    (0, b"Rar!\x1a\x07", "rar"),
+    (0, b"7z\xbc\xaf\x27\x1c", "7z"),
+    (0, b"\x1f\x8b", "gz"),
+    (0, b"BZh", "bz2"),
+    (0, b"\xfd7zXZ\x00", "xz"),
+    (257, b"ustar", "tar"),
+    (0, b"RIFF", _riff_kind),
+    (4, b"ftyp", _ftyp_kind),
+    (0, b"\x1aE\xdf\xa3", "mkv"),
+    (0, b"FLV\x01", "flv"),
+    (0, b"0&\xb2u\x8ef\xcf\x11", "wmv"),
+    (0, b"ID3", "mp3"),
+    (0, b"\xff\xfb", "mp3"),
+    (0, b"fLaC", "flac"),
+    (0, b"OggS", "ogg"),
+    (0, b"{\\rtf", "rtf"),
+    (0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "doc"),
+    (0, b"MZ", _pe_kind),
+    (0, b"<?xml", _text_kind),
+    (0, b"<svg", "svg"),
+]
+
+
+class MagicDetector:
+    """Guess a file's real extension from its first few KiB.
+
+    Signatures are precompiled into a table keyed by (offset, first byte),
+    so a header is checked against a handful of candidates rather than the
+    whole list. At most SNIFF_SIZE bytes are ever read, and results are
+    kept in an LRU cache keyed by (dev, inode, mtime, size).
+    """
+
+    def __init__(self, cache_size: int = 4096,
+                 signatures: List[Tuple[int, bytes, Union[str, Refiner]]] = SIGNATURES):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[int, int, int, int], Optional[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._table: Dict[Tuple[int, int], List[Tuple[bytes, Union[str, Refiner]]]] = {}
+        for offset, magic, kind in signatures:
+            self._table.setdefault((offset, magic[0]), []).append((magic, kind))
+        for candidates in self._table.values():
+            candidates.sort(key=lambda c: len(c[0]), reverse=True)
+        # Deeper offsets first: a tar whose first member is named "BM..." is a tar
+        self._offsets = sorted({offset for offset, _, _ in signatures}, reverse=True)
+        self.hits = 0
+        self.misses = 0
+
+    def detect(self, file_path: Path, stat: Optional[os.stat_result] = None) -> Optional[str]:
+        """Return the detected extension (without dot), or None if unknown"""
+        try:
+            if stat is None:
+                stat = file_path.stat()
+        except OSError:
+            return None
+        key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+
+        try:
+            with open(file_path, "rb") as f:
+                header = f.read(SNIFF_SIZE)
+        except OSError:
+            return None
+        kind = self.detect_bytes(header, stat.st_size)
+
+        with self._lock:
+            self._cache[key] = kind
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return kind
+
+    def detect_bytes(self, header: bytes, size: Optional[int] = None) -> Optional[str]:
+        """Match a file header (of a file of size bytes, if known) against the signature table"""
+        for offset in self._offsets:
+            if len(header) <= offset:
+                continue
+            for magic, kind in self._table.get((offset, header[offset]), ()):
+                if header.startswith(magic, offset):
+                    result = kind if isinstance(kind, str) else kind(header, size)
+                    if result is not None:
+                        return result
+        return None
@@ -0,0 +1,228 @@
+import errno
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Optional
+from .hasher import BUFFER_SIZE, hash_path, new_hasher
+from .iosched import Throttle
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Name prefix of the temporary files copies and link swaps are staged in
+TEMP_PREFIX = ".organizer-"
+
+# _IOW(0x94, 9, int) from linux/fs.h: share the source's extents copy-on-write
+FICLONE = 0x40049409
+
+# ioctl(FICLONE) errors meaning "can't clone here", not "something went wrong"
+REFLINK_UNSUPPORTED = {errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.ENOSYS, errno.EPERM,
+                       getattr(errno, 'ENOTSUP', errno.EINVAL),
+                       getattr(errno, 'EOPNOTSUPP', errno.EINVAL)}
+
+
+def fsync_directory(directory: Path) -> None:
+    """Flush a directory entry change (rename/unlink) to disk where supported"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # e.g. Windows, where directories can't be opened
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _kernel_copy(src_fd: int, dst_fd: int, size: int,
+                 throttle: Optional[Throttle] = None) -> bool:
+    """Copy with copy_file_range/sendfile; False if the kernel can't do it.
+    
+    With throttle the copy goes in BUFFER_SIZE steps, each paid for first.
+    """
+    copy = getattr(os, "copy_file_range", None) or getattr(os, "sendfile", None)
+    if copy is None:
+        return False
+    offset = 0
+    try:
+        while offset < size:
+            count = size - offset
+            if throttle is not None:
+                count = min(count, BUFFER_SIZE)
+                throttle(count, size)
+            if copy is os.sendfile:
+                sent = os.sendfile(dst_fd, src_fd, offset, count)
+            else:
+                sent = os.copy_file_range(src_fd, dst_fd, count)
+            if not sent:
+                break
+            offset += sent
+    except OSError:
+        if offset:
+            raise
+        return False
+    return True
+
+
+def copy_and_hash(source_path: Path, target_path: Path,
+                  algorithm: Optional[str] = None,
+                  buffer_size: int = BUFFER_SIZE, verify: bool = False,
+                  throttle: Optional[Throttle] = None) -> Optional[str]:
+    """Copy source_path to target_path, hashing the bytes on the way through.
+
+    The data goes to a temporary file next to the target, is fsync'ed once,
+    then renamed over target_path and the directory fsync'ed, so a crash
+    leaves either the old target or the complete new one. Returns the
+    content digest, or None when no algorithm is given; in that case the
+    copy is done in-kernel (copy_file_range/sendfile) when possible, since
+    those never pass the data through a buffer we could hash. With verify
+    the written copy is re-read and its digest compared. throttle, if
+    given, is called as throttle(nbytes, file_size) before every read.
+    """
+    target_dir = target_path.parent
+    fd, tmp_name = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=str(target_dir))
+    tmp_path = Path(tmp_name)
+    digest = None
+    try:
+        with open(source_path, "rb") as src, os.fdopen(fd, "wb") as dst:
+            size = os.fstat(src.fileno()).st_size
+            if (algorithm is not None
+                    or not _kernel_copy(src.fileno(), dst.fileno(), size, throttle)):
+                hasher = new_hasher(algorithm) if algorithm is not None else None
+                buffer = bytearray(buffer_size)
+                view = memoryview(buffer)
+                while True:
+                    if throttle is not None:
+                        throttle(buffer_size, size)
+                    n = src.readinto(buffer)
+                    if not n:
+                        break
+                    if hasher is not None:
+                        hasher.update(view[:n])
+                    dst.write(view[:n])
+                if hasher is not None:
+                    digest = hasher.hexdigest()
+            dst.flush()
+            os.fsync(dst.fileno())
+        shutil.copystat(str(source_path), str(tmp_path))
+
+        if tmp_path.stat().st_size != size:
+            raise OSError(f"Short copy of {source_path}")
+        if verify:
+            algorithm = algorithm or "blake2b"
+            expected = digest or hash_path(str(source_path), algorithm, throttle=throttle)[0]
+            if hash_path(str(tmp_path), algorithm, throttle=throttle)[0] != expected:
+                raise OSError(f"Copy of {source_path} does not match the original")
+
+        os.replace(tmp_path, target_path)
+        fsync_directory(target_dir)
+    except BaseException:
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+        raise
+    return digest
+
+
+def move_across_devices(source_path: Path, target_path: Path,
+                        algorithm: Optional[str] = None,
+                        verify: bool = False,
+                        throttle: Optional[Throttle] = None) -> Optional[str]:
+    """Copy-and-hash source_path to target_path, then remove the source"""
+    digest = copy_and_hash(source_path, target_path, algorithm, verify=verify,
+                           throttle=throttle)
+    os.unlink(source_path)
+    fsync_directory(source_path.parent)
+    return digest
+
+
+def reflink(source_path: Path, target_path: Path) -> None:
+    """Create target_path as a copy-on-write clone of source_path.
+
+    Fails with FileExistsError if target_path exists, and with one of
+    REFLINK_UNSUPPORTED if the filesystem (or platform) can't clone.
+    """
+    if fcntl is None:
+        raise OSError(errno.ENOSYS, "reflinks are not supported on this platform")
+    with open(source_path, "rb") as src:
+        fd = os.open(target_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        try:
+            fcntl.ioctl(fd, FICLONE, src.fileno())
+        except BaseException:
+            os.close(fd)
+            os.unlink(target_path)
+            raise
+        os.close(fd)
+    shutil.copystat(str(source_path), str(target_path))
+
+
+def link_or_clone(source_path: Path, target_path: Path, mode: str = "hardlink") -> str:
+    """Make target_path share source_path's data; returns "reflink" or "hardlink".
+
+    With mode "reflink" a clone is tried first and a hard link used where
+    cloning isn't supported. Fails with FileExistsError if target_path is
+    taken, and with the link() error if hard-linking isn't possible either.
+    """
+    if mode == "reflink":
+        try:
+            reflink(source_path, target_path)
+            return "reflink"
+        except OSError as e:
+            if isinstance(e, FileExistsError) or e.errno not in REFLINK_UNSUPPORTED:
+                raise
+    os.link(source_path, target_path, follow_symlinks=False)
+    return "hardlink"
+
+
+def files_identical(first: Path, second: Path, buffer_size: int = BUFFER_SIZE) -> bool:
+    """Compare two files byte for byte"""
+    with open(first, "rb") as a, open(second, "rb") as b:
+        if os.fstat(a.fileno()).st_size != os.fstat(b.fileno()).st_size:
+            return False
+        while True:
+            chunk = a.read(buffer_size)
+            if chunk != b.read(buffer_size):
+                return False
+            if not chunk:
+                return True
+
+
+def replace_with_link(duplicate_path: Path, original_path: Path,
+                      mode: str = "hardlink", verify: bool = False,
+                      sync: bool = True) -> Optional[str]:
+    """Atomically replace duplicate_path by a link to (or clone of) original_path.
+
+    The link is made under a temporary name beside the duplicate and then
+    renamed over it, so the duplicate's name never goes missing. Returns
+    the method used, or None if the files already share an inode or differ
+    when verify is set. Raises OSError if neither method is possible.
+    Without sync the caller is left to fsync the directory.
+    """
+    if os.path.samefile(duplicate_path, original_path):
+        return None
+    if verify and not files_identical(duplicate_path, original_path):
+        return None
+    directory = duplicate_path.parent
+    while True:
+        tmp_path = directory / f"{TEMP_PREFIX}{os.urandom(6).hex()}"
+        try:
+            method = link_or_clone(original_path, tmp_path, mode)
+            break
+        except FileExistsError:
+            continue
+    try:
+        os.replace(tmp_path, duplicate_path)
+    except BaseException:
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+        raise
+    if sync:
+        fsync_directory(directory)
+    return method
@@ -1,88 +1,214 @@
+import logging
+import os
 import time
+from stat import S_ISREG
 from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from .categorizer import FileCategorizer
+from .events import EventQueue
+from .iosched import BULK, FOREGROUND, io_priority
+from .journal import KEEP_RUNS, MoveJournal, find_interrupted, prune_runs, resume_run
+from .metrics import registry as metrics
 from .mover import FileMover
+from .planner import BatchPlanner, PlannedMove
+from .seen import SeenFiles
+from .snapshot import DirectorySnapshot
+
+logger = logging.getLogger(__name__)
+
+class OrganizeResult(NamedTuple):
+    """What happened to one file"""
+    source: Path
+    status: str  # "moved", "duplicate", "skipped" or "failed"
+    target: Optional[Path] = None
+    category: Optional[str] = None
 
 class FileOrganizerHandler(FileSystemEventHandler):
     def __init__(self, categorizer: FileCategorizer, mover: FileMover, 
-                 handle_duplicates: bool = True):
+                 handle_duplicates: bool = True, workers: int = 4,
+                 settle_time: float = 1.0, max_pending: int = 1000,
+                 seen: Optional[SeenFiles] = None, queue: Optional[EventQueue] = None,
+                 recursive: bool = False, duplicate_strategy: str = "rename",
+                 verify_duplicates: bool = False):
         self.categorizer = categorizer
         self.mover = mover
         self.handle_duplicates = handle_duplicates
-        self.processed_files = set()
+        # How duplicates are stored: "rename", "hardlink", "reflink" or "skip"
+        self.duplicate_strategy = duplicate_strategy
+        self.verify_duplicates = verify_duplicates
+        self.recursive = recursive
+        # Never pick up our own moves when the target lives inside the source
+        self._target_prefix = os.path.join(os.path.abspath(mover.target_base_dir), '')
+        # Files already handled, by (dev, inode, mtime); bounded and expiring
+        self.processed_files = seen if seen is not None else SeenFiles()
+        metrics.gauge('seen_files', lambda: len(self.processed_files))
+        metrics.gauge('seen_files_hit_rate', lambda: self.processed_files.hit_rate)
+        # Events are debounced here and processed on a worker pool, so the
+        # watchdog thread never blocks on hashing or moving. Several sources
+        # can share one queue; it schedules them fairly.
+        if queue is None:
+            queue = EventQueue(self.process_file, workers, settle_time, max_pending)
+        self.queue = queue
     
     def on_created(self, event):
         """Handle file creation events"""
+        self._put(event.src_path, event.is_directory)
+    
+    def on_modified(self, event):
+        """Handle file modification events"""
         if not event.is_directory:
-            self.process_file(Path(event.src_path))
+            self._put(event.src_path, False)
     
     def on_moved(self, event):
         """Handle file move events"""
-        if not event.is_directory:
-            self.process_file(Path(event.dest_path))
+        self._put(event.dest_path, event.is_directory)
     
-    def process_file(self, file_path: Path):
-        """Process a single file"""
-        # Avoid processing the same file multiple times
-        if str(file_path) in self.processed_files:
+    def _put(self, path: str, is_directory: bool):
+        if path.startswith(self._target_prefix):
             return
+        if not is_directory:
+            self.queue.put(Path(path), self.process_file)
+        elif self.recursive:
+            # A folder moved in whole produces no events for its contents
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames[:] = [d for d in dirnames
+                               if not os.path.join(dirpath, d, '').startswith(self._target_prefix)]
+                for filename in filenames:
+                    self.queue.put(Path(dirpath) / filename, self.process_file)
+    
+    def process_file(self, file_path: Path) -> OrganizeResult:
+        """Process a single file that just arrived"""
+        # Someone is probably waiting for this one: its I/O goes first
+        with io_priority(FOREGROUND):
+            return self._process_file(file_path)
+    
+    def process_backlog_file(self, file_path: Path) -> OrganizeResult:
+        """Process a file found by catch-up, behind any new arrivals"""
+        with io_priority(BULK):
+            return self._process_file(file_path)
+    
+    def _process_file(self, file_path: Path) -> OrganizeResult:
+        try:
+            stat = file_path.stat()
+        except (IOError, OSError):
+            return OrganizeResult(file_path, "skipped")
+        if not S_ISREG(stat.st_mode):
+            return OrganizeResult(file_path, "skipped")
+        # Avoid processing the same file multiple times
+        if self.processed_files.has(stat, file_path):
+            return OrganizeResult(file_path, "skipped")
         
-        # Wait a bit to ensure file is fully written
-        time.sleep(0.5)
-        
+        category = None
         try:
-            if not file_path.exists() or not file_path.is_file():
-                return
-            
+            metrics.inc('files_processed_total')
             # Categorize the file
-            category = self.categorizer.categorize_file(file_path)
+            with metrics.time('categorize'):
+                category = self.categorizer.categorize_file(file_path, stat)
             
             # Check for duplicates if enabled
             if self.handle_duplicates:
-                target_dir = self.mover.get_target_directory(category, file_path)
-                
-                # Look for existing files with same hash
-                for existing_file in target_dir.rglob('*'):
-                    if (existing_file.is_file() and 
-                        existing_file.name != file_path.name and
-                        self.categorizer.is_duplicate(file_path, existing_file)):
-                        
-                        # Handle duplicate
+                with metrics.time('dedupe'):
+                    target_dir = self.mover.get_target_directory(category, file_path)
+                    existing_file = self._find_existing_duplicate(file_path, target_dir)
+                metrics.inc('duplicate_checks_total')
+                if existing_file is not None:
+                    metrics.inc('duplicates_found_total')
+                    # Handle duplicate
+                    with metrics.time('move'):
                         success, final_path = self.mover.handle_duplicate(
-                            file_path, existing_file, "rename"
+                            file_path, existing_file, self.duplicate_strategy,
+                            verify=self.verify_duplicates
                         )
-                        if success:
-                            self.processed_files.add(str(file_path))
-                        return
+                    self._count_move(success)
+                    if success:
+                        self.processed_files.add(stat, file_path)
+                    return OrganizeResult(file_path, "duplicate" if success else "failed",
+                                          final_path, category)
             
             # Move the file
-            success, final_path = self.mover.move_file(file_path, category)
+            with metrics.time('move'):
+                success, final_path = self.mover.move_file(file_path, category)
+            self._count_move(success)
             if success:
-                self.processed_files.add(str(file_path))
+                self.processed_files.add(stat, file_path)
+            return OrganizeResult(file_path, "moved" if success else "failed",
+                                  final_path, category)
                 
         except Exception as e:
-            print(f"Error processing file {file_path}: {e}")
+            metrics.inc('errors_total')
+            logger.exception("Error processing file %s: %s", file_path, e)
+            return OrganizeResult(file_path, "failed", None, category)
+    
+    def _count_move(self, success: bool):
+        metrics.inc('files_moved_total' if success else 'move_errors_total')
+    
+    def _find_existing_duplicate(self, file_path: Path, target_dir: Path) -> Optional[Path]:
+        """Find a file under target_dir with the same contents as file_path"""
+        if self.mover.index is not None:
+            return self.mover.index.find_duplicate(file_path, within=target_dir)
+        
+        # No index: walk the category folder and compare hashes
+        for existing_file in target_dir.rglob('*'):
+            if (existing_file.is_file() and 
+                existing_file.name != file_path.name and
+                self.categorizer.is_duplicate(file_path, existing_file)):
+                return existing_file
+        return None
 
 class FileWatcher:
+    """Watch one or more source directories with a single observer.
+    
+    Every source gets its own handler (and so its own rules and target),
+    but all of them share the observer thread and one EventQueue worker
+    pool, which serves the sources round-robin.
+    """
+    
     def __init__(self, source_dir: Path, categorizer: FileCategorizer, 
-                 mover: FileMover, handle_duplicates: bool = True):
+                 mover: FileMover, handle_duplicates: bool = True,
+                 workers: int = 4, settle_time: float = 1.0, max_pending: int = 1000,
+                 seen: Optional[SeenFiles] = None, recursive: bool = False,
+                 snapshot: Optional[DirectorySnapshot] = None,
+                 duplicate_strategy: str = "rename", verify_duplicates: bool = False):
         self.source_dir = Path(source_dir)
         self.observer = Observer()
+        # What the sources looked like when last organized, for catching up
+        # on files that arrived while nothing was watching
+        self.snapshot = snapshot
         self.event_handler = FileOrganizerHandler(
-            categorizer, mover, handle_duplicates
+            categorizer, mover, handle_duplicates, workers, settle_time, max_pending, seen,
+            recursive=recursive, duplicate_strategy=duplicate_strategy,
+            verify_duplicates=verify_duplicates
         )
+        self.sources: List[Tuple[Path, FileOrganizerHandler]] = [
+            (self.source_dir, self.event_handler)
+        ]
     
-    def start_watching(self):
-        """Start watching the source directory"""
-        self.observer.schedule(
-            self.event_handler, 
-            str(self.source_dir), 
-            recursive=False
+    def add_source(self, source_dir: Path, categorizer: Optional[FileCategorizer] = None,
+                   mover: Optional[FileMover] = None,
+                   recursive: bool = False) -> FileOrganizerHandler:
+        """Watch another directory, by default with the first source's rules and target"""
+        first = self.event_handler
+        handler = FileOrganizerHandler(
+            categorizer or first.categorizer, mover or first.mover, first.handle_duplicates,
+            seen=first.processed_files, queue=first.queue, recursive=recursive,
+            duplicate_strategy=first.duplicate_strategy,
+            verify_duplicates=first.verify_duplicates
         )
+        self.sources.append((Path(source_dir), handler))
+        return handler
+    
+    def start_watching(self):
+        """Start watching every source directory"""
+        for source_dir, handler in self.sources:
+            self.observer.schedule(handler, str(source_dir), recursive=handler.recursive)
+        self.event_handler.queue.start()
         self.observer.start()
-        print(f"Started watching: {self.source_dir}")
+        for source_dir, handler in self.sources:
+            logger.info("Started watching: %s%s", source_dir,
+                        " (recursive)" if handler.recursive else "")
+        self.catch_up()
         
         try:
             while True:
@@ -94,14 +220,88 @@ class FileWatcher:
         """Stop watching the directory"""
         self.observer.stop()
         self.observer.join()
-        print("Stopped watching directory")
+        self.event_handler.queue.stop()
+        if self.snapshot is not None:
+            self._record_sources()
+            # Whatever was still queued counts as new on the next start
+            self.snapshot.forget(self.event_handler.queue.pending_paths())
+            self.snapshot.save()
+        logger.info("Stopped watching directory")
     
-    def organize_existing_files(self):
-        """Organize files that already exist in the source directory"""
-        print(f"Organizing existing files in {self.source_dir}")
+    def catch_up(self) -> int:
+        """Queue files that appeared or changed since the snapshot was taken.
         
-        for file_path in self.source_dir.iterdir():
-            if file_path.is_file():
-                self.event_handler.process_file(file_path)
+        A source with no previous snapshot is only recorded, nothing is
+        queued for it (that is what --existing is for). Returns the number
+        of files queued.
+        """
+        if self.snapshot is None:
+            return 0
+        queued = 0
+        for source_dir, handler in self.sources:
+            known = self.snapshot.has_root(source_dir)
+            for file_path, _stat, changed in self.snapshot.walk(
+                    source_dir, handler.recursive, handler.mover.target_base_dir):
+                if changed and known:
+                    handler.queue.put(file_path, handler.process_backlog_file)
+                    queued += 1
+        if queued:
+            logger.info("Catching up on %d files that arrived while not watching", queued)
+        return queued
+    
+    def _record_sources(self):
+        for source_dir, handler in self.sources:
+            for _ in self.snapshot.walk(source_dir, handler.recursive,
+                                        handler.mover.target_base_dir):
+                pass
+    
+    def organize_existing_files(self, dry_run: bool = False, jobs: int = 4,
+                                journal_dir: Optional[Path] = None,
+                                keep_runs: int = KEEP_RUNS) -> List[PlannedMove]:
+        """Organize files that already exist in the source directories.
         
-        print("Finished organizing existing files")
\ No newline at end of file
+        Returns the combined plan; with dry_run nothing is moved. With a
+        journal_dir every run is journaled there, and a source whose last
+        run was interrupted is resumed from its journal instead of scanned.
+        Only the latest keep_runs completed runs are kept.
+        """
+        full_plan: List[PlannedMove] = []
+        for source_dir, handler in self.sources:
+            planner = BatchPlanner(handler.categorizer, handler.mover, jobs,
+                                   handler.handle_duplicates, handler.duplicate_strategy,
+                                   handler.verify_duplicates)
+            run = None
+            if journal_dir is not None and not dry_run:
+                run = find_interrupted(journal_dir, source_dir, handler.mover.target_base_dir)
+            if run is not None:
+                logger.info("Resuming interrupted run %s in %s", run.run_id, source_dir)
+                plan = list(run.moves.values())
+                full_plan.extend(plan)
+                moved, failed = resume_run(run, planner)
+            else:
+                logger.info("Organizing existing files in %s", source_dir)
+                plan = planner.plan(source_dir, handler.recursive, self.snapshot)
+                full_plan.extend(plan)
+                
+                if dry_run:
+                    logger.debug("Planned %d moves", len(plan))
+                    continue
+                
+                journal = None
+                if journal_dir is not None:
+                    journal = MoveJournal.create(journal_dir, source_dir,
+                                                 handler.mover.target_base_dir)
+                try:
+                    moved, failed = planner.execute(plan, journal)
+                finally:
+                    if journal is not None:
+                        journal.close()
+            if self.snapshot is not None:
+                self.snapshot.refresh({move.source.parent for move in plan})
+                self.snapshot.save()
+            metrics.inc('files_moved_total', moved)
+            metrics.inc('move_errors_total', failed)
+            logger.info("Finished organizing existing files: %d moved, %d failed", moved, failed)
+        if journal_dir is not None and not dry_run:
+            prune_runs(journal_dir, keep_runs)
+        return full_plan
@@ -0,0 +1,77 @@
+import asyncio
+import tempfile
+import threading
+from pathlib import Path
+from organizer.aio import AsyncOrganizer
+from organizer.categorizer import FileCategorizer
+from organizer.mover import FileMover
+
+RULES = {'Documents': ['pdf'], 'Images': ['jpg']}
+
+def test_concurrent_intakes_share_the_worker_pool():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir = Path(tmp_dir) / "source"
+        source_dir.mkdir()
+        paths = []
+        for i in range(300):
+            path = source_dir / f"file{i}.{'pdf' if i % 2 else 'jpg'}"
+            path.write_text(f"contents {i}")
+            paths.append(path)
+
+        async def main():
+            async with AsyncOrganizer(FileCategorizer(RULES), FileMover(Path(tmp_dir) / "target"),
+                                      workers=3, max_pending=50) as organizer:
+                return await asyncio.gather(*(organizer.organize(path) for path in paths))
+
+        threads_before = threading.active_count()
+        results = asyncio.run(main())
+        assert threading.active_count() <= threads_before + 3
+        assert [result.status for result in results] == ["moved"] * 300
+        assert results[1].category == "Documents"
+        assert results[1].target == Path(tmp_dir) / "target" / "Documents" / "file1.pdf"
+        assert not any(source_dir.iterdir())
+
+def test_submit_waits_for_the_consumer():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir = Path(tmp_dir) / "source"
+        source_dir.mkdir()
+        for i in range(3):
+            (source_dir / f"doc{i}.pdf").write_text(f"doc {i}")
+
+        async def main():
+            organizer = AsyncOrganizer(FileCategorizer(RULES), FileMover(Path(tmp_dir) / "target"),
+                                       max_pending=2)
+            await organizer.submit(source_dir / "doc0.pdf")
+            await organizer.submit(source_dir / "doc1.pdf")
+            third = asyncio.ensure_future(organizer.submit(source_dir / "doc2.pdf"))
+            await asyncio.sleep(0.2)
+            assert not third.done()
+
+            results = organizer.results()
+            first = await results.__anext__()
+            await asyncio.wait_for(third, 5)
+            await organizer.close()
+            return [first] + [result async for result in results]
+
+        results = asyncio.run(main())
+        assert sorted(result.source.name for result in results) == ["doc0.pdf", "doc1.pdf", "doc2.pdf"]
+        assert {result.status for result in results} == {"moved"}
+
+def test_watched_files_are_bridged_into_the_loop():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir = Path(tmp_dir) / "source"
+        source_dir.mkdir()
+
+        async def main():
+            async with AsyncOrganizer(FileCategorizer(RULES), FileMover(Path(tmp_dir) / "target"),
+                                      settle_time=0.1) as organizer:
+                organizer.watch(source_dir)
+                (source_dir / "report.pdf.part").write_text("still downloading")
+                (source_dir / "report.pdf.part").rename(source_dir / "report.pdf")
+                results = organizer.results()
+                return await asyncio.wait_for(results.__anext__(), 10)
+
+        result = asyncio.run(main())
+        assert result.source == source_dir / "report.pdf"
+        assert result.status == "moved"
+        assert (Path(tmp_dir) / "target" / "Documents" / "report.pdf").exists()
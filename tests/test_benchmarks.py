@@ -0,0 +1,27 @@
+import pytest
+import tempfile
+from pathlib import Path
+from benchmarks.generator import generate_tree
+from benchmarks.run import compare, metric
+
+def test_generator_is_deterministic():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        first = generate_tree(Path(tmp_dir) / "a", files=200, seed=3, duplicate_rate=0.2)
+        second = generate_tree(Path(tmp_dir) / "b", files=200, seed=3, duplicate_rate=0.2)
+        
+        assert len(first.files) == 200
+        assert first.duplicates > 0
+        assert first.total_bytes == second.total_bytes
+        assert [p.name for p in first.files] == [p.name for p in second.files]
+        assert first.files[-1].read_bytes() == second.files[-1].read_bytes()
+
+def test_compare_flags_regressions():
+    baseline = {
+        'throughput': metric(100.0, 'files/s', True),
+        'latency': metric(10.0, 'ms', False),
+    }
+    assert compare({'throughput': metric(95.0, 'files/s', True),
+                    'latency': metric(10.5, 'ms', False)}, baseline, 0.1) == []
+    regressions = compare({'throughput': metric(50.0, 'files/s', True),
+                           'latency': metric(20.0, 'ms', False)}, baseline, 0.1)
+    assert len(regressions) == 2
@@ -51,4 +51,62 @@ def test_duplicate_detection():
         
         duplicates = categorizer.find_duplicates_in_directory(Path(tmp_dir))
         assert len(duplicates) == 1
-        assert len(duplicates[0]) == 2
\ No newline at end of file
+        assert len(duplicates[0]) == 2
+
+def test_staged_duplicate_scan_skips_unique_sizes():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = Path(tmp_dir)
+        big = b"x" * 100_000
+        (tmp_path / "big1.bin").write_bytes(big)
+        (tmp_path / "big2.bin").write_bytes(big)
+        # Same size and edges as the big files, different middle
+        (tmp_path / "big3.bin").write_bytes(big[:50_000] + b"y" + big[50_001:])
+        (tmp_path / "unique.bin").write_bytes(b"z" * 12345)
+        
+        categorizer = FileCategorizer({})
+        duplicates = categorizer.find_duplicates_in_directory(tmp_path)
+        
+        assert len(duplicates) == 1
+        assert sorted(p.name for p in duplicates[0]) == ["big1.bin", "big2.bin"]
+        
+        stats = categorizer.last_scan_stats
+        assert stats['size']['files'] == 4
+        assert stats['partial']['files'] == 3
+        assert stats['full']['files'] == 3
+        assert stats['full']['bytes_read'] == 3 * len(big)
+
+def test_duplicate_groups_stream_with_size_and_digest():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = Path(tmp_dir)
+        for name in ("a1.txt", "a2.txt"):
+            (tmp_path / name).write_bytes(b"small" * 10)
+        big = b"b" * 50_000
+        for name in ("b1.bin", "b2.bin", "b3.bin"):
+            (tmp_path / name).write_bytes(big)
+        
+        categorizer = FileCategorizer({})
+        groups = categorizer.iter_duplicates(tmp_path)
+        first = next(groups)
+        # The small files' group is out before the big files are hashed in full
+        assert categorizer.last_scan_stats['full']['files'] == 0
+        assert first.size == 50
+        assert sorted(p.name for p in first.paths) == ["a1.txt", "a2.txt"]
+        assert first.digest == categorizer.get_file_hash(tmp_path / "a1.txt")
+        
+        second = next(groups)
+        assert (second.size, len(second.paths)) == (len(big), 3)
+        assert second.digest == categorizer.get_file_hash(tmp_path / "b1.bin")
+        assert list(groups) == []
+
+def test_hash_algorithm_selection():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file1 = Path(tmp_dir) / "test1.txt"
+        file1.write_text("Hello World")
+        
+        blake = FileCategorizer({}).get_file_hash(file1)
+        md5 = FileCategorizer({}, hash_algorithm="md5").get_file_hash(file1)
+        assert blake != md5
+        assert len(md5) == 32
+        
+        with pytest.raises(ValueError):
+            FileCategorizer({}, hash_algorithm="not-a-hash")
@@ -30,4 +30,54 @@ def test_config_loading():
         settings = new_config_manager.get_settings()
         
         assert 'TestCategory' in rules
-        assert settings['test_setting'] is True
\ No newline at end of file
+        assert settings['test_setting'] is True
+
+def test_source_dirs_with_overrides():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = Path(tmp_dir) / "test_config.yaml"
+        config_manager = ConfigManager(str(config_path))
+        config_manager.update_config({
+            'rules': {'Documents': ['pdf'], 'Images': ['jpg']},
+            'settings': {
+                'target_dir': str(Path(tmp_dir) / "Organized"),
+                'source_dirs': [
+                    str(Path(tmp_dir) / "alice"),
+                    {'path': str(Path(tmp_dir) / "bob"), 'target': str(Path(tmp_dir) / "bob-sorted"),
+                     'recursive': True, 'rules': {'Invoices': {'patterns': ['invoice*']}}},
+                ],
+            }
+        })
+        
+        alice, bob = config_manager.get_sources()
+        assert alice['path'] == Path(tmp_dir) / "alice"
+        assert alice['target'] == Path(tmp_dir) / "Organized"
+        assert alice['rules'] == {'Documents': ['pdf'], 'Images': ['jpg']}
+        assert alice['recursive'] is False
+        
+        assert bob['target'] == Path(tmp_dir) / "bob-sorted"
+        assert bob['recursive'] is True
+        assert list(bob['rules']) == ['Invoices', 'Documents', 'Images']
+
+def test_compiled_cache_is_used_until_the_file_changes(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = Path(tmp_dir) / "config.yaml"
+        config_path.write_text("rules:\n  Documents: [pdf]\nsettings:\n  workers: 2\n")
+        assert ConfigManager(str(config_path)).get_settings() == {'workers': 2}
+        assert (Path(tmp_dir) / ".config.yaml.cache").exists()
+        
+        def no_parsing(file):
+            raise AssertionError("YAML parsed despite a current cache")
+        monkeypatch.setattr("organizer.config.load_yaml", no_parsing)
+        assert ConfigManager(str(config_path)).get_file_rules() == {'Documents': ['pdf']}
+        
+        monkeypatch.undo()
+        config_path.write_text("rules:\n  Documents: [pdf, txt]\nsettings:\n  workers: 8\n")
+        assert ConfigManager(str(config_path)).get_settings() == {'workers': 8}
+
+def test_invalid_rules_are_rejected():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = Path(tmp_dir) / "config.yaml"
+        config_path.write_text("rules:\n  Documents: {extension: [pdf]}\n")
+        with pytest.raises(ValueError):
+            ConfigManager(str(config_path))
+        assert not (Path(tmp_dir) / ".config.yaml.cache").exists()
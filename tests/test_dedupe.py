@@ -0,0 +1,59 @@
+import os
+import pytest
+import tempfile
+from pathlib import Path
+from organizer.categorizer import DuplicateGroup, FileCategorizer
+from organizer.dedupe import Deduplicator
+from organizer.mover import FileMover
+
+def test_dedupe_links_duplicates_and_reports_reclaimed_bytes():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir)
+        content = os.urandom(50000)
+        for name in ("a.bin", "b.bin", "c.bin"):
+            (root / name).write_bytes(content)
+        (root / "other.bin").write_bytes(os.urandom(1000))
+        categorizer = FileCategorizer({'Documents': ['pdf']})
+
+        dry = Deduplicator(dry_run=True).run(categorizer.iter_duplicates(root))
+        assert (dry.linked, dry.bytes_reclaimed) == (2, 100000)
+        assert (root / "b.bin").stat().st_nlink == 1
+
+        batches = []
+        result = Deduplicator(mode="reflink", batch_size=1).run(
+            categorizer.iter_duplicates(root), batches.append)
+        assert (result.groups, result.linked, result.bytes_reclaimed) == (1, 2, 100000)
+        assert len(batches) == 1
+        # Without FICLONE support (ext4, tmpfs) reflink falls back to hard links
+        assert (root / "b.bin").read_bytes() == (root / "c.bin").read_bytes() == content
+
+        # Already linked copies reclaim nothing
+        again = Deduplicator().run(categorizer.iter_duplicates(root))
+        assert again.bytes_reclaimed == 0
+
+def test_verify_refuses_to_link_different_contents():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir)
+        (root / "one.txt").write_text("same size, first")
+        (root / "two.txt").write_text("same size, other")
+        # A stale group, e.g. a file changed after the scan
+        group = DuplicateGroup(16, "stale", [root / "one.txt", root / "two.txt"])
+        result = Deduplicator(verify=True).run([group])
+        assert (result.linked, result.skipped) == (0, 1)
+        assert (root / "two.txt").read_text() == "same size, other"
+
+def test_mover_links_duplicate_into_target():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        target_dir = Path(tmp_dir) / "target"
+        existing = target_dir / "Documents" / "report.pdf"
+        existing.parent.mkdir(parents=True)
+        existing.write_text("report")
+        source = Path(tmp_dir) / "report.pdf"
+        source.write_text("report")
+
+        mover = FileMover(target_dir)
+        success, final_path = mover.handle_duplicate(source, existing, "hardlink", verify=True)
+        assert success
+        assert final_path == existing.parent / "report_001.pdf"
+        assert final_path.stat().st_ino == existing.stat().st_ino
+        assert not source.exists()
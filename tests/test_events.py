@@ -0,0 +1,80 @@
+import pytest
+import tempfile
+import threading
+import time
+from pathlib import Path
+from organizer.events import EventQueue
+
+def test_events_are_merged_and_partial_downloads_ignored():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        processed = []
+        lock = threading.Lock()
+        def process(path):
+            with lock:
+                processed.append(path)
+        
+        event_queue = EventQueue(process, workers=2, settle_time=0.05, poll_interval=0.01)
+        event_queue.start()
+        
+        test_file = Path(tmp_dir) / "test.txt"
+        test_file.write_text("Test content")
+        partial = Path(tmp_dir) / "movie.mkv.crdownload"
+        partial.write_text("half")
+        
+        for _ in range(10):
+            event_queue.put(test_file)
+        assert not event_queue.put(partial)
+        
+        assert event_queue.join(timeout=5)
+        event_queue.stop()
+        assert processed == [test_file]
+
+def test_growing_file_waits_until_stable():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        processed = []
+        event_queue = EventQueue(processed.append, workers=1, settle_time=0.2,
+                                 poll_interval=0.01)
+        event_queue.start()
+        
+        test_file = Path(tmp_dir) / "download.bin"
+        test_file.write_bytes(b"")
+        event_queue.put(test_file)
+        for i in range(5):
+            with open(test_file, "ab") as f:
+                f.write(b"x" * 1024)
+            time.sleep(0.05)
+            assert processed == []
+        
+        assert event_queue.join(timeout=5)
+        event_queue.stop()
+        assert processed == [test_file]
+        assert test_file.stat().st_size == 5 * 1024
+
+def test_sources_are_served_round_robin():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        order = []
+        lock = threading.Lock()
+        def busy(path):
+            with lock:
+                order.append("busy")
+        def quiet(path):
+            with lock:
+                order.append("quiet")
+        
+        busy_files = [Path(tmp_dir) / f"busy{i}.bin" for i in range(20)]
+        quiet_files = [Path(tmp_dir) / f"quiet{i}.bin" for i in range(2)]
+        for path in busy_files + quiet_files:
+            path.write_bytes(b"x")
+        
+        event_queue = EventQueue(busy, workers=1, settle_time=0.1, poll_interval=0.02)
+        event_queue.start()
+        for path in busy_files:
+            event_queue.put(path)
+        for path in quiet_files:
+            event_queue.put(path, quiet)
+        
+        assert event_queue.join(timeout=5)
+        event_queue.stop()
+        assert len(order) == 22
+        # The quiet source isn't stuck behind the busy one's backlog
+        assert order[:4].count("quiet") == 2
@@ -0,0 +1,37 @@
+import pytest
+import hashlib
+import tempfile
+from pathlib import Path
+from organizer.hasher import HashEngine
+
+def test_engine_matches_hashlib():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data = bytes(range(256)) * 5000
+        test_file = Path(tmp_dir) / "data.bin"
+        test_file.write_bytes(data)
+        expected = hashlib.blake2b(data).hexdigest()
+        
+        # Small buffer and a low mmap threshold exercise both read paths
+        buffered = HashEngine(jobs=1, buffer_size=4096, mmap_threshold=len(data) + 1)
+        mapped = HashEngine(jobs=1, mmap_threshold=1)
+        
+        assert buffered.hash_file(test_file) == (expected, len(data))
+        assert mapped.hash_file(test_file) == (expected, len(data))
+
+def test_parallel_hash_files():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for i in range(20):
+            path = Path(tmp_dir) / f"file{i}.txt"
+            path.write_text(f"content {i % 5}")
+            paths.append(path)
+        missing = Path(tmp_dir) / "missing.txt"
+        
+        engine = HashEngine("sha256", jobs=4)
+        results = {path: digest for path, digest, _ in engine.hash_files(paths + [missing])}
+        engine.close()
+        
+        assert len(results) == 21
+        assert results[missing] == ""
+        for path in paths:
+            assert results[path] == hashlib.sha256(path.read_bytes()).hexdigest()
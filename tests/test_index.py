@@ -0,0 +1,81 @@
+import pytest
+import tempfile
+from pathlib import Path
+from organizer.categorizer import FileCategorizer
+from organizer.index import DuplicateIndex
+from organizer.mover import FileMover
+
+def test_index_finds_duplicate_without_rehashing_unique_sizes():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        target_dir = Path(tmp_dir) / "target"
+        (target_dir / "Documents").mkdir(parents=True)
+        (target_dir / "Documents" / "a.txt").write_text("Same content")
+        (target_dir / "Documents" / "b.txt").write_text("Other size content")
+        # An interrupted copy's temporary file is not part of the tree
+        (target_dir / "Documents" / ".organizer-x1y2z3").write_text("Same content")
+        
+        hashed = []
+        categorizer = FileCategorizer({})
+        def hash_func(path):
+            hashed.append(path.name)
+            return categorizer.get_file_hash(path)
+        
+        index = DuplicateIndex.for_target(target_dir, hash_func)
+        index.sync(target_dir)
+        assert len(index) == 2
+        
+        incoming = Path(tmp_dir) / "incoming.txt"
+        incoming.write_text("Same content")
+        found = index.find_duplicate(incoming, within=target_dir / "Documents")
+        
+        assert found == target_dir / "Documents" / "a.txt"
+        assert "b.txt" not in hashed
+        
+        unique = Path(tmp_dir) / "unique.txt"
+        unique.write_text("x")
+        hashed.clear()
+        assert index.find_duplicate(unique) is None
+        assert hashed == []
+        index.close()
+
+def test_index_detects_stale_entries():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        target_dir = Path(tmp_dir) / "target"
+        target_dir.mkdir()
+        existing = target_dir / "a.txt"
+        existing.write_text("Same content")
+        
+        index = DuplicateIndex.for_target(target_dir, FileCategorizer({}).get_file_hash)
+        index.sync(target_dir)
+        
+        incoming = Path(tmp_dir) / "incoming.txt"
+        incoming.write_text("Same content")
+        assert index.find_duplicate(incoming) == existing
+        
+        # Same size, different contents: the stored digest must be refreshed
+        existing.write_text("Diff content")
+        assert index.find_duplicate(incoming) is None
+        
+        existing.unlink()
+        assert index.find_duplicate(incoming) is None
+        assert len(index) == 0
+        index.close()
+
+def test_mover_keeps_index_up_to_date():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir = Path(tmp_dir) / "source"
+        target_dir = Path(tmp_dir) / "target"
+        source_dir.mkdir()
+        
+        index = DuplicateIndex.for_target(target_dir, FileCategorizer({}).get_file_hash)
+        mover = FileMover(target_dir, index=index)
+        
+        test_file = source_dir / "test.txt"
+        test_file.write_text("Test content")
+        success, final_path = mover.move_file(test_file, "Documents")
+        assert success
+        
+        incoming = source_dir / "again.txt"
+        incoming.write_text("Test content")
+        assert index.find_duplicate(incoming) == final_path
+        index.close()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from organizer.hasher import HashEngine, hash_path
+from organizer.iosched import BULK, FOREGROUND, IOScheduler, MIN_SCALE, io_priority
+
+def test_budget_paces_bulk_reads_but_not_foreground():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = Path(tmp_dir) / "big.bin"
+        file_path.write_bytes(os.urandom(400_000))
+        scheduler = IOScheduler(bytes_per_second=1_000_000, pressure_threshold=None)
+        engine = HashEngine(jobs=1, buffer_size=100_000, scheduler=scheduler)
+
+        started = time.monotonic()
+        digest, bytes_read = engine.hash_file(file_path)
+        elapsed = time.monotonic() - started
+        # Starts with no saved-up budget: 300 kB must wait for tokens
+        assert 0.25 < elapsed < 2.0
+        assert (digest, bytes_read) == hash_path(str(file_path), engine.algorithm)
+
+        started = time.monotonic()
+        with io_priority(FOREGROUND):
+            engine.hash_file(file_path)
+        assert time.monotonic() - started < 0.2
+
+def test_waiting_requests_go_foreground_first_then_smallest():
+    scheduler = IOScheduler(bytes_per_second=1_000_000, pressure_threshold=None)
+    scheduler.acquire(300_000, FOREGROUND)  # into debt, so the rest must queue
+    order = []
+
+    def request(name, priority, size):
+        scheduler.acquire(10_000, priority, size)
+        order.append(name)
+
+    threads = [threading.Thread(target=request, args=args) for args in
+               [("large", BULK, 10_000_000), ("small", BULK, 20_000), ("medium", BULK, 1_000_000)]]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    request("foreground", FOREGROUND, 50_000_000)
+    for thread in threads:
+        thread.join()
+    assert order == ["foreground", "small", "medium", "large"]
+    assert scheduler.waited > 0
+
+def test_rate_backs_off_under_pressure_and_recovers():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pressure = Path(tmp_dir) / "io"
+
+        def report(avg10):
+            pressure.write_text(f"some avg10={avg10:.2f} avg60=0.00 avg300=0.00 total=0\n"
+                                "full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n")
+
+        report(0.0)
+        scheduler = IOScheduler(bytes_per_second=8_000_000, pressure_threshold=10.0,
+                                pressure_path=str(pressure), interval=0.0)
+        report(45.0)
+        for _ in range(6):
+            scheduler.acquire(1, FOREGROUND)
+        assert scheduler.pressure == 45.0
+        assert scheduler.rate == 8_000_000 * MIN_SCALE
+
+        report(1.0)
+        scheduler.acquire(1, FOREGROUND)
+        assert scheduler.rate == 8_000_000 * (MIN_SCALE + 1 / 8)
+        for _ in range(10):
+            scheduler.acquire(1, FOREGROUND)
+        assert scheduler.rate == 8_000_000
+
+        # Without a budget, pressure throttles relative to the measured rate
+        unlimited = IOScheduler(pressure_threshold=10.0, pressure_path=str(pressure),
+                                interval=0.0)
+        assert unlimited.rate is None
+        report(45.0)
+        unlimited.acquire(1, FOREGROUND)
+        assert unlimited.rate is not None
+        report(0.0)
+        for _ in range(10):
+            unlimited.acquire(1, FOREGROUND)
+        assert unlimited.rate is None
@@ -0,0 +1,108 @@
+import os
+import tempfile
+from pathlib import Path
+from organizer.categorizer import FileCategorizer
+from organizer.journal import (JournalRun, MoveJournal, find_interrupted, list_runs, prune_runs,
+                               resume_run, undo_run)
+from organizer.mover import FileMover
+from organizer.planner import BatchPlanner
+
+RULES = {'Documents': ['pdf', 'txt']}
+
+def _setup(tmp_dir, count):
+    source_dir = Path(tmp_dir) / "source"
+    source_dir.mkdir()
+    for i in range(count):
+        (source_dir / f"doc{i}.pdf").write_text(f"document {i}")
+    mover = FileMover(Path(tmp_dir) / "target")
+    planner = BatchPlanner(FileCategorizer(RULES), mover)
+    return source_dir, mover, planner
+
+def test_run_is_journaled_and_undone():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir, mover, planner = _setup(tmp_dir, 3)
+        journal_dir = Path(tmp_dir) / "journal"
+        plan = planner.plan(source_dir)
+        journal = MoveJournal.create(journal_dir, source_dir, mover.target_base_dir)
+        assert planner.execute(plan, journal) == (3, 0)
+        journal.close()
+
+        run = JournalRun(journal.path)
+        assert run.finished and not run.interrupted
+        assert sorted(path.name for path in run.done.values()) == ["doc0.pdf", "doc1.pdf", "doc2.pdf"]
+        assert find_interrupted(journal_dir, source_dir, mover.target_base_dir) is None
+
+        (source_dir / "doc1.pdf").write_text("a new file with the old name")
+        assert undo_run(run) == (2, 1)
+        assert (source_dir / "doc0.pdf").read_text() == "document 0"
+        assert (source_dir / "doc1.pdf").read_text() == "a new file with the old name"
+        assert (mover.target_base_dir / "Documents" / "doc1.pdf").exists()
+
+        # Undo is journaled too: running it again only retries what failed
+        (source_dir / "doc1.pdf").unlink()
+        run = JournalRun(journal.path)
+        assert undo_run(run) == (1, 0)
+        assert JournalRun(journal.path).undo_finished
+        assert not any((mover.target_base_dir / "Documents").iterdir())
+
+def test_interrupted_run_resumes_without_rescanning():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir, mover, planner = _setup(tmp_dir, 5)
+        journal_dir = Path(tmp_dir) / "journal"
+        plan = planner.plan(source_dir)
+        plan[2] = plan[2]._replace(same_device=False)
+        plan[4] = plan[4]._replace(same_device=False)
+        journal = MoveJournal.create(journal_dir, source_dir, mover.target_base_dir)
+        journal.begin(plan)
+        copied = plan[2].source.read_text()
+        documents = mover.target_base_dir / "Documents"
+        documents.mkdir(parents=True)
+
+        # The crash: move 0 finished (its record lost), move 1 linked but
+        # not unlinked, move 2 found its name taken and reserved stem_001,
+        # move 3 never started and move 4 left a partial copy behind
+        os.rename(plan[0].source, plan[0].target)
+        os.link(plan[1].source, plan[1].target)
+        (documents / f"{plan[2].target.stem}_001.pdf").touch()
+        (documents / ".organizer-k3j2x9").write_text("docu")
+        # Not a placeholder: same-device moves link, they never reserve
+        plan[3].target.touch()
+        journal._file.write('{"op": "done", "id"')
+        journal._file.close()
+
+        # Arrived after the run started: not part of it
+        (source_dir / "late.pdf").write_text("late")
+
+        run = find_interrupted(journal_dir, source_dir, mover.target_base_dir)
+        assert run is not None and sorted(run.pending()) == [0, 1, 2, 3, 4]
+        assert resume_run(run, BatchPlanner(FileCategorizer(RULES), FileMover(documents.parent))) == (5, 0)
+
+        assert sorted(os.listdir(documents)) == sorted(
+            [f"doc{i}.pdf" for i in range(5)] + [f"{plan[3].target.stem}_001.pdf"])
+        assert os.listdir(source_dir) == ["late.pdf"]
+        assert plan[2].target.read_text() == copied
+        assert plan[3].target.read_text() == ""
+        run = JournalRun(run.path)
+        assert run.finished and len(run.done) == 5
+        assert find_interrupted(journal_dir, source_dir, mover.target_base_dir) is None
+
+        assert undo_run(run) == (5, 0)
+        assert sorted(os.listdir(source_dir)) == ["doc0.pdf", "doc1.pdf", "doc2.pdf",
+                                                  "doc3.pdf", "doc4.pdf", "late.pdf"]
+
+def test_prune_keeps_latest_completed_and_interrupted_runs():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir, mover, planner = _setup(tmp_dir, 1)
+        journal_dir = Path(tmp_dir) / "journal"
+        interrupted = MoveJournal.create(journal_dir, source_dir, mover.target_base_dir)
+        interrupted.close()
+        completed = []
+        for _ in range(3):
+            journal = MoveJournal.create(journal_dir, source_dir, mover.target_base_dir)
+            journal.finish()
+            journal.close()
+            completed.append(journal.run_id)
+
+        assert prune_runs(journal_dir, keep=2) == 1
+        assert [run.run_id for run in list_runs(journal_dir)] == [interrupted.run_id] + completed[1:]
+        assert prune_runs(journal_dir, keep=2) == 0
@@ -0,0 +1,88 @@
+import io
+import json
+import logging
+import pytest
+import tempfile
+import urllib.request
+from pathlib import Path
+from organizer.events import EventQueue
+from organizer.log import JsonFormatter
+from organizer.metrics import MetricsExporter, MetricsRegistry, registry
+
+def test_disabled_registry_records_nothing():
+    metrics = MetricsRegistry()
+    metrics.inc('events_total')
+    metrics.observe('move', 0.5)
+    with metrics.time('categorize'):
+        pass
+    assert metrics.snapshot() == {'counters': {}, 'gauges': {}, 'histograms': {}}
+
+def test_prometheus_rendering_and_http_endpoint():
+    metrics = MetricsRegistry()
+    metrics.enable()
+    metrics.inc('files_moved_total', 3)
+    metrics.observe('move', 0.003)
+    metrics.observe('move', 2.0)
+    metrics.gauge('queue_pending', lambda: 7)
+
+    text = metrics.render_prometheus()
+    assert 'organizer_files_moved_total 3' in text
+    assert 'organizer_queue_pending 7' in text
+    assert 'organizer_move_seconds_bucket{le="0.005"} 1' in text
+    assert 'organizer_move_seconds_bucket{le="+Inf"} 2' in text
+    assert 'organizer_move_seconds_count 2' in text
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        stats_file = Path(tmp_dir) / "stats.json"
+        exporter = MetricsExporter(metrics, port=0, stats_file=stats_file, interval=60)
+        exporter.start()
+        try:
+            url = f"http://127.0.0.1:{exporter.port}/metrics"
+            with urllib.request.urlopen(url, timeout=5) as response:
+                assert b'organizer_files_moved_total 3' in response.read()
+        finally:
+            exporter.stop()
+        stats = json.loads(stats_file.read_text())
+        assert stats['counters']['files_moved_total'] == 3
+        assert stats['histograms']['move']['count'] == 2
+
+def test_event_queue_reports_stage_latency():
+    registry.reset()
+    registry.enable()
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            event_queue = EventQueue(lambda path: None, workers=1,
+                                     settle_time=0.02, poll_interval=0.01)
+            event_queue.start()
+            test_file = Path(tmp_dir) / "test.txt"
+            test_file.write_text("Test content")
+            event_queue.put(test_file)
+            event_queue.put(test_file)
+            event_queue.put(Path(tmp_dir) / "video.mp4.part")
+            assert event_queue.join(timeout=5)
+            event_queue.stop()
+        snapshot = registry.snapshot()
+        assert snapshot['counters']['events_total'] == 3
+        assert snapshot['counters']['events_merged_total'] == 1
+        assert snapshot['counters']['events_ignored_total'] == 1
+        assert snapshot['histograms']['stabilize']['count'] == 1
+        assert snapshot['gauges']['queue_pending'] == 0
+    finally:
+        registry.disable()
+        registry.reset()
+
+def test_json_log_lines_carry_extra_fields():
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+    logger = logging.getLogger("organizer.test")
+    logger.addHandler(handler)
+    try:
+        logger.warning("Moved: %s", "a.pdf", extra={'src': Path("a.pdf"), 'size': 10})
+    finally:
+        logger.removeHandler(handler)
+    entry = json.loads(stream.getvalue())
+    assert entry['message'] == "Moved: a.pdf"
+    assert entry['level'] == "WARNING"
+    assert entry['src'] == "a.pdf"
+    assert entry['size'] == 10
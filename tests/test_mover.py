@@ -33,4 +33,72 @@ def test_unique_filename_generation():
         mover = FileMover(target_dir)
         unique_name = mover.get_unique_filename(target_dir, "test.txt")
         
-        assert unique_name == "test_001.txt"
\ No newline at end of file
+        assert unique_name == "test_001.txt"
+
+def test_name_index_allocates_after_highest_suffix():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        target_dir = Path(tmp_dir)
+        for name in ["scan.pdf", "scan_001.pdf", "scan_007.pdf", "other.pdf"]:
+            (target_dir / name).write_text("existing")
+        
+        mover = FileMover(target_dir)
+        assert mover.get_unique_filename(target_dir, "scan.pdf") == "scan_008.pdf"
+        assert mover.get_unique_filename(target_dir, "scan.pdf") == "scan_009.pdf"
+        assert mover.get_unique_filename(target_dir, "new.pdf") == "new.pdf"
+        assert mover.get_unique_filename(target_dir, "new.pdf") == "new_001.pdf"
+
+def test_reserve_skips_names_created_behind_its_back():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        target_dir = Path(tmp_dir)
+        mover = FileMover(target_dir)
+        first = mover.names.reserve(target_dir, "report.pdf")
+        assert first == target_dir / "report.pdf"
+        
+        # Another process creates the next name after our listing
+        (target_dir / "report_001.pdf").write_text("someone else")
+        second = mover.names.reserve(target_dir, "report.pdf")
+        assert second == target_dir / "report_002.pdf"
+        assert (target_dir / "report_001.pdf").read_text() == "someone else"
+
+def test_concurrent_moves_never_collide():
+    from concurrent.futures import ThreadPoolExecutor
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        target_dir = Path(tmp_dir) / "target"
+        sources = []
+        for i in range(50):
+            source_dir = Path(tmp_dir) / f"source{i}"
+            source_dir.mkdir()
+            source = source_dir / "scan.pdf"
+            source.write_text(f"scan {i}")
+            sources.append(source)
+        
+        mover = FileMover(target_dir)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda p: mover.move_file(p, "Documents"), sources))
+        
+        final_paths = {final_path for success, final_path in results if success}
+        assert len(final_paths) == 50
+        contents = {p.read_text() for p in (target_dir / "Documents").iterdir()}
+        assert contents == {f"scan {i}" for i in range(50)}
+
+def test_move_without_hardlink_support(monkeypatch):
+    import errno
+    import os
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        target_dir = Path(tmp_dir) / "target"
+        (target_dir / "Documents").mkdir(parents=True)
+        (target_dir / "Documents" / "test.txt").write_text("existing")
+        test_file = Path(tmp_dir) / "test.txt"
+        test_file.write_text("Test content")
+        
+        def no_link(src, dst, **kwargs):
+            raise OSError(errno.EPERM, "Operation not permitted")
+        monkeypatch.setattr(os, "link", no_link)
+        
+        mover = FileMover(target_dir)
+        success, final_path = mover.move_file(test_file, "Documents")
+        
+        assert success
+        assert final_path == target_dir / "Documents" / "test_001.txt"
+        assert final_path.read_text() == "Test content"
+        assert not test_file.exists()
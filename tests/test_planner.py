@@ -0,0 +1,123 @@
+import pytest
+import tempfile
+from pathlib import Path
+from organizer.categorizer import FileCategorizer
+from organizer.index import DuplicateIndex
+from organizer.mover import FileMover
+from organizer.planner import BatchPlanner
+
+def test_plan_and_execute_batch():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir = Path(tmp_dir) / "source"
+        target_dir = Path(tmp_dir) / "target"
+        source_dir.mkdir()
+        (target_dir / "Documents").mkdir(parents=True)
+        (target_dir / "Documents" / "report.pdf").write_text("existing")
+        (target_dir / "Documents" / "report_001.pdf").write_text("existing")
+        
+        (source_dir / "report.pdf").write_text("new report")
+        (source_dir / "photo.jpg").write_text("image")
+        (source_dir / "notes").mkdir()
+        
+        categorizer = FileCategorizer({'Documents': ['pdf'], 'Images': ['jpg']})
+        planner = BatchPlanner(categorizer, FileMover(target_dir))
+        plan = planner.plan(source_dir)
+        
+        targets = {move.source.name: move.target for move in plan}
+        assert targets == {
+            "report.pdf": target_dir / "Documents" / "report_002.pdf",
+            "photo.jpg": target_dir / "Images" / "photo.jpg",
+        }
+        assert all(move.same_device for move in plan)
+        # Planning alone touches nothing
+        assert not (target_dir / "Images").exists()
+        
+        moved, failed = planner.execute(plan)
+        assert (moved, failed) == (2, 0)
+        assert (target_dir / "Documents" / "report_002.pdf").read_text() == "new report"
+        assert (target_dir / "Images" / "photo.jpg").exists()
+        assert [p.name for p in source_dir.iterdir()] == ["notes"]
+
+def test_recursive_plan_skips_target_inside_source():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir = Path(tmp_dir)
+        target_dir = source_dir / "Organized"
+        (target_dir / "Documents").mkdir(parents=True)
+        (target_dir / "Documents" / "old.pdf").write_text("organized")
+        (source_dir / "projects" / "2024").mkdir(parents=True)
+        (source_dir / "projects" / "2024" / "spec.pdf").write_text("spec")
+        (source_dir / "top.pdf").write_text("top")
+        
+        categorizer = FileCategorizer({'Documents': ['pdf']})
+        planner = BatchPlanner(categorizer, FileMover(target_dir))
+        
+        assert [move.source.name for move in planner.plan(source_dir)] == ["top.pdf"]
+        plan = planner.plan(source_dir, recursive=True)
+        assert sorted(move.source.name for move in plan) == ["spec.pdf", "top.pdf"]
+        assert planner.execute(plan) == (2, 0)
+        assert (target_dir / "Documents" / "spec.pdf").read_text() == "spec"
+
+@pytest.mark.parametrize("use_index", [False, True])
+def test_duplicates_are_planned_next_to_their_copy(use_index):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir = Path(tmp_dir) / "source"
+        target_dir = Path(tmp_dir) / "target"
+        source_dir.mkdir()
+        (target_dir / "Documents" / "2023").mkdir(parents=True)
+        (target_dir / "Documents" / "2023" / "report.pdf").write_text("same report")
+        (source_dir / "report-copy.pdf").write_text("same report")
+        (source_dir / "notes.pdf").write_text("same notes")
+        (source_dir / "notes (1).pdf").write_text("same notes")
+        (source_dir / "other.pdf").write_text("other notes")
+        
+        categorizer = FileCategorizer({'Documents': ['pdf']})
+        index = None
+        if use_index:
+            index = DuplicateIndex.for_target(target_dir, categorizer.get_file_hash,
+                                              categorizer.hash_algorithm)
+            index.sync(target_dir)
+        planner = BatchPlanner(categorizer, FileMover(target_dir, index=index),
+                               handle_duplicates=True)
+        plan = {move.source.name: move for move in planner.plan(source_dir)}
+        
+        existing = target_dir / "Documents" / "2023" / "report.pdf"
+        assert plan["report-copy.pdf"].duplicate_of == existing
+        assert plan["report-copy.pdf"].target == existing.parent / "report-copy.pdf"
+        notes = sorted([plan["notes.pdf"], plan["notes (1).pdf"]],
+                       key=lambda move: move.duplicate_of is not None)
+        assert notes[0].duplicate_of is None and notes[1].duplicate_of == notes[0].target
+        assert plan["other.pdf"].duplicate_of is None
+        
+        assert planner.execute(list(plan.values())) == (4, 0)
+        assert (existing.parent / "report-copy.pdf").read_text() == "same report"
+        assert not any(source_dir.iterdir())
+
+def test_duplicate_strategies_apply_to_batches():
+    for strategy in ("hardlink", "skip", "replace"):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source_dir = Path(tmp_dir) / "source"
+            target_dir = Path(tmp_dir) / "target"
+            source_dir.mkdir()
+            for name in ("a1.pdf", "a2.pdf", "a3.pdf"):
+                (source_dir / name).write_text("same contents")
+            
+            planner = BatchPlanner(FileCategorizer({'Documents': ['pdf']}), FileMover(target_dir),
+                                   handle_duplicates=True, duplicate_strategy=strategy,
+                                   verify_duplicates=True)
+            plan = planner.plan(source_dir)
+            documents = target_dir / "Documents"
+            if strategy == "skip":
+                assert len(plan) == 1
+                assert planner.execute(plan) == (1, 0)
+                assert len(list(source_dir.iterdir())) == 2
+                continue
+            
+            assert planner.execute(plan) == (3, 0)
+            assert not any(source_dir.iterdir())
+            files = list(documents.iterdir())
+            if strategy == "hardlink":
+                assert sorted(path.name for path in files) == ["a1.pdf", "a2.pdf", "a3.pdf"]
+                assert {path.stat().st_ino for path in files} == {files[0].stat().st_ino}
+                assert files[0].stat().st_nlink == 3
+            else:
+                assert len(files) == 1 and files[0].read_text() == "same contents"
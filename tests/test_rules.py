@@ -0,0 +1,84 @@
+import pytest
+import os
+import tempfile
+import time
+from pathlib import Path
+from organizer.rules import RuleEngine, parse_size
+
+def test_first_match_precedence_and_compound_extensions():
+    engine = RuleEngine({
+        'Tarballs': ['tar.gz', 'tgz'],
+        'Archives': ['zip', 'gz'],
+        'Installers': {'patterns': ['*setup*.exe', '*.dmg']},
+        'Invoices': {'regex': [r'^invoice-\d+']},
+        'Documents': ['pdf', 'PDF'],
+        'Others': []
+    })
+    
+    assert engine.classify(Path('backup.TAR.GZ')) == 'Tarballs'
+    assert engine.classify(Path('log.gz')) == 'Archives'
+    assert engine.classify(Path('Firefox Setup 120.exe')) == 'Installers'
+    assert engine.classify(Path('tool.exe')) == 'Others'
+    # Invoices is listed before Documents, so it wins for invoice PDFs
+    assert engine.classify(Path('invoice-2024.pdf')) == 'Invoices'
+    assert engine.classify(Path('report.pdf')) == 'Documents'
+    assert engine.classify(Path('.bashrc')) == 'Others'
+    assert engine.classify(Path('download')) == 'Others'
+    assert engine.classify_names(['a.zip', 'b.tar.gz', 'c']) == ['Archives', 'Tarballs', 'Others']
+
+def test_name_criteria_of_one_rule_must_all_match():
+    engine = RuleEngine({
+        'Invoices': {'extensions': ['pdf'], 'regex': ['^invoice']},
+        'Setups': {'patterns': ['*setup*'], 'regex': [r'\.exe$']},
+        'Documents': ['pdf', 'txt'],
+        'Programs': ['exe'],
+    })
+    
+    assert engine.classify(Path('invoice-7.pdf')) == 'Invoices'
+    assert engine.classify(Path('report.pdf')) == 'Documents'
+    assert engine.classify(Path('invoice.txt')) == 'Documents'
+    assert engine.classify(Path('invoice')) == 'Others'
+    assert engine.classify(Path('tool-setup.exe')) == 'Setups'
+    assert engine.classify(Path('tool.exe')) == 'Programs'
+    assert engine.classify(Path('setup.txt')) == 'Documents'
+    assert engine.classify_names(['report.pdf', 'invoice-1.PDF']) == ['Documents', 'Invoices']
+
+def test_size_age_and_source_conditions():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = Path(tmp_dir) / "work"
+        work_dir.mkdir()
+        big = Path(tmp_dir) / "big.iso"
+        big.write_bytes(b"x" * 2048)
+        small = Path(tmp_dir) / "small.iso"
+        small.write_bytes(b"x" * 10)
+        old = Path(tmp_dir) / "old.txt"
+        old.write_text("old")
+        old_time = time.time() - 40 * 24 * 3600
+        os.utime(old, (old_time, old_time))
+        new = Path(tmp_dir) / "new.txt"
+        new.write_text("new")
+        work_file = work_dir / "notes.txt"
+        work_file.write_text("work")
+        
+        engine = RuleEngine({
+            'Work': {'source_dirs': [str(work_dir)]},
+            'DiskImages': {'extensions': ['iso'], 'min_size': '1KiB'},
+            'Stale': {'extensions': ['txt'], 'min_age_days': 30},
+            'Documents': ['txt'],
+            'Others': []
+        })
+        
+        assert engine.classify(big) == 'DiskImages'
+        assert engine.classify(small) == 'Others'
+        assert engine.classify(old) == 'Stale'
+        assert engine.classify(new) == 'Documents'
+        assert engine.classify(work_file) == 'Work'
+
+def test_parse_size_and_invalid_rules():
+    assert parse_size(100) == 100
+    assert parse_size("10MB") == 10_000_000
+    assert parse_size("1.5 KiB") == 1536
+    with pytest.raises(ValueError):
+        parse_size("ten megabytes")
+    with pytest.raises(ValueError):
+        RuleEngine({'Bad': {'extension': ['pdf']}})
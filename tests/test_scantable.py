@@ -0,0 +1,36 @@
+import os
+import pytest
+import tempfile
+from pathlib import Path
+from organizer import scantable
+from organizer.scantable import FileRecord, ScanTable
+
+def test_rows_round_trip_and_sort_by_size():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        table = ScanTable()
+        names = ["b.bin", "a.bin", "ünïcode.txt", "c.bin"]
+        for i, name in enumerate(names):
+            directory = os.path.join(tmp_dir, "sub" if i % 2 else "")
+            os.makedirs(directory, exist_ok=True)
+            path = Path(directory) / name
+            path.write_bytes(b"x" * (len(names) - i))
+            assert table.add(table.intern_dir(str(path.parent)), name, path.stat()) == i
+
+        assert len(table) == 4 and len(table.dirs) == 2
+        assert table.name(2) == "ünïcode.txt"
+        assert table.full_path(1) == Path(tmp_dir) / "sub" / "a.bin"
+        stat = table.full_path(3).stat()
+        record = table.record(3)
+        assert (record.st_ino, record.st_size, record.st_mtime_ns) == \
+            (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        assert list(table.rows_by_size()) == [3, 2, 1, 0]
+
+def test_rows_by_size_merges_sorted_runs(monkeypatch):
+    monkeypatch.setattr(scantable, 'SORT_RUN', 3)
+    table = ScanTable()
+    dir_id = table.intern_dir("/downloads")
+    sizes = [7, 5 << 30, 1, 7, 0, 5 << 30, 7, 1, 3, 2]
+    for i, size in enumerate(sizes):
+        table.add(dir_id, f"file{i}", FileRecord(1, i, size, 0))
+    # By size, and in table order within a size
+    assert list(table.rows_by_size()) == sorted(range(len(sizes)), key=sizes.__getitem__)
@@ -0,0 +1,73 @@
+import os
+import pytest
+import tempfile
+import time
+from pathlib import Path
+from organizer.categorizer import FileCategorizer
+from organizer.mover import FileMover
+from organizer.seen import SeenFiles
+from organizer.watcher import FileOrganizerHandler
+
+def test_reused_name_is_not_mistaken_for_seen_file():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        seen = SeenFiles()
+        download = Path(tmp_dir) / "report.pdf"
+        download.write_text("first")
+        seen.add(download.stat())
+        assert download.stat() in seen
+
+        # A new download under the same name gets a new inode
+        keep = Path(tmp_dir) / "keep"
+        os.rename(download, keep)
+        download.write_text("second")
+        assert download.stat() not in seen
+        assert seen.hits == 1
+        assert seen.misses == 1
+        assert seen.hit_rate == 0.5
+
+def test_entries_are_bounded_and_expire():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        stats = []
+        for i in range(5):
+            path = Path(tmp_dir) / f"file{i}.txt"
+            path.write_text(str(i))
+            stats.append(path.stat())
+
+        seen = SeenFiles(max_entries=3, ttl=None)
+        for stat in stats[:3]:
+            seen.add(stat)
+        assert stats[0] in seen  # now the most recently used
+        seen.add(stats[3])
+        seen.add(stats[4])
+        assert len(seen) == 3
+        assert stats[0] in seen
+        assert stats[1] not in seen
+        assert stats[2] not in seen
+        assert seen.evictions == 2
+
+        expiring = SeenFiles(ttl=0.05)
+        expiring.add(stats[0])
+        assert stats[0] in expiring
+        time.sleep(0.1)
+        assert stats[0] not in expiring
+        assert len(expiring) == 0
+
+def test_hard_links_are_seen_separately():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir = Path(tmp_dir) / "source"
+        source_dir.mkdir()
+        links = [source_dir / name for name in ("a1.pdf", "a2.pdf", "a3.pdf")]
+        links[0].write_text("linked")
+        for link in links[1:]:
+            os.link(links[0], link)
+        seen = SeenFiles()
+        seen.add(links[1].stat(), links[1])
+        assert seen.has(links[1].stat(), links[1])
+        assert not seen.has(links[0].stat(), links[0])
+
+        handler = FileOrganizerHandler(FileCategorizer({'Documents': ['pdf']}),
+                                       FileMover(Path(tmp_dir) / "target"),
+                                       handle_duplicates=False)
+        assert [handler.process_file(link).status for link in links] == ["moved"] * 3
+        assert not any(source_dir.iterdir())
+        handler.queue.stop()
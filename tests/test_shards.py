@@ -0,0 +1,70 @@
+import os
+import pytest
+import tempfile
+from pathlib import Path
+from organizer.categorizer import FileCategorizer
+from organizer.shards import ShardReader, ShardWriter, merge_shards
+
+def test_merge_finds_duplicates_across_roots():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        shared = os.urandom(30000)
+        roots = [Path(tmp_dir) / name for name in ("alice", "bob", "archive")]
+        for i, root in enumerate(roots):
+            (root / "sub").mkdir(parents=True)
+            (root / "sub" / "shared.bin").write_bytes(shared)
+            (root / "own.txt").write_text(f"only in root {i}")
+        (roots[0] / "again.txt").write_text("only in root 2")  # same as archive/own.txt
+
+        categorizer = FileCategorizer({'Documents': ['pdf']})
+        shards = []
+        for root in roots:
+            shards.append(Path(tmp_dir) / "shards" / f"{root.name}.shard")
+            assert categorizer.write_shard(root, shards[-1]) in (2, 3)
+
+        with ShardReader(shards[0]) as reader:
+            assert reader.algorithm == categorizer.hash_algorithm
+            assert reader.root == roots[0]
+            records = list(reader)
+            assert records == sorted(records)
+
+        groups = list(merge_shards(shards))
+        found = sorted(sorted(str(p.relative_to(tmp_dir)) for p in paths) for _size, _digest, paths in groups)
+        assert found == [
+            ["alice/again.txt", "archive/own.txt"],
+            [os.path.join(name, "sub", "shared.bin") for name in ("alice", "archive", "bob")],
+        ]
+        assert {size for size, _digest, _paths in groups} == {14, 30000}
+        assert categorizer.get_file_hash(roots[1] / "sub" / "shared.bin") in {d for _s, d, _p in groups}
+
+def test_overlapping_roots_do_not_duplicate_a_file_with_itself():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir) / "data"
+        (root / "alice").mkdir(parents=True)
+        (root / "alice" / "only.bin").write_bytes(os.urandom(5000))
+        shared = os.urandom(7000)
+        (root / "alice" / "copy.bin").write_bytes(shared)
+        (root / "copy.bin").write_bytes(shared)
+
+        categorizer = FileCategorizer({'Documents': ['pdf']})
+        shards = [Path(tmp_dir) / "data.shard", Path(tmp_dir) / "alice.shard"]
+        categorizer.write_shard(root, shards[0])
+        categorizer.write_shard(root / "alice", shards[1])
+
+        groups = list(merge_shards(shards))
+        assert [sorted(paths) for _size, _digest, paths in groups] == [
+            [root / "alice" / "copy.bin", root / "copy.bin"]]
+
+def test_writer_spills_sorted_runs():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        shard_path = Path(tmp_dir) / "big.shard"
+        writer = ShardWriter(shard_path, "md5", Path(tmp_dir), run_records=7)
+        for i in range(50):
+            writer.add(i % 5, bytes(15) + bytes([i % 3]), Path(tmp_dir) / f"file{i}")
+        writer.close()
+        with ShardReader(shard_path) as reader:
+            records = list(reader)
+            assert len(records) == 50 and records == sorted(records)
+            assert reader.path(records[0][2]).name == "file0"
+        groups = list(merge_shards([shard_path]))
+        assert len(groups) == 15
+        assert sum(len(paths) for _size, _digest, paths in groups) == 50
@@ -0,0 +1,75 @@
+import math
+import pytest
+import random
+import tempfile
+from pathlib import Path
+from organizer.categorizer import FileCategorizer
+from organizer import similar
+from organizer.similar import HammingIndex, group_similar, hamming
+from organizer.snapshot import DirectorySnapshot
+
+def _picture(Image, fx, fy):
+    """A smooth synthetic grayscale picture"""
+    image = Image.new("L", (64, 64))
+    image.putdata([int(127 + 100 * math.sin(x / fx) * math.cos(y / fy))
+                   for y in range(64) for x in range(64)])
+    return image
+
+def test_index_finds_exactly_the_hashes_within_distance():
+    rng = random.Random(7)
+    values = [rng.getrandbits(64) for _ in range(300)]
+    # Near copies at every distance up to 9 bits
+    for distance in range(10):
+        bits = rng.sample(range(64), distance)
+        values.append(values[distance] ^ sum(1 << bit for bit in bits))
+    index = HammingIndex(max_distance=6)
+    for value in values:
+        index.add(value)
+    for query in values[:10] + values[-10:]:
+        expected = sorted((v, hamming(query, v)) for v in set(values) if hamming(query, v) <= 6)
+        assert sorted(index.search(query)) == expected
+
+def test_groups_are_transitive():
+    a, b, c, far = 0, 0b111, 0b111111, (1 << 64) - 1
+    paths = {name: Path(name) for name in ("a.jpg", "a_copy.jpg", "b.jpg", "c.jpg", "far.jpg")}
+    groups = group_similar([(paths["a.jpg"], a), (paths["a_copy.jpg"], a), (paths["b.jpg"], b),
+                            (paths["c.jpg"], c), (paths["far.jpg"], far)], max_distance=3)
+    assert len(groups) == 1
+    assert sorted(p.name for p in groups[0].paths) == ["a.jpg", "a_copy.jpg", "b.jpg", "c.jpg"]
+    assert groups[0].distance == 3
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_phash_dct_matches_the_direct_sum(monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(similar, "numpy", None)
+    rng = random.Random(7)
+    pixels = bytes(rng.randrange(256) for _ in range(1024))
+    coeffs = [sum(math.cos((2 * y + 1) * v * math.pi / 64) * math.cos((2 * x + 1) * u * math.pi / 64)
+                  * pixels[y * 32 + x] for y in range(32) for x in range(32))
+              for v in range(8) for u in range(8)]
+    median = sorted(coeffs[1:])[31]
+    expected = int("".join("1" if coeff > median else "0" for coeff in coeffs), 2)
+    assert similar._dct_hash(pixels) == expected
+
+def test_resized_copy_is_found_and_hashes_are_cached():
+    Image = pytest.importorskip("PIL.Image")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir) / "pictures"
+        root.mkdir()
+        photo = _picture(Image, 9, 13)
+        photo.save(root / "photo.png")
+        photo.resize((200, 200)).convert("RGB").save(root / "photo_large.jpg", quality=80)
+        _picture(Image, 5, 3).save(root / "other.png")
+        (root / "notes.txt").write_text("not an image")
+
+        categorizer = FileCategorizer({'Images': ['png', 'jpg'], 'Documents': ['txt']})
+        for method in ("dhash", "phash"):
+            snapshot = DirectorySnapshot(Path(tmp_dir) / f"{method}.db", method)
+            groups = categorizer.find_similar_images(root, snapshot, method)
+            assert [sorted(p.name for p in g.paths) for g in groups] == [["photo.png", "photo_large.jpg"]]
+            assert categorizer.last_scan_stats['images'] == {'files': 3, 'cached': 0, 'failed': 0}
+
+            assert len(categorizer.find_similar_images(root, snapshot, method)) == 1
+            assert categorizer.last_scan_stats['images']['cached'] == 3
@@ -0,0 +1,119 @@
+import os
+import pytest
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from organizer.categorizer import FileCategorizer
+from organizer import snapshot as snapshot_module
+from organizer.mover import FileMover
+from organizer.snapshot import DirectorySnapshot
+from organizer.watcher import FileWatcher
+
+def _age(*paths):
+    """Backdate mtimes so directory listings are trusted"""
+    past = time.time() - 3600
+    for path in paths:
+        os.utime(path, (past, past))
+
+def test_unchanged_directories_are_not_listed_again():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir) / "tree"
+        (root / "sub").mkdir(parents=True)
+        (root / "a.txt").write_text("a")
+        (root / "sub" / "b.txt").write_text("b")
+        _age(root, root / "sub")
+        db_path = Path(tmp_dir) / "snapshot.db"
+
+        snapshot = DirectorySnapshot(db_path)
+        first = {path.name: changed for path, _stat, changed in snapshot.walk(root)}
+        assert first == {"a.txt": True, "b.txt": True}
+        snapshot.save()
+        snapshot.close()
+
+        (root / "sub" / "b.txt").write_text("changed contents")
+        snapshot = DirectorySnapshot(db_path)
+        second = {path.name: changed for path, _stat, changed in snapshot.walk(root)}
+        assert second == {"a.txt": False, "b.txt": True}
+        assert (snapshot.dirs_listed, snapshot.dirs_skipped) == (0, 2)
+
+        (root / "a.txt").unlink()
+        (root / "c.txt").write_text("c")
+        third = {path.name: changed for path, _stat, changed in snapshot.walk(root)}
+        assert third == {"b.txt": False, "c.txt": True}
+        assert snapshot.dirs_listed == 1
+
+def test_duplicate_scan_reuses_digests():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir) / "tree"
+        root.mkdir()
+        content = os.urandom(20000)
+        for name in ("one.bin", "two.bin", "three.bin"):
+            (root / name).write_bytes(content)
+        db_path = Path(tmp_dir) / "snapshot.db"
+        categorizer = FileCategorizer({'Documents': ['pdf']})
+
+        snapshot = DirectorySnapshot(db_path, categorizer.hash_algorithm)
+        duplicates = categorizer.find_duplicates_in_directory(root, snapshot)
+        assert len(duplicates) == 1 and len(duplicates[0]) == 3
+        assert categorizer.last_scan_stats['full']['bytes_read'] == 3 * 20000
+
+        snapshot = DirectorySnapshot(db_path, categorizer.hash_algorithm)
+        assert len(categorizer.find_duplicates_in_directory(root, snapshot)[0]) == 3
+        stats = categorizer.last_scan_stats
+        assert stats['partial']['bytes_read'] == stats['full']['bytes_read'] == 0
+        assert stats['full']['cached'] == 3
+
+        # A changed file is hashed again; a new algorithm invalidates everything
+        (root / "three.bin").write_bytes(os.urandom(20000))
+        duplicates = categorizer.find_duplicates_in_directory(root, snapshot)
+        assert sorted(p.name for p in duplicates[0]) == ["one.bin", "two.bin"]
+        assert categorizer.last_scan_stats['partial']['cached'] == 2
+        snapshot = DirectorySnapshot(db_path, "sha256")
+        assert snapshot.get(root / "one.bin", (root / "one.bin").stat()).digest is None
+
+def test_watcher_catches_up_on_missed_files():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir = Path(tmp_dir) / "source"
+        source_dir.mkdir()
+        (source_dir / "kept.xyz").write_text("left behind")
+        snapshot = DirectorySnapshot(Path(tmp_dir) / "snapshot.db")
+        watcher = FileWatcher(source_dir, FileCategorizer({'Documents': ['pdf']}),
+                              FileMover(Path(tmp_dir) / "target"), settle_time=60,
+                              snapshot=snapshot)
+        watcher.event_handler.queue.start()
+
+        # First run: nothing to compare against, so nothing is queued
+        assert watcher.catch_up() == 0
+        snapshot.save()
+
+        (source_dir / "arrived.pdf").write_text("downloaded while down")
+        assert watcher.catch_up() == 1
+        assert watcher.event_handler.queue.pending_paths() == [source_dir / "arrived.pdf"]
+        watcher.event_handler.queue.stop()
+
+def test_big_scans_write_changes_as_they_go(monkeypatch):
+    monkeypatch.setattr(snapshot_module, 'FLUSH_EVERY', 3)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir) / "tree"
+        (root / "sub").mkdir(parents=True)
+        for i in range(4):
+            (root / f"{i}.txt").write_text(str(i))
+            (root / "sub" / f"{i}.txt").write_text(str(i))
+        _age(root, root / "sub")
+        db_path = Path(tmp_dir) / "snapshot.db"
+
+        snapshot = DirectorySnapshot(db_path)
+        assert all(changed for _path, _stat, changed in snapshot.walk(root))
+        # Most of the scan is already on disk; only the last few changes are held
+        assert len(snapshot._files) + len(snapshot._dirs) < 3
+        snapshot.save()
+        snapshot.close()
+
+        shutil.rmtree(root / "sub")
+        snapshot = DirectorySnapshot(db_path)
+        assert snapshot.has_root(root)
+        assert not any(changed for _path, _stat, changed in snapshot.walk(root))
+        snapshot.save()
+        assert snapshot._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0] == 4
+        assert snapshot._conn.execute("SELECT COUNT(*) FROM dirs").fetchone()[0] == 1
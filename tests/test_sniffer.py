@@ -0,0 +1,48 @@
+import pytest
+import tempfile
+from pathlib import Path
+from organizer.categorizer import FileCategorizer
+from organizer.sniffer import MagicDetector
+
+def test_detect_bytes():
+    detector = MagicDetector()
+    
+    assert detector.detect_bytes(b"%PDF-1.7\n...") == "pdf"
+    assert detector.detect_bytes(b"\x89PNG\r\n\x1a\n\x00\x00") == "png"
+    assert detector.detect_bytes(b"PK\x03\x04\x14\x00word/document.xml") == "docx"
+    assert detector.detect_bytes(b"\x00\x00\x00\x18ftypqt  \x00") == "mov"
+    assert detector.detect_bytes(b"RIFF\x00\x00\x00\x00WAVEfmt ") == "wav"
+    assert detector.detect_bytes(b"BMlist.txt".ljust(257, b"\x00") + b"ustar\x0000") == "tar"
+    assert detector.detect_bytes(b"hello world") is None
+    # Two-byte signatures need the rest of their header to agree
+    bmp = b"BM" + (70).to_bytes(4, "little") + b"\x00" * 4 + (54).to_bytes(4, "little") \
+        + (40).to_bytes(4, "little") + b"\x00" * 52
+    assert detector.detect_bytes(bmp, 70) == "bmp"
+    assert detector.detect_bytes(bmp, 71) is None
+    assert detector.detect_bytes(b"BMW service notes: oil change at 30000 km\n") is None
+    exe = b"MZ".ljust(0x3C, b"\x90") + (0x80).to_bytes(4, "little")
+    assert detector.detect_bytes(exe.ljust(0x80, b"\x00") + b"PE\x00\x00\x4c\x01") == "exe"
+    assert detector.detect_bytes(b"MZ-2 shopping list: eggs, milk, bread, coffee, tea, rice, apples\n") is None
+    assert detector.detect_bytes(b"") is None
+
+def test_categorizer_sniffs_only_on_extension_miss():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        disguised = Path(tmp_dir) / "download"
+        disguised.write_bytes(b"%PDF-1.4\n" + b"x" * 100_000)
+        wrong_ext = Path(tmp_dir) / "photo.php"
+        wrong_ext.write_bytes(b"\xff\xd8\xff\xe0" + b"\x00" * 100)
+        real_pdf = Path(tmp_dir) / "real.pdf"
+        real_pdf.write_bytes(b"not really a pdf")
+        
+        detector = MagicDetector(cache_size=2)
+        categorizer = FileCategorizer({'Documents': ['pdf'], 'Images': ['jpg'], 'Others': []},
+                                      detector=detector)
+        
+        assert categorizer.categorize_file(disguised) == 'Documents'
+        assert categorizer.categorize_file(wrong_ext) == 'Images'
+        assert categorizer.categorize_file(real_pdf) == 'Documents'
+        assert detector.misses == 2
+        
+        assert categorizer.categorize_file(disguised) == 'Documents'
+        assert detector.hits == 1
+        assert FileCategorizer({'Documents': ['pdf']}).categorize_file(disguised) == 'Others'
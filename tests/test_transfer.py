@@ -0,0 +1,67 @@
+import pytest
+import errno
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from organizer.categorizer import FileCategorizer
+from organizer.index import DuplicateIndex
+from organizer.mover import FileMover
+from organizer.transfer import copy_and_hash
+
+def test_copy_and_hash():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data = os.urandom(3 * 1024 * 1024 + 17)
+        source = Path(tmp_dir) / "source.bin"
+        source.write_bytes(data)
+        
+        hashed_target = Path(tmp_dir) / "hashed.bin"
+        digest = copy_and_hash(source, hashed_target, "blake2b", verify=True)
+        assert digest == hashlib.blake2b(data).hexdigest()
+        assert hashed_target.read_bytes() == data
+        
+        # Without an algorithm the kernel copy path is used and no digest returned
+        plain_target = Path(tmp_dir) / "plain.bin"
+        assert copy_and_hash(source, plain_target) is None
+        assert plain_target.read_bytes() == data
+        assert source.stat().st_mtime == pytest.approx(plain_target.stat().st_mtime)
+        
+        assert sorted(p.name for p in Path(tmp_dir).iterdir()) == [
+            "hashed.bin", "plain.bin", "source.bin"]
+
+def test_cross_device_move_records_digest(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = Path(tmp_dir) / "source" / "test.txt"
+        source.parent.mkdir()
+        source.write_text("Test content")
+        target_dir = Path(tmp_dir) / "target"
+        
+        real_replace = os.replace
+        def fake_replace(src, dst):
+            if Path(src) == source:
+                raise OSError(errno.EXDEV, "Invalid cross-device link")
+            return real_replace(src, dst)
+        def fake_link(src, dst, **kwargs):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        monkeypatch.setattr(os, "replace", fake_replace)
+        monkeypatch.setattr(os, "link", fake_link)
+        
+        hashed = []
+        categorizer = FileCategorizer({})
+        def hash_func(path):
+            hashed.append(path)
+            return categorizer.get_file_hash(path)
+        index = DuplicateIndex.for_target(target_dir, hash_func, "blake2b")
+        mover = FileMover(target_dir, index=index, verify_copies=True)
+        
+        success, final_path = mover.move_file(source, "Documents")
+        assert success
+        assert not source.exists()
+        assert final_path.read_text() == "Test content"
+        
+        incoming = Path(tmp_dir) / "again.txt"
+        incoming.write_text("Test content")
+        assert index.find_duplicate(incoming) == final_path
+        # Only the incoming file was hashed; the moved file's digest came from the copy
+        assert hashed == [incoming]
+        index.close()